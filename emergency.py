@@ -0,0 +1,146 @@
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# =========================
+# CONFIG
+# =========================
+
+EMERGENCY_EVAL_EVERY = 5      # re-check a track's colours at most every K frames
+EMERGENCY_ROI_SIZE = 256      # ROIs up to this side are checked at full resolution
+EMERGENCY_VOTES = 5           # votes kept per track
+EMERGENCY_MIN_VOTES = 3       # positive votes needed to label a track
+EMERGENCY_TRACK_TTL = 30      # frames a lost track's cache survives
+
+# =========================
+# COLOUR CHECK
+# =========================
+
+def is_emergency_vehicle(frame, box, roi_size=EMERGENCY_ROI_SIZE):
+    x1, y1, x2, y2 = box
+    roi = frame[y1:y2, x1:x2]
+
+    if roi.size == 0:
+        return False
+
+    # Large ROIs are subsampled on a pixel grid: every kept pixel keeps its own
+    # colour, so the ratios stay unbiased. Averaging (INTER_AREA) would wash
+    # small saturated light bars into the body and miss distant vehicles.
+    step = -(-max(roi.shape[:2]) // roi_size)
+    if step > 1:
+        roi = roi[::step, ::step]
+
+    hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+
+    # Red
+    red1 = cv2.inRange(hsv, (0, 90, 60), (10, 255, 255))
+    red2 = cv2.inRange(hsv, (170, 90, 60), (180, 255, 255))
+    red_mask = red1 + red2
+
+    # Blue
+    blue_mask = cv2.inRange(hsv, (95, 80, 50), (140, 255, 255))
+
+    # White (ambulance body cue)
+    white_mask = cv2.inRange(hsv, (0, 0, 200), (180, 40, 255))
+
+    red_ratio = red_mask.mean() / 255.0
+    blue_ratio = blue_mask.mean() / 255.0
+    white_ratio = white_mask.mean() / 255.0
+
+    return (
+        red_ratio > 0.010 or
+        blue_ratio > 0.010 or
+        (white_ratio > 0.25 and (red_ratio + blue_ratio) > 0.005)
+    )
+
+# =========================
+# PER-TRACK CACHE
+# =========================
+
+class EmergencyClassifier:
+    """
+    Caches the colour check per track id and labels a track by majority
+    vote over its recent checks, so a vehicle does not flicker between
+    EMERGENCY and its class from one frame to the next.
+    """
+
+    def __init__(
+        self,
+        eval_every=EMERGENCY_EVAL_EVERY,
+        votes=EMERGENCY_VOTES,
+        min_votes=EMERGENCY_MIN_VOTES,
+        ttl=EMERGENCY_TRACK_TTL,
+    ):
+        self.eval_every = eval_every
+        self.votes = votes
+        self.min_votes = min(min_votes, votes)
+        self.ttl = ttl
+        self.tracks = {}   # track_id -> {"votes", "last_eval", "last_seen"}
+        self.frame_idx = 0
+
+    def next_frame(self):
+        self.frame_idx += 1
+        # Sweep lost tracks once per TTL window rather than every frame
+        if self.frame_idx % self.ttl == 0:
+            cutoff = self.frame_idx - self.ttl
+            for tid in [t for t, s in self.tracks.items() if s["last_seen"] < cutoff]:
+                del self.tracks[tid]
+
+    def classify(self, frame, box, track_id=None):
+        if track_id is None:
+            return is_emergency_vehicle(frame, box)
+
+        state = self.tracks.get(track_id)
+        if state is None:
+            state = {"votes": deque(maxlen=self.votes), "last_eval": None, "last_seen": 0}
+            self.tracks[track_id] = state
+        state["last_seen"] = self.frame_idx
+
+        if state["last_eval"] is None or self.frame_idx - state["last_eval"] >= self.eval_every:
+            state["votes"].append(is_emergency_vehicle(frame, box))
+            state["last_eval"] = self.frame_idx
+
+        # No label until the track has min_votes checks behind it
+        votes = state["votes"]
+        return len(votes) >= self.min_votes and sum(votes) >= self.min_votes
+
+    def reset(self):
+        self.tracks.clear()
+        self.frame_idx = 0
+
+# =========================
+# BENCHMARK
+# =========================
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    h, w = 720, 1280
+    frame = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+    frames = 60
+
+    print(f"{'vehicles':>8} | {'per-frame (ms)':>14} | {'cached (ms)':>11} | speedup")
+    for n in (1, 10, 50, 100, 200):
+        boxes = []
+        for _ in range(n):
+            bw, bh = int(rng.integers(80, 260)), int(rng.integers(60, 200))
+            x1, y1 = int(rng.integers(0, w - bw)), int(rng.integers(0, h - bh))
+            boxes.append((x1, y1, x1 + bw, y1 + bh))
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            for box in boxes:
+                roi_size = max(box[2] - box[0], box[3] - box[1])
+                is_emergency_vehicle(frame, box, roi_size=roi_size)
+        baseline = (time.perf_counter() - start) / frames * 1000
+
+        clf = EmergencyClassifier()
+        start = time.perf_counter()
+        for _ in range(frames):
+            clf.next_frame()
+            for tid, box in enumerate(boxes):
+                clf.classify(frame, box, tid)
+        cached = (time.perf_counter() - start) / frames * 1000
+
+        print(f"{n:>8} | {baseline:>14.2f} | {cached:>11.2f} | {baseline / cached:.1f}x")
@@ -9,9 +9,25 @@ import numpy as np
 import yt_dlp
 import uuid
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 
+# Probe results are cached per source; concurrent probes of one URL share a single run
+PROBE_CACHE_TTL = int(os.getenv("PROBE_CACHE_TTL", 600))        # seconds
+PROBE_FAILURE_TTL = 30          # unreadable/slow sources are retried after this
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", 8))            # hard budget per probe, seconds
+PROBE_FRAMES = int(os.getenv("PROBE_FRAMES", 4))                # frames sampled per probe
+PROBE_LIVE_STRIDE = 15          # frames skipped between samples on live sources
+probe_cache = {}        # source url -> (expires_at, response)
+probe_inflight = {}     # source url -> asyncio.Task shared by concurrent callers
+probe_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="probe")
+frame_pool = ThreadPoolExecutor(max_workers=PROBE_FRAMES * 4, thread_name_prefix="probe-frame")
+probe_model_lock = threading.Lock()     # one predictor, not thread-safe
+
 app = FastAPI()
 try:
     print("⏳ Loading Probe Model (Mark-3)...")
@@ -37,7 +53,7 @@ def get_stream_url(url):
         return url 
     
     try:
-        ydl_opts = {'format': 'best[ext=mp4]', 'quiet': True}
+        ydl_opts = {'format': 'best[ext=mp4]', 'quiet': True, 'socket_timeout': PROBE_TIMEOUT}
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
             return info['url']
@@ -45,62 +61,141 @@ def get_stream_url(url):
         print(f"❌ URL Resolution Failed: {e}")
         return None
 
-@app.post("/probe")
-async def probe_view_type(request: Request):
-    """
-    Analyzes ONE frame to decide if the view is AERIAL or GROUND.
-    
-    """
-    if not probe_model:
-        return JSONResponse({"viewType": "GROUND", "reason": "Probe model not loaded"})
+def open_capture(url):
+    """VideoCapture whose open/read give up within the probe budget."""
+    timeout_ms = int(PROBE_TIMEOUT * 1000)
+    return cv2.VideoCapture(url, cv2.CAP_FFMPEG, [
+        cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms
+    ])
+
 
+def read_frame(url, position, total):
+    """One frame at `position`/PROBE_FRAMES of the source."""
+    cap = open_capture(url)
     try:
-        body = await request.json()
-        source_url = body.get("sourceUrl")
-        print(f"🕵️ Probing Source: {source_url}")
+        cap.set(cv2.CAP_PROP_POS_FRAMES, position * total // PROBE_FRAMES)
+        ret, frame = cap.read()
+        return frame if ret else None
+    finally:
+        cap.release()
 
-       
-        real_url = get_stream_url(source_url)
-        if not real_url:
-            return JSONResponse({"viewType": "GROUND", "reason": "Could not resolve URL"})
 
-        
-        cap = cv2.VideoCapture(real_url)
+def read_live_frames(cap):
+    """PROBE_FRAMES frames PROBE_LIVE_STRIDE apart from one open capture."""
+    frames = []
+    for i in range(PROBE_FRAMES):
+        if i and not all(cap.grab() for _ in range(PROBE_LIVE_STRIDE)):
+            break
         ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    return frames
+
+
+def run_probe(real_url):
+    """
+    Samples PROBE_FRAMES frames of a resolved source and decides if the view
+    is AERIAL or GROUND. Returns (response, ttl): failures are cached only briefly.
+    """
+    cap = open_capture(real_url)
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        if total <= PROBE_FRAMES:
+            # Live sources cannot seek: sample them over one connection
+            frames = read_live_frames(cap) if cap.isOpened() else []
+    finally:
         cap.release()
+    if total > PROBE_FRAMES:
+        # Files: frames spread over their length, read in parallel
+        frames = [f for f in frame_pool.map(lambda i: read_frame(real_url, i, total), range(PROBE_FRAMES))
+                  if f is not None]
+    if not frames:
+        return {"viewType": "GROUND", "reason": "Stream offline or unreadable"}, PROBE_FAILURE_TTL
 
-        if not ret:
-            return JSONResponse({"viewType": "GROUND", "reason": "Stream offline or unreadable"})
+    with probe_model_lock:
+        results = probe_model(frames, imgsz=640, verbose=False)
+    boxes = np.concatenate([r.boxes.xywhn.cpu().numpy() for r in results])
 
-        
-        results = probe_model(frame, imgsz=640, verbose=False)[0]
-        
-       
-        boxes = results.boxes.xywhn.cpu().numpy() 
-        
-        if len(boxes) == 0:
-            return JSONResponse({"viewType": "GROUND", "reason": "No objects detected"})
+    if len(boxes) == 0:
+        return {"viewType": "GROUND", "reason": "No objects detected", "frames": len(frames)}, PROBE_CACHE_TTL
 
-        
-        areas = boxes[:, 2] * boxes[:, 3] 
-        avg_area = np.mean(areas)
-        
-        print(f"📊 Probe Result: Avg Object Area = {avg_area:.5f}")
+    areas = boxes[:, 2] * boxes[:, 3]
+    avg_area = np.mean(areas)
 
-        if avg_area < 0.008: 
-            return JSONResponse({
-                "viewType": "AERIAL", 
-                "reason": f"Detected small objects (Scale: {avg_area:.4f}) indicating High Altitude."
-            })
-        else:
-            return JSONResponse({
-                "viewType": "GROUND", 
-                "reason": f"Detected large objects (Scale: {avg_area:.4f}) indicating Street Level."
-            })
+    print(f"📊 Probe Result: Avg Object Area = {avg_area:.5f} ({len(boxes)} objects, {len(frames)} frames)")
+
+    if avg_area < 0.008:
+        response = {
+            "viewType": "AERIAL",
+            "reason": f"Detected small objects (Scale: {avg_area:.4f}) indicating High Altitude."
+        }
+    else:
+        response = {
+            "viewType": "GROUND",
+            "reason": f"Detected large objects (Scale: {avg_area:.4f}) indicating Street Level."
+        }
+    response["frames"] = len(frames)
+    return response, PROBE_CACHE_TTL
 
+
+async def probe_within_budget(source_url):
+    """Runs the probe off the event loop; a source that overruns PROBE_TIMEOUT gets the safe default."""
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        # yt-dlp's socket_timeout bounds each request, not the whole extraction
+        real_url = await asyncio.wait_for(loop.run_in_executor(probe_pool, get_stream_url, source_url),
+                                          PROBE_TIMEOUT)
+        if not real_url:
+            response, ttl = {"viewType": "GROUND", "reason": "Could not resolve URL"}, PROBE_FAILURE_TTL
+        else:
+            remaining = PROBE_TIMEOUT - (time.perf_counter() - started)
+            response, ttl = await asyncio.wait_for(loop.run_in_executor(probe_pool, run_probe, real_url),
+                                                   max(remaining, 0))
+    except asyncio.TimeoutError:
+        print(f"⏱️ Probe timed out after {PROBE_TIMEOUT}s: {source_url}")
+        response, ttl = {"viewType": "GROUND",
+                         "reason": f"Probe exceeded {PROBE_TIMEOUT:g}s, defaulting to safe mode."}, PROBE_FAILURE_TTL
     except Exception as e:
         print(f"❌ Probe Error: {e}")
-        return JSONResponse({"viewType": "GROUND", "reason": "Probe failed, defaulting to safe mode."})
+        response, ttl = {"viewType": "GROUND", "reason": "Probe failed, defaulting to safe mode."}, PROBE_FAILURE_TTL
+    response["probe_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    now = time.time()
+    for url in [u for u, (expires, _) in probe_cache.items() if expires <= now]:
+        del probe_cache[url]
+    probe_cache[source_url] = (now + ttl, response)
+    return response
+
+
+@app.post("/probe")
+async def probe_view_type(request: Request):
+    """
+    Samples several frames to decide if the view is AERIAL or GROUND.
+    Cached per source for PROBE_CACHE_TTL; send {"refresh": true} to re-probe.
+    """
+    if not probe_model:
+        return JSONResponse({"viewType": "GROUND", "reason": "Probe model not loaded"})
+
+    body = await request.json()
+    source_url = body.get("sourceUrl")
+    if not source_url:
+        return JSONResponse({"viewType": "GROUND", "reason": "No sourceUrl"})
+
+    cached = probe_cache.get(source_url)
+    if cached and cached[0] > time.time() and not body.get("refresh"):
+        return JSONResponse({**cached[1], "cached": True})
+
+    print(f"🕵️ Probing Source: {source_url}")
+    task = probe_inflight.get(source_url)
+    if task is None:
+        task = asyncio.create_task(probe_within_budget(source_url))
+        probe_inflight[source_url] = task
+        task.add_done_callback(lambda _: probe_inflight.pop(source_url, None))
+    # Shielded: a client hanging up must not cancel the probe other callers wait on
+    response = await asyncio.shield(task)
+    return JSONResponse({**response, "cached": False})
 @app.get("/gpu/status")
 def gpu_status():
     status = {
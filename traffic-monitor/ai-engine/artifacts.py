@@ -0,0 +1,199 @@
+# artifacts.py
+# Compiled model artifacts for CPU runtimes.
+#
+# Weights are exported once per (weights digest, runtime, imgsz, batch) and
+# cached under CACHE_PATH/compiled, so nodes pay the export cost on first
+# use only. Exported models are loaded through ultralytics as well, which
+# keeps letterboxing, NMS and Results identical to the PyTorch path.
+# MODEL_RUNTIME picks the backend per deployment. INT8 variants built by
+# quantize.py are listed in CACHE_PATH/quantized.json and registered next
+# to the FP32 models.
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from functools import lru_cache
+
+from ultralytics import YOLO
+
+# pytorch | torchscript | onnx | openvino
+MODEL_RUNTIME = os.getenv("MODEL_RUNTIME", "pytorch")
+MODEL_BATCH = int(os.getenv("MODEL_BATCH", 1))      # batch the artifacts are exported for
+# runtime -> (ultralytics export format, artifact suffix); OpenVINO exports a directory
+RUNTIMES = {
+    "torchscript": ("torchscript", ".torchscript"),
+    "onnx": ("onnx", ".onnx"),
+    "openvino": ("openvino", "_openvino_model"),
+}
+QUANTIZED_REGISTRY = "quantized.json"   # weights stem -> INT8 artifact + accuracy/latency report
+_export_lock = threading.Lock()
+
+
+@lru_cache(maxsize=32)
+def _file_digest(path, size, mtime):
+    h = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def weights_digest(path):
+    """Content digest of a weights file, cached per (size, mtime)."""
+    st = os.stat(path)
+    return _file_digest(path, st.st_size, st.st_mtime_ns)
+
+
+def artifact_path(weights, runtime, imgsz, batch=MODEL_BATCH, cache_dir=None, int8=False):
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(weights)), "compiled")
+    precision = "-int8" if int8 else ""
+    name = f"{stem}-{weights_digest(weights)}-{imgsz}-b{batch}{precision}{RUNTIMES[runtime][1]}"
+    return os.path.join(cache_dir, name)
+
+
+def compile_model(weights, runtime, imgsz, batch=MODEL_BATCH, cache_dir=None, int8=False, data=None):
+    """
+    Path of the cached artifact, exporting it first if needed. With `int8`,
+    `data` is the dataset YAML whose images calibrate the quantisation.
+    """
+    target = artifact_path(weights, runtime, imgsz, batch, cache_dir, int8)
+    if os.path.exists(target):
+        return target
+    with _export_lock:
+        if os.path.exists(target):
+            return target
+        fmt = RUNTIMES[runtime][0]
+        print(f"   🛠️ [COMPILE] Exporting {os.path.basename(weights)} → {fmt}{' INT8' if int8 else ''} "
+              f"({imgsz}px, batch {batch})...")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Export from a private copy: ultralytics writes next to the weights
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(target)) as tmp:
+            local = os.path.join(tmp, os.path.basename(weights))
+            shutil.copy2(weights, local)
+            extra = {"int8": True, "data": data} if int8 else {}
+            exported = YOLO(local, task="detect").export(
+                format=fmt, imgsz=imgsz, batch=batch, dynamic=batch > 1, verbose=False, **extra
+            )
+            os.replace(exported, target)
+        print(f"   ✅ [COMPILE] Cached {os.path.basename(target)}")
+        return target
+
+
+def load_model(weights, runtime=MODEL_RUNTIME, imgsz=640, batch=MODEL_BATCH, cache_dir=None):
+    """
+    YOLO model for `weights` on the given runtime. Falls back to eager
+    PyTorch if the export fails, so a missing toolchain never stops a node.
+    """
+    if runtime == "pytorch" or not weights.endswith(".pt"):
+        return YOLO(weights, task="detect")
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown MODEL_RUNTIME {runtime!r}; expected pytorch or one of {sorted(RUNTIMES)}")
+    try:
+        return YOLO(compile_model(weights, runtime, imgsz, batch, cache_dir), task="detect")
+    except Exception as e:
+        print(f"   ⚠️ [COMPILE] {runtime} unavailable for {os.path.basename(weights)} ({e}); using PyTorch")
+        return YOLO(weights, task="detect")
+
+
+def quantized_variants(model_paths, cache_dir):
+    """
+    "<name>-int8" -> {imgsz: artifact path} for every MODEL_PATHS entry that
+    quantize.py has built. The artifacts are static-shape, so each one only
+    serves the imgsz it was exported at.
+    """
+    try:
+        with open(os.path.join(cache_dir, QUANTIZED_REGISTRY)) as f:
+            registry = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    variants = {}
+    for name, path in model_paths.items():
+        sizes = registry.get(os.path.splitext(os.path.basename(path))[0]) or {}
+        built = {int(imgsz): e["path"] for imgsz, e in sizes.items() if os.path.exists(e["path"])}
+        if built:
+            variants[f"{name}-int8"] = built
+    return variants
+
+
+def is_pytorch(model):
+    return getattr(model, "ckpt_path", None) is not None and str(model.ckpt_path).endswith(".pt")
+
+
+def model_runtime(model):
+    """Backend a loaded model actually runs on; load_model may have fallen back to PyTorch."""
+    if is_pytorch(model):
+        return "pytorch"
+    path = str(getattr(model, "ckpt_path", None) or "").rstrip("/")
+    for runtime, (_, suffix) in RUNTIMES.items():
+        if path.endswith(suffix):
+            return runtime
+    return "exported"
+
+
+def batch_limit(model):
+    """
+    Largest batch a model accepts: None for PyTorch, else the batch its
+    artifact was exported for ("-b<n>" in the artifact name, else MODEL_BATCH).
+    """
+    if is_pytorch(model):
+        return None
+    name = os.path.basename(str(getattr(model, "ckpt_path", None) or "").rstrip("/"))
+    match = re.search(r"-b(\d+)(?:-int8)?[._]", name)
+    return int(match.group(1)) if match else MODEL_BATCH
+
+
+# ==========================================
+# BENCHMARK: python artifacts.py [imgsz] [video]
+# CPU frames/sec per mark model and backend, plus max box delta vs PyTorch
+# ==========================================
+if __name__ == "__main__":
+    import sys
+    import glob
+    import time
+    import cv2
+    import numpy as np
+
+    imgsz = int(sys.argv[1]) if len(sys.argv) > 1 else 640
+    video = sys.argv[2] if len(sys.argv) > 2 else None
+    models_dir = os.getenv("MODEL_PATH", "/root/aerial-engine/models")
+    weights_files = sorted(glob.glob(os.path.join(models_dir, "mark*.pt")))
+
+    frames = []
+    if video:
+        cap = cv2.VideoCapture(video)
+        while len(frames) < 30:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(frame)
+        cap.release()
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8) for _ in range(30)]
+
+    print(f"CPU, imgsz={imgsz}, {len(frames)} frames")
+    print(f"{'model':>10} | {'backend':>11} | {'fps':>6} | {'boxes':>5} | max |Δxyxy| vs pytorch")
+    for weights in weights_files:
+        reference = None
+        for runtime in ["pytorch", *RUNTIMES]:
+            try:
+                model = load_model(weights, runtime, imgsz, batch=1) if runtime != "pytorch" \
+                    else YOLO(weights, task="detect")
+            except Exception as e:
+                print(f"{os.path.basename(weights):>10} | {runtime:>11} | failed: {e}")
+                continue
+            model.predict(frames[0], imgsz=imgsz, device="cpu", verbose=False)   # warmup
+            start = time.perf_counter()
+            preds = [model.predict(f, imgsz=imgsz, device="cpu", verbose=False)[0] for f in frames]
+            fps = len(frames) / (time.perf_counter() - start)
+            boxes = [p.boxes.xyxy.cpu().numpy() for p in preds]
+            if reference is None:
+                reference = boxes
+            deltas = [np.abs(a - b).max() for a, b in zip(boxes, reference) if len(a) == len(b) and len(a)]
+            delta = f"{max(deltas):.2f}px" if deltas else "n/a"
+            print(f"{os.path.basename(weights):>10} | {runtime:>11} | {fps:>6.1f} | "
+                  f"{sum(map(len, boxes)):>5} | {delta}")
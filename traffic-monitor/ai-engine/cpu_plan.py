@@ -0,0 +1,172 @@
+# cpu_plan.py
+# Core budgets for concurrent inference engines on CPU hosts.
+#
+# Left alone, every engine's PyTorch and OpenCV pools size themselves to
+# all cores, so N streams run N x cores threads and spend their time
+# context switching. The planner keeps CPU_RESERVED cores for the event
+# loop, decoding and JPEG encoding. It splits the rest into disjoint
+# slices, one per registered engine, and re-plans whenever an engine
+# registers or leaves. Each engine applies its slice from its own thread
+# before inference.
+#
+# Limits:
+# - torch.set_num_threads() is process-wide (it also sizes MKL), so the
+#   engines take turns setting the same value. Slices differ by at most
+#   one core, so that value is still about one slice wide.
+# - With CPU_PIN, sched_setaffinity() pins only the engine's reader
+#   thread. OpenMP pool threads take its mask when they are created and
+#   keep it, so after a re-plan the slices of pinned engines can overlap
+#   until the process restarts. Pinning is therefore off by default and
+#   best suited to a fixed number of streams.
+import os
+import threading
+
+import cv2
+import torch
+
+CPU_PLAN = os.getenv("CPU_PLAN", "auto")            # auto (CPU-only hosts) | on | off
+CPU_PIN = os.getenv("CPU_PIN", "0") == "1"          # pin engine reader threads (see limits above)
+CPU_RESERVED = int(os.getenv("CPU_RESERVED", 1))    # cores kept out of engine budgets
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition(cores, n, reserved=CPU_RESERVED):
+    """`n` core slices: disjoint while there are enough cores, one shared core each beyond that."""
+    if n == 0:
+        return []
+    usable = cores[reserved:] if len(cores) - reserved >= 1 else cores
+    if n >= len(usable):
+        return [[usable[i % len(usable)]] for i in range(n)]
+    per, extra = divmod(len(usable), n)
+    slices, start = [], 0
+    for i in range(n):
+        size = per + (i < extra)
+        slices.append(usable[start:start + size])
+        start += size
+    return slices
+
+
+class CoreBudget:
+    """One engine's slice. `apply()` is cheap and safe to call every frame."""
+
+    def __init__(self, planner, name):
+        self.planner = planner
+        self.name = name
+        self.cores = []
+        self.generation = 0
+        self._applied = {}      # thread id -> generation last applied on it
+
+    def apply(self):
+        tid = threading.get_ident()
+        if self._applied.get(tid) == self.generation:
+            return
+        cores = self.cores
+        torch.set_num_threads(max(1, len(cores)))     # process-wide
+        if self.planner.pin and hasattr(os, "sched_setaffinity"):
+            # pid 0: the calling thread only; existing OpenMP workers keep their mask
+            os.sched_setaffinity(0, cores)
+        self._applied[tid] = self.generation
+
+
+class CorePlanner:
+    """Registry of engines and their core slices; re-plans on every register/unregister."""
+
+    def __init__(self, cores=None, reserved=CPU_RESERVED, pin=CPU_PIN, enabled=None):
+        self.cores = cores or available_cores()
+        self.reserved = reserved
+        self.pin = pin
+        if enabled is None:
+            enabled = CPU_PLAN == "on" or (CPU_PLAN == "auto" and not torch.cuda.is_available())
+        self.enabled = enabled
+        self.budgets = {}
+        self.lock = threading.Lock()
+
+    def register(self, name):
+        """Budget for a new engine, or None when planning is disabled."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            budget = self.budgets[name] = CoreBudget(self, name)
+            self._rebalance()
+        return budget
+
+    def unregister(self, name):
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.budgets.pop(name, None) is not None:
+                self._rebalance()
+
+    def _rebalance(self):
+        slices = partition(self.cores, len(self.budgets), self.reserved)
+        for budget, cores in zip(self.budgets.values(), slices):
+            budget.cores = cores
+            budget.generation += 1
+        # OpenCV's pool is process-wide: size it to the smallest slice
+        cv2.setNumThreads(min(map(len, slices)) if slices else -1)
+        if slices:
+            print(f"🧮 [CPU] {len(slices)} engine(s) on {len(self.cores)} cores: "
+                  + ", ".join(f"{n}={len(b.cores)}" for n, b in self.budgets.items()))
+
+    def snapshot(self):
+        return {
+            "enabled": self.enabled, "pin": self.pin, "cores": len(self.cores), "reserved": self.reserved,
+            "engines": {name: b.cores for name, b in self.budgets.items()},
+        }
+
+
+# ==========================================
+# BENCHMARK: python cpu_plan.py <weights.pt> [imgsz] [seconds]
+# Aggregate frames/sec for 1-8 concurrent engines, unplanned vs planned
+# ==========================================
+if __name__ == "__main__":
+    import sys
+    import time
+    import numpy as np
+    from ultralytics import YOLO
+
+    weights = sys.argv[1]
+    imgsz = int(sys.argv[2]) if len(sys.argv) > 2 else 640
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    frame = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+    default_threads = torch.get_num_threads()
+
+    def run(n, planner):
+        models = [YOLO(weights, task="detect") for _ in range(n)]
+        counts = [0] * n
+        stop = time.perf_counter() + seconds
+
+        def worker(i):
+            budget = planner.register(f"engine-{i}") if planner else None
+            if budget is None:
+                torch.set_num_threads(default_threads)
+            models[i].predict(frame, imgsz=imgsz, device="cpu", verbose=False)     # warmup
+            while time.perf_counter() < stop:
+                if budget:
+                    budget.apply()
+                models[i].predict(frame, imgsz=imgsz, device="cpu", verbose=False)
+                counts[i] += 1
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if planner:
+            for i in range(n):
+                planner.unregister(f"engine-{i}")
+        return sum(counts) / seconds
+
+    print(f"{len(available_cores())} cores, imgsz={imgsz}, {seconds:.0f}s per run")
+    print(f"{'streams':>7} | {'unplanned fps':>13} | {'planned fps':>11} | {'pinned fps':>10}")
+    for n in range(1, 9):
+        base = run(n, None)
+        planned = run(n, CorePlanner(enabled=True, pin=False))
+        pinned = run(n, CorePlanner(enabled=True, pin=True))
+        cv2.setNumThreads(-1)
+        print(f"{n:>7} | {base:>13.1f} | {planned:>11.1f} | {pinned:>10.1f}")
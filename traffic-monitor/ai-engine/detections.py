@@ -0,0 +1,130 @@
+# detections.py
+# Host-side detection results.
+#
+# Each inference result is copied off the device exactly once: the packed
+# boxes.data tensor (x1, y1, x2, y2, [track id], conf, cls) comes over in
+# a single transfer and is split into contiguous NumPy arrays. Rendering,
+# analytics, heatmaps/zones and JSON serialisation all read from that copy,
+# and serialisation rounds and converts whole columns at once.
+import numpy as np
+
+
+class Detections:
+    __slots__ = ("xyxy", "xywh", "conf", "cls", "ids", "names")
+
+    def __init__(self, xyxy, conf, cls, ids=None, names=None):
+        self.xyxy = np.ascontiguousarray(xyxy, dtype=np.float32)
+        self.conf = np.ascontiguousarray(conf, dtype=np.float32)
+        self.cls = np.ascontiguousarray(cls, dtype=np.int64)
+        self.ids = None if ids is None else np.ascontiguousarray(ids, dtype=np.int64)
+        self.names = names or {}
+        x1, y1, x2, y2 = self.xyxy.T
+        self.xywh = np.stack([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], axis=1)
+
+    @classmethod
+    def empty(cls, names=None):
+        return cls(np.empty((0, 4)), np.empty(0), np.empty(0), names=names)
+
+    @classmethod
+    def from_result(cls, result):
+        """One device-to-host copy of an ultralytics Results' boxes."""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls.empty(result.names)
+        data = boxes.data.cpu().numpy()
+        tracked = data.shape[1] == 7
+        return cls(
+            data[:, :4], data[:, -2], data[:, -1],
+            ids=data[:, 4] if tracked else None, names=result.names,
+        )
+
+    def __len__(self):
+        return len(self.conf)
+
+    @property
+    def centers(self):
+        return self.xywh[:, :2]
+
+    def labels(self):
+        names = self.names
+        return [names.get(c, f"cls_{c}") for c in self.cls.tolist()]
+
+    def overlay_boxes(self):
+        """Boxes in the shape the frontend overlay draws (telemetry + passthrough)."""
+        coords = np.round(self.xyxy.astype(np.float64), 1).tolist()
+        confs = np.round(self.conf.astype(np.float64), 2).tolist()
+        return [
+            {"x1": b[0], "y1": b[1], "x2": b[2], "y2": b[3], "class": label, "conf": c}
+            for b, c, label in zip(coords, confs, self.labels())
+        ]
+
+    def tile_detections(self, scale=1.0):
+        """/analyze detection entries; `scale` maps back to full-resolution tile pixels."""
+        xywh = (self.xywh.astype(np.float64) * scale).tolist()
+        confs = np.round(self.conf.astype(np.float64), 3).tolist()
+        names = self.names
+        return [
+            {
+                "class": names.get(c, f"class_{c}"), "class_id": c,
+                "confidence": conf,
+                "bbox": {"x": b[0], "y": b[1], "w": b[2], "h": b[3]}
+            }
+            for b, conf, c in zip(xywh, confs, self.cls.tolist())
+        ]
+
+
+# ==========================================
+# BENCHMARK: python detections.py
+# ==========================================
+if __name__ == "__main__":
+    import time
+    import torch
+    from ultralytics.engine.results import Results
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    names = {0: "person", 2: "car", 3: "motorcycle", 4: "ambulance", 5: "bus", 7: "truck"}
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    rng = np.random.default_rng(0)
+    reps = 50
+
+    def legacy(result):
+        """Previous post-processing: per-consumer and per-box transfers."""
+        boxes = result.boxes
+        tile = []
+        for box in boxes:
+            x, y, w, h = box.xywh[0].cpu().numpy()
+            cls = int(box.cls[0].cpu().numpy())
+            conf = float(box.conf[0].cpu().numpy())
+            tile.append({"class": names.get(cls, f"class_{cls}"), "class_id": cls, "confidence": round(conf, 3),
+                         "bbox": {"x": float(x), "y": float(y), "w": float(w), "h": float(h)}})
+        render = (boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.int().cpu().numpy())
+        analytics = (boxes.xywh.cpu().numpy(), boxes.id.int().cpu().numpy(), boxes.cls.int().cpu().numpy())
+        overlay = [
+            {"x1": round(float(b[0]), 1), "y1": round(float(b[1]), 1),
+             "x2": round(float(b[2]), 1), "y2": round(float(b[3]), 1),
+             "class": names.get(int(cl), f"cls_{cl}"), "conf": round(float(c), 2)}
+            for b, c, cl in zip(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.int().cpu().numpy())
+        ]
+        return tile, render, analytics, overlay
+
+    def shared(result):
+        dets = Detections.from_result(result)
+        return dets.tile_detections(), (dets.xyxy, dets.conf, dets.cls), (dets.xywh, dets.ids, dets.cls), \
+            dets.overlay_boxes()
+
+    print(f"device={device}")
+    print(f"{'boxes':>5} | {'per-box (ms)':>12} | {'single copy (ms)':>16}")
+    for n in (1, 10, 30, 100, 300):
+        xy = rng.uniform(0, [1200, 680], (n, 2))
+        wh = rng.uniform(15, 60, (n, 2))
+        data = np.hstack([xy, xy + wh, np.arange(n)[:, None], rng.uniform(0.25, 1, (n, 1)),
+                          rng.choice([2, 3, 4, 5, 7], (n, 1))])
+        result = Results(frame, path="", names=names, boxes=torch.tensor(data, dtype=torch.float32, device=device))
+        timings = []
+        for fn in (legacy, shared):
+            fn(result)
+            start = time.perf_counter()
+            for _ in range(reps):
+                fn(result)
+            timings.append((time.perf_counter() - start) / reps * 1000)
+        print(f"{n:>5} | {timings[0]:>12.2f} | {timings[1]:>16.2f}")
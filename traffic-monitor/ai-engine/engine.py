@@ -3,7 +3,9 @@
 # Optimised for NVIDIA T4 (16GB VRAM, 50GB RAM)
 # ==========================================
 import os
+import sys
 import time
+BOOT_STARTED = time.time()   # before the heavy imports, for cold-start timing
 import json
 import base64
 import threading
@@ -12,16 +14,28 @@ import torch
 import numpy as np
 import uvicorn
 import asyncio
-import redis
-import yt_dlp
-from collections import defaultdict
+import redis.asyncio as aioredis
+from collections import defaultdict, OrderedDict
 from datetime import datetime
-from ultralytics import YOLO
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
+from zones import ZoneTracker, parse_zones
+from heatmap import DensityHeatmap
+from render import render_boxes
+from fmp4 import FragmentRelay
+from detections import Detections
+from artifacts import load_model, is_pytorch, model_runtime, quantized_variants, MODEL_RUNTIME
+from tiles import (
+    iter_tile_batches, redis_tile_fetcher, model_fingerprint, RedisDetectionCache, LocalDetectionCache
+)
+from tile_worker import TileWorker, enqueue_session, session_status
+from probe import probe_source, PROBE_IMGSZ_CHOICES
+from cpu_plan import CorePlanner
+# yt_dlp and slicing (torchvision) are imported where used: most nodes never need them.
+# torch, ultralytics (via artifacts) and redis still load here, at startup.
 
 print("🔵 [SERVER] Booting Aerial Vision Cloud GPU Engine (T4 Optimised)...")
 
@@ -30,6 +44,7 @@ app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], all
 
 CACHE_PATH = os.getenv("MODEL_PATH", "/root/aerial-engine/models")
 SIMULATION_DIR = os.getenv("SIMULATION_DIR", "./streams")
+COMPILED_PATH = os.path.join(CACHE_PATH, "compiled")   # exported ONNX/OpenVINO/TorchScript artifacts
 os.makedirs(CACHE_PATH, exist_ok=True)
 os.makedirs(SIMULATION_DIR, exist_ok=True)
 
@@ -49,43 +64,112 @@ STREAM_TARGET_WIDTH = 1280  # Higher quality live stream output
 STREAM_FPS = 24             # Smooth streaming FPS
 JPEG_QUALITY = 85           # Higher JPEG quality for clearer stream
 AI_EVERY_N_FRAMES = 1       # T4 is fast enough to run AI on EVERY frame
-
-# Faint bounding box styling
-BOX_ALPHA = 0.35            # 35% opacity for subtle overlay
-BOX_THICKNESS = 1           # Thin 1px border
-LABEL_FONT_SCALE = 0.45     # Small, non-intrusive labels
-LABEL_ALPHA = 0.5           # 50% opacity for text background
-# Class colours (BGR) — muted palette so boxes don't dominate the frame
-CLASS_COLORS = {
-    0: (180, 140, 100),   # person — muted blue
-    2: (160, 160, 140),   # car — soft grey-green
-    3: (140, 160, 180),   # motorcycle — warm grey
-    5: (120, 150, 180),   # bus — muted amber
-    7: (150, 130, 160),   # truck — soft purple
-    4: (100, 220, 100),   # ambulance — green (stands out intentionally)
-}
-DEFAULT_COLOR = (160, 160, 160)  # Neutral grey for unknown classes
+# Sliced native-resolution inference for frames/tiles larger than INFERENCE_IMG_SIZE
+SLICED_INFERENCE = os.getenv("SLICED_INFERENCE", "0") == "1"
+STREAM_CLASSES = [2, 3, 4, 5, 7]   # car, motorcycle, ambulance, bus, truck
+# Streams/telemetry run at the probe's recommended imgsz unless the caller sets one
+AUTO_RESOLUTION = os.getenv("AUTO_RESOLUTION", "1") == "1"
+PROBE_MODEL = os.getenv("PROBE_MODEL", "mark-5")
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", 20))   # seconds before a stream starts on defaults
+YTDLP_SOCKET_TIMEOUT = 10.0    # seconds per yt-dlp request while resolving a YouTube URL
+SOURCE_PROFILE_TTL = int(os.getenv("SOURCE_PROFILE_TTL", 3600))
+SOURCE_PROFILE_MAX = 256       # probed sources kept
 
 active_model = None
 current_model_name = ""
+current_model_path = ""
+# Loaded + warmed in parallel at startup; /ready turns 200 once all are hot
+PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "mark-5").split(",") if m.strip()]
+LOADED_MODELS = {}   # name -> {"model", "path", "runtime", "load_s", "warm_shapes"}
+MODEL_STATUS = {}    # name -> "loading" | "hot" | "failed"
+_model_locks = {}         # name -> threading.Lock, one load per model
+_inference_locks = {}     # name -> threading.Lock, one predict() at a time on a shared model
+# Warmed private instances waiting for the next tracking session, per (name, imgsz)
+SESSION_SPARES = int(os.getenv("SESSION_SPARES", 1))
+_session_spares = {}      # (name, imgsz) -> [model, ...]
+_session_refills = set()  # (name, imgsz) keys with a refill running
+_spares_lock = threading.Lock()
+STARTUP = {"imports_s": round(time.time() - BOOT_STARTED, 2), "preload_s": None,
+           "first_frame_s": None, "first_frame_source": None, "session_model_s": None}
 STREAMS = {}
+TELEMETRY_ZONES = {}  # telemetry session id -> zone config, consumed by its /telemetry call
+SOURCE_PROFILES = OrderedDict()  # source url -> (expires_at, probe result), LRU
+_profiles_lock = threading.Lock()
+CORE_PLANNER = CorePlanner()   # per-stream core budgets on CPU hosts (CPU_PLAN)
 
 # ==========================================
 # 0. UPSTASH REDIS CONNECTION
 # ==========================================
 REDIS_URL = os.getenv("REDIS_URL", "")
-try:
-    redis_client = redis.from_url(REDIS_URL, decode_responses=False)
-    redis_client.ping()
-    print("🟢 [REDIS] Connected to Upstash Cloud!")
-except Exception as e:
-    print(f"🔴 [REDIS] Connection failed: {e}")
-    redis_client = None
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 16))
+redis_client = None
+# "redis" (shared, falls back to local without Redis), "local" or "off"
+DETECTION_CACHE = os.getenv("DETECTION_CACHE", "redis")
+local_detection_cache = LocalDetectionCache()
+# Consume queued tile sessions (Redis stream) inside this server too
+TILE_WORKER = os.getenv("TILE_WORKER", "0") == "1"
+tile_worker = None
+
+
+def detection_cache():
+    if DETECTION_CACHE == "off":
+        return None
+    if DETECTION_CACHE == "redis" and redis_client:
+        return RedisDetectionCache(redis_client)
+    return local_detection_cache
+
+
+@app.on_event("startup")
+async def connect_redis():
+    global redis_client
+    try:
+        # Pooled asyncio client: tile fetches never block the event loop
+        pool = aioredis.BlockingConnectionPool.from_url(
+            REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, timeout=10, decode_responses=False
+        )
+        client = aioredis.Redis(connection_pool=pool)
+        await client.ping()
+        redis_client = client
+        print("🟢 [REDIS] Connected to Upstash Cloud!")
+    except Exception as e:
+        print(f"🔴 [REDIS] Connection failed: {e}")
+        redis_client = None
+
+
+@app.on_event("startup")
+async def start_tile_worker():
+    if TILE_WORKER and redis_client:
+        _start_tile_worker()
+
+
+@app.on_event("shutdown")
+async def close_redis():
+    if tile_worker:
+        tile_worker.stop()
+    if redis_client:
+        await redis_client.aclose()
+
+
+def _worker_options(model_name, sliced):
+    """iter_tile_batches settings for queued sessions; called after the model is loaded."""
+    return dict(
+        conf=CONF_THRESHOLD, imgsz=INFERENCE_IMG_SIZE,
+        cache=detection_cache(), model_tag=model_tag(model_name),
+        sliced=SLICED_INFERENCE if sliced is None else sliced, lock=inference_lock(model_name),
+    )
+
+
+def _start_tile_worker():
+    global tile_worker
+    tile_worker = TileWorker(redis_client, get_model, _worker_options)
+    return asyncio.create_task(tile_worker.run())
+
 
 class AnalyzeRequest(BaseModel):
     sessionId: str
     tileIds: List[str]
     model: Optional[str] = "mark-5"
+    sliced: Optional[bool] = None   # None = SLICED_INFERENCE
 
 
 # ==========================================
@@ -100,13 +184,70 @@ MODEL_PATHS = {
     "mark-2":   f"{CACHE_PATH}/mark2.pt",
     "mark-1":   f"{CACHE_PATH}/mark1.pt",
 }
+# INT8 OpenVINO builds from quantize.py, selectable as e.g. "mark-5-int8".
+# They are static-shape: MODEL_PATHS holds the INFERENCE_IMG_SIZE build that
+# get_model runs, streams pick theirs by imgsz through model_path_for.
+INT8_ARTIFACTS = quantized_variants(MODEL_PATHS, CACHE_PATH)
+MODEL_PATHS.update({name: sizes[INFERENCE_IMG_SIZE] for name, sizes in INT8_ARTIFACTS.items()
+                    if INFERENCE_IMG_SIZE in sizes})
 
-def get_model(model_name="mark-5"):
-    global active_model, current_model_name
-    if active_model and current_model_name == model_name:
-        return active_model
 
-    print(f"\n🔄 [GOVERNANCE] Switching Engine to: {model_name}...")
+def int8_imgsz(model_name, imgsz):
+    """
+    imgsz an INT8 model can actually run for a requested one: the same size if
+    it was exported, else the next larger export (or the largest).
+    """
+    sizes = INT8_ARTIFACTS.get(model_name)
+    if not sizes or imgsz in sizes:
+        return imgsz
+    larger = [s for s in sizes if s > imgsz]
+    return min(larger) if larger else max(sizes)
+
+
+def model_path_for(model_name, imgsz):
+    """Weights for running `model_name` at `imgsz`; None if an INT8 model has no export at that size."""
+    if model_name in INT8_ARTIFACTS:
+        return INT8_ARTIFACTS[model_name].get(imgsz)
+    return MODEL_PATHS.get(model_name)
+
+
+def check_int8_imgsz(model_name, imgsz):
+    """400 for an explicit imgsz that an INT8 model was not exported at."""
+    sizes = INT8_ARTIFACTS.get(model_name)
+    if sizes and imgsz not in sizes:
+        raise HTTPException(status_code=400, detail=f"{model_name} is exported for imgsz "
+                                                    f"{sorted(sizes)} only; run quantize.py --imgsz {imgsz}")
+
+def warmup_shapes(sliced=SLICED_INFERENCE, imgsz=None):
+    """
+    (height, width, imgsz) inputs the engine actually runs: tiles, 16:9 stream
+    frames, slice windows. Without an imgsz, stream frames are warmed at every
+    size streams can run at, i.e. each probe size when AUTO_RESOLUTION is on.
+    """
+    if imgsz:
+        sizes = [imgsz]
+    else:
+        sizes = sorted(PROBE_IMGSZ_CHOICES) if AUTO_RESOLUTION else [INFERENCE_IMG_SIZE]
+    shapes = [(INFERENCE_IMG_SIZE, INFERENCE_IMG_SIZE, INFERENCE_IMG_SIZE)]
+    shapes += [(STREAM_TARGET_WIDTH * 9 // 16, STREAM_TARGET_WIDTH, size) for size in sizes]
+    if sliced:
+        from slicing import SLICE_WINDOW
+        shapes.append((SLICE_WINDOW, SLICE_WINDOW, SLICE_WINDOW))
+    return shapes
+
+
+def warm_model(model, shapes):
+    """One dummy pass per input shape, so cuDNN autotuning and allocation happen before real frames."""
+    for h, w, imgsz in shapes:
+        try:
+            model.predict(np.zeros((h, w, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+        except Exception as e:
+            # Static-shape compiled artifacts only accept their export size
+            print(f"   ⚠️ [WARMUP] {w}x{h}@{imgsz} skipped: {e}")
+
+
+def _load_model_entry(model_name):
+    print(f"\n🔄 [GOVERNANCE] Loading Engine: {model_name}...")
     load_path = MODEL_PATHS.get(model_name, MODEL_PATHS["mark-5"])
 
     if not os.path.exists(load_path):
@@ -114,76 +255,160 @@ def get_model(model_name="mark-5"):
         load_path = MODEL_PATHS["mark-5"]
         if not os.path.exists(load_path):
             print(f"   ❌ Default model also missing!")
+            MODEL_STATUS[model_name] = "failed"
             return None
 
+    MODEL_STATUS[model_name] = "loading"
+    started = time.perf_counter()
     try:
-        model = YOLO(load_path, task='detect')
-        # T4 warmup — use 1280 to pre-allocate CUDA memory at full resolution
-        print(f"   🔥 [WARMUP] Pre-allocating CUDA memory at {INFERENCE_IMG_SIZE}px...")
-        model(np.zeros((INFERENCE_IMG_SIZE, INFERENCE_IMG_SIZE, 3), dtype=np.uint8), verbose=False)
-        active_model = model
-        current_model_name = model_name
-        print(f"   ✅ Engine Loaded: {model_name} (VRAM: {torch.cuda.memory_allocated(0)/1e9:.2f}GB)")
-        return model
+        model = load_model(load_path, MODEL_RUNTIME, INFERENCE_IMG_SIZE, cache_dir=COMPILED_PATH)
+        # T4 warmup at every shape in use, which also pre-allocates CUDA memory
+        shapes = warmup_shapes()
+        print(f"   🔥 [WARMUP] {model_name} at {', '.join(f'{w}x{h}@{s}' for h, w, s in shapes)}...")
+        warm_model(model, shapes)
+        entry = {
+            "model": model, "path": load_path, "runtime": model_runtime(model),
+            "load_s": round(time.perf_counter() - started, 2),
+            "warm_shapes": [f"{w}x{h}@{s}" for h, w, s in shapes],
+        }
+        LOADED_MODELS[model_name] = entry
+        MODEL_STATUS[model_name] = "hot"
+        print(f"   ✅ Engine Loaded: {model_name} in {entry['load_s']}s "
+              f"(VRAM: {torch.cuda.memory_allocated(0)/1e9:.2f}GB)")
+        return entry
     except Exception as e:
+        MODEL_STATUS[model_name] = "failed"
         print(f"   ❌ Load Error: {e}")
         return None
 
 
+def get_model(model_name="mark-5"):
+    global active_model, current_model_name, current_model_path
+    entry = LOADED_MODELS.get(model_name)
+    if entry is None:
+        # Concurrent callers (and the preloader) wait for a single load
+        with _model_locks.setdefault(model_name, threading.Lock()):
+            entry = LOADED_MODELS.get(model_name) or _load_model_entry(model_name)
+        if entry is None:
+            return None
+    active_model, current_model_name, current_model_path = entry["model"], model_name, entry["path"]
+    return entry["model"]
+
+
+def inference_lock(model_name):
+    """
+    Lock for inference on the shared get_model() instance. The ultralytics
+    predictor keeps per-call state on the model, so /analyze sessions, jobs,
+    the tile worker and the probe take turns on it.
+    """
+    return _inference_locks.setdefault(model_name, threading.Lock())
+
+
+def _new_session_model(model_name, imgsz):
+    """Loads a fresh instance and warms it at the stream frame shape for `imgsz`."""
+    if model_name in INT8_ARTIFACTS:
+        path = model_path_for(model_name, imgsz)
+    elif get_model(model_name) is not None:
+        path = LOADED_MODELS[model_name]["path"]
+    else:
+        path = None
+    if path is None:
+        return None
+    model = load_model(path, MODEL_RUNTIME, imgsz, cache_dir=COMPILED_PATH)
+    warm_model(model, warmup_shapes(False, imgsz)[1:])
+    return model
+
+
+def _refill_session_spares(key):
+    try:
+        while True:
+            with _spares_lock:
+                if len(_session_spares.get(key, [])) >= SESSION_SPARES:
+                    return
+            model = _new_session_model(*key)
+            if model is None:
+                return
+            with _spares_lock:
+                _session_spares.setdefault(key, []).append(model)
+    except Exception as e:
+        print(f"   ⚠️ [SESSION] Spare {key[0]}@{key[1]} failed: {e}")
+    finally:
+        with _spares_lock:
+            _session_refills.discard(key)
+
+
+def session_model(model_name, imgsz=INFERENCE_IMG_SIZE):
+    """
+    Private, warmed instance of a model for one tracking session. Tracker
+    state lives on the predictor, so sessions never share the get_model()
+    instance. A spare is handed out when one is ready and replaced in the
+    background; otherwise the caller loads one (timed in STARTUP).
+    """
+    key = (model_name, imgsz)
+    with _spares_lock:
+        spares = _session_spares.get(key)
+        model = spares.pop() if spares else None
+        refill = SESSION_SPARES > 0 and key not in _session_refills
+        if refill:
+            _session_refills.add(key)
+    if model is None:
+        started = time.perf_counter()
+        model = _new_session_model(model_name, imgsz)
+        STARTUP["session_model_s"] = round(time.perf_counter() - started, 2)
+        print(f"   🧊 [SESSION] {model_name}@{imgsz} loaded cold in {STARTUP['session_model_s']}s")
+    if refill:
+        threading.Thread(target=_refill_session_spares, args=(key,), daemon=True).start()
+    return model
+
+
+def model_tag(model_name):
+    """
+    Detection cache tag for a loaded model: name, digest of the weights actually
+    used and the backend running them, so backends never share cache entries.
+    """
+    entry = LOADED_MODELS.get(model_name)
+    if entry is None:
+        return model_fingerprint(model_name, None)
+    return f"{model_fingerprint(model_name, entry['path'])}/{entry['runtime']}"
+
+
+def mark_first_frame(source):
+    """Records cold-start-to-first-frame once, for whichever path produces a frame first."""
+    if STARTUP["first_frame_s"] is None:
+        STARTUP["first_frame_s"] = round(time.time() - BOOT_STARTED, 2)
+        STARTUP["first_frame_source"] = source
+        print(f"⏱️ [STARTUP] Cold start to first frame: {STARTUP['first_frame_s']}s ({source})")
+
+
+@app.on_event("startup")
+async def preload_models():
+    """Loads and warms PRELOAD_MODELS in parallel in the background; startup does not wait."""
+    global preload_task
+    loop = asyncio.get_running_loop()
+
+    async def run():
+        started = time.perf_counter()
+        await asyncio.gather(*(loop.run_in_executor(None, get_model, name) for name in PRELOAD_MODELS))
+        STARTUP["preload_s"] = round(time.perf_counter() - started, 2)
+        hot = sum(MODEL_STATUS.get(name) == "hot" for name in PRELOAD_MODELS)
+        print(f"🔥 [PRELOAD] {hot}/{len(PRELOAD_MODELS)} models hot in {STARTUP['preload_s']}s")
+
+    preload_task = asyncio.create_task(run())
+
+preload_task = None
+
+
 # ==========================================
 # 2. FAINT BOUNDING BOX RENDERER
 # ==========================================
-def draw_faint_boxes(frame, results):
+def draw_faint_boxes(frame, dets):
     """
     Draws semi-transparent bounding boxes with thin borders and subtle labels.
-    Uses alpha blending so the video stays clean and cinematic.
+    Blending is limited to the box and label rectangles (see render.py).
     """
-    overlay = frame.copy()
-    label_overlay = frame.copy()
-
-    if not results[0].boxes or len(results[0].boxes) == 0:
+    if len(dets) == 0:
         return frame
-
-    boxes = results[0].boxes.xyxy.cpu().numpy()    # [x1, y1, x2, y2]
-    confs = results[0].boxes.conf.cpu().numpy()
-    classes = results[0].boxes.cls.int().cpu().numpy()
-    names = results[0].names
-
-    for box, conf, cls in zip(boxes, confs, classes):
-        x1, y1, x2, y2 = int(box[0]), int(box[1]), int(box[2]), int(box[3])
-        color = CLASS_COLORS.get(int(cls), DEFAULT_COLOR)
-        class_name = names.get(int(cls), f"cls_{cls}")
-
-        # --- Faint filled rectangle (subtle highlight) ---
-        cv2.rectangle(overlay, (x1, y1), (x2, y2), color, -1)
-
-        # --- Thin border ---
-        cv2.rectangle(frame, (x1, y1), (x2, y2), color, BOX_THICKNESS)
-
-        # --- Small label with confidence ---
-        label = f"{class_name} {conf:.0%}"
-        (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, LABEL_FONT_SCALE, 1)
-        label_x1, label_y1 = x1, y1 - th - 6
-        label_x2, label_y2 = x1 + tw + 6, y1
-
-        # Clamp to frame bounds
-        if label_y1 < 0:
-            label_y1 = y2
-            label_y2 = y2 + th + 6
-
-        # Semi-transparent label background
-        cv2.rectangle(label_overlay, (label_x1, label_y1), (label_x2, label_y2), color, -1)
-        cv2.putText(
-            label_overlay, label, (label_x1 + 3, label_y2 - 3),
-            cv2.FONT_HERSHEY_SIMPLEX, LABEL_FONT_SCALE, (255, 255, 255), 1, cv2.LINE_AA
-        )
-
-    # Alpha blend: faint fill
-    frame = cv2.addWeighted(overlay, BOX_ALPHA, frame, 1 - BOX_ALPHA, 0)
-    # Alpha blend: label background
-    frame = cv2.addWeighted(label_overlay, LABEL_ALPHA, frame, 1 - LABEL_ALPHA, 0)
-
-    return frame
+    return render_boxes(frame, dets.xyxy, dets.conf, dets.cls, dets.names)
 
 
 # ==========================================
@@ -230,18 +455,14 @@ class TrafficBrain:
             "snapshot": {"mime": "image/jpeg", "data": snapshot_b64}
         }
 
-    def analyze(self, results, frame):
+    def analyze(self, dets, frame):
         current_time = time.time()
-        if results[0].boxes.id is None:
+        if dets.ids is None:
             return 0, "🟢 CLEAR", [], False
 
-        boxes = results[0].boxes.xywh.cpu().numpy()
-        ids = results[0].boxes.id.int().cpu().numpy()
-        classes = (
-            results[0].boxes.cls.int().cpu().numpy()
-            if hasattr(results[0].boxes, 'cls') and results[0].boxes.cls is not None
-            else [0] * len(ids)
-        )
+        boxes = dets.xywh
+        ids = dets.ids
+        classes = dets.cls
 
         vehicle_count = len(ids)
         alerts_to_send = []
@@ -307,9 +528,9 @@ class TrafficBrain:
 # 4. INFERENCE ENGINE (LIVE STREAMS)
 # ==========================================
 class InferenceEngine:
-    """T4-optimised inference: 1280px input, faint box rendering."""
+    """T4-optimised inference: per-source input size (1280px by default), faint box rendering."""
 
-    def __init__(self, model_path):
+    def __init__(self, model_path, zones=None, sliced=SLICED_INFERENCE, imgsz=INFERENCE_IMG_SIZE):
         print(f"🔧 [INF] Loading model: {model_path}")
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         if self.device == "cuda":
@@ -318,28 +539,82 @@ class InferenceEngine:
         else:
             print("   ⚠️ WARNING: Running on CPU")
 
-        self.model = YOLO(model_path)
-        self.model.to(self.device)
         self.target_width = STREAM_TARGET_WIDTH
+        # Live detections are untracked, so zones report counts and occupancy only
+        self.zone_tracker = ZoneTracker(zones, dwell=False) if zones else None
+        self.heatmap = DensityHeatmap()
+        self.sliced = sliced
+        self.budget = None      # CoreBudget while the stream is registered with CORE_PLANNER
+        self.frame_shape = None                 # last resized frame, for warming swap-in models
+        self.swap_lock = threading.Lock()       # model and imgsz change together
+        self.swapped_at = None                  # perf_counter of the last swap, until its first frame
+        self.swap_first_frame_ms = None
+        self.imgsz = imgsz
+        self.model = self.prepare_model(model_path, imgsz)
+
+    def prepare_model(self, model_path, imgsz):
+        """Loads and warms a model at this stream's shapes, without touching the live one."""
+        model = load_model(model_path, MODEL_RUNTIME, imgsz, cache_dir=COMPILED_PATH)
+        if is_pytorch(model):
+            model.to(self.device)
+        # Warm before the first live frame rather than on it
+        shapes = warmup_shapes(self.sliced, imgsz)[1:]
+        if self.frame_shape is not None:
+            shapes[0] = (*self.frame_shape, imgsz)
+        warm_model(model, shapes)
+        return model
 
-    def run(self, frame):
-        try:
-            height, width = frame.shape[:2]
-            aspect_ratio = height / width
-            new_width = self.target_width
-            new_height = int(new_width * aspect_ratio)
-
-            resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
-
-            # T4 can handle 1280px inference — sharper detections
-            results = self.model(
-                resized, conf=0.5, iou=0.45,
-                classes=[2, 3, 4, 5, 7],   # car, motorcycle, ambulance, bus, truck
-                verbose=False, imgsz=INFERENCE_IMG_SIZE
+    def swap_model(self, model, imgsz):
+        """Replaces the model between frames: a frame already in detect() finishes on the old one."""
+        with self.swap_lock:
+            self.model, self.imgsz = model, imgsz
+            self.swapped_at = time.perf_counter()
+            self.swap_first_frame_ms = None
+
+    def detect(self, frame):
+        """Resizes to stream width and runs inference. Returns (resized, Detections)."""
+        if self.budget is not None:
+            self.budget.apply()
+        height, width = frame.shape[:2]
+        aspect_ratio = height / width
+        new_width = self.target_width
+        new_height = int(new_width * aspect_ratio)
+
+        resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        self.frame_shape = resized.shape[:2]
+        with self.swap_lock:
+            model, imgsz, swapped_at = self.model, self.imgsz, self.swapped_at
+
+        if self.sliced and max(height, width) > imgsz:
+            from slicing import sliced_predict
+            # Native-resolution windows over the source frame, boxes mapped onto `resized`
+            results = sliced_predict(
+                model, frame, conf=0.5, iou=0.45, classes=STREAM_CLASSES, output_image=resized
+            )
+        else:
+            # 1280px for aerial sources; the probe drops ground cameras to 640
+            results = model(
+                resized, conf=0.5, iou=0.45, classes=STREAM_CLASSES,
+                verbose=False, imgsz=imgsz
             )
 
+        dets = Detections.from_result(results[0])
+        if swapped_at is not None and swapped_at == self.swapped_at and self.swap_first_frame_ms is None:
+            # Swap -> first frame out of the new model
+            self.swap_first_frame_ms = round((time.perf_counter() - swapped_at) * 1000, 1)
+
+        now = time.time()
+        self.heatmap.add(dets.centers, new_width, new_height, now)
+        tracker = self.zone_tracker
+        if tracker is not None:
+            tracker.update(dets.centers, new_width, new_height, now=now)
+        return resized, dets
+
+    def run(self, frame):
+        try:
+            resized, dets = self.detect(frame)
             # Draw faint bounding boxes instead of ultralytics' thick default
-            processed = draw_faint_boxes(resized, results)
+            processed = draw_faint_boxes(resized, dets)
             return processed
 
         except Exception as e:
@@ -350,19 +625,60 @@ class InferenceEngine:
 # ==========================================
 # 5. STREAM READER (T4 OPTIMISED)
 # ==========================================
+def resolve_source_url(url):
+    """Direct media URL for YouTube links (1080p); other sources are returned as-is."""
+    if "youtube.com" not in url and "youtu.be" not in url:
+        return url
+    print(f"🔍 Resolving YouTube (1080p): {url}")
+    import yt_dlp
+    try:
+        # Request 1080p for best quality on T4
+        ydl_opts = {
+            'format': 'bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080]',
+            'quiet': True,
+            'socket_timeout': YTDLP_SOCKET_TIMEOUT,
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+            return info['url']
+    except:
+        return url
+
+
 class StreamReader:
-    def __init__(self, source_url, engine, fps_limit=STREAM_FPS, ai_interval=AI_EVERY_N_FRAMES):
+    """
+    Reads a source and runs AI on it. In passthrough mode nothing is drawn
+    or JPEG-encoded: viewers play the source video and draw the boxes
+    published on the NDJSON side channel themselves.
+    """
+
+    def __init__(self, source_url, engine, fps_limit=STREAM_FPS, ai_interval=AI_EVERY_N_FRAMES,
+                 passthrough=False):
         self.source_url = source_url
+        self.real_url = source_url
+        self.resolved = threading.Event()
         self.engine = engine
         self.frame_interval = 1.0 / fps_limit
         self.skip_counter = 0
         self.ai_interval = ai_interval
+        self.passthrough = passthrough
         self.latest_frame = None
+        self.latest_boxes = (0, None)   # (sequence, NDJSON line)
+        self.source_fps = None
+        self.relay = None               # FragmentRelay fed with this reader's frames
         self.lock = threading.Lock()
         self.running = False
         self.thread = None
+        self.started_at = None
+        self.first_frame_s = None   # stream start -> first analysed frame
+
+    def _first_frame(self):
+        self.first_frame_s = round(time.time() - self.started_at, 2)
+        print(f"⏱️ [STREAM] First frame after {self.first_frame_s}s")
+        mark_first_frame("stream")
 
     def start(self):
+        self.started_at = time.time()
         self.running = True
         self.thread = threading.Thread(target=self._read_loop)
         self.thread.daemon = True
@@ -373,29 +689,19 @@ class StreamReader:
         if self.thread:
             self.thread.join(timeout=5)
 
-    def _get_youtube_stream_url(self, url):
-        try:
-            # Request 1080p for best quality on T4
-            ydl_opts = {
-                'format': 'bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080]',
-                'quiet': True
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                return info['url']
-        except:
-            return url
-
     def _read_loop(self):
-        real_url = self.source_url
-        if "youtube.com" in self.source_url or "youtu.be" in self.source_url:
-            print(f"🔍 Resolving YouTube (1080p): {self.source_url}")
-            real_url = self._get_youtube_stream_url(self.source_url)
+        real_url = resolve_source_url(self.source_url)
+        self.real_url = real_url
 
         cap = cv2.VideoCapture(real_url)
         # Set capture to highest available resolution
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+        self.source_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.resolved.set()     # real_url and source_fps are final
+        # Files decode as fast as the CPU allows: pace them to the source frame rate
+        paced = os.path.isfile(real_url)
+        clock, played = time.perf_counter(), 0
 
         while self.running:
             ret, frame = cap.read()
@@ -406,16 +712,30 @@ class StreamReader:
                 cap = cv2.VideoCapture(real_url)
                 cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
                 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+                clock, played = time.perf_counter(), 0
                 continue
 
+            if paced:
+                played += 1
+                delay = clock + played / self.source_fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
             self.skip_counter += 1
+            relay = self.relay
+            video_ms = relay.push(frame) if relay is not None else None
 
             # T4 power: run AI on every single frame (ai_interval=1)
             if self.skip_counter % self.ai_interval == 0:
-                processed = self.engine.run(frame)
-                with self.lock:
-                    self.latest_frame = processed
-            else:
+                if self.passthrough:
+                    self._publish_boxes(frame, cap.get(cv2.CAP_PROP_POS_MSEC), video_ms)
+                else:
+                    processed = self.engine.run(frame)
+                    with self.lock:
+                        self.latest_frame = processed
+                if self.first_frame_s is None:
+                    self._first_frame()
+            elif not self.passthrough:
                 h, w = frame.shape[:2]
                 ratio = h / w
                 tw = STREAM_TARGET_WIDTH
@@ -428,6 +748,34 @@ class StreamReader:
 
         cap.release()
 
+    def _publish_boxes(self, frame, pts_ms, video_ms=None):
+        try:
+            resized, dets = self.engine.detect(frame)
+        except Exception as e:
+            print(f"   ❌ Inference error: {e}")
+            return
+        h, w = resized.shape[:2]
+        # Serialised once per frame, shared by every viewer
+        line = json.dumps({
+            "frame": self.skip_counter,
+            "pts_ms": round(pts_ms, 1),
+            "video_ms": video_ms,       # time of this frame in the /video relay, if one is running
+            "width": w, "height": h,
+            "boxes": dets.overlay_boxes()
+        }) + "\n"
+        self.latest_boxes = (self.latest_boxes[0] + 1, line)
+
+    async def box_stream(self):
+        """NDJSON side channel: one line per analysed frame, no threads per viewer."""
+        last = 0
+        while self.running:
+            seq, line = self.latest_boxes
+            if seq != last and line:
+                last = seq
+                yield line
+            else:
+                await asyncio.sleep(self.frame_interval / 2)
+
     def stream(self):
         while self.running:
             with self.lock:
@@ -473,11 +821,52 @@ def get_gpu_stats():
 # ==========================================
 # 7. ENDPOINTS — PROBE (GOVERNANCE)
 # ==========================================
+def profile_source(source_url, refresh=False):
+    """Probe result for a source, cached per URL. None if the model or source is unavailable."""
+    if not refresh:
+        with _profiles_lock:
+            item = SOURCE_PROFILES.get(source_url)
+            if item and item[0] > time.monotonic():
+                SOURCE_PROFILES.move_to_end(source_url)
+                return item[1]
+    model = get_model(PROBE_MODEL)
+    if model is None:
+        return None
+    try:
+        profile = probe_source(model, resolve_source_url(source_url), INFERENCE_IMG_SIZE,
+                               classes=STREAM_CLASSES, lock=inference_lock(PROBE_MODEL))
+    except Exception as e:
+        print(f"   ⚠️ [PROBE] {source_url}: {e}")
+        return None
+    if profile:
+        with _profiles_lock:
+            SOURCE_PROFILES[source_url] = (time.monotonic() + SOURCE_PROFILE_TTL, profile)
+            SOURCE_PROFILES.move_to_end(source_url)
+            while len(SOURCE_PROFILES) > SOURCE_PROFILE_MAX:
+                SOURCE_PROFILES.popitem(last=False)
+        print(f"📊 [PROBE] {profile['reason']} ({profile['objects']} objects, {profile['frames']} frames)")
+    return profile
+
+
+async def profile_or_default(source_url, refresh=False):
+    """profile_source off the event loop; None (engine defaults) if it takes over PROBE_TIMEOUT."""
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(profile_source, source_url, refresh), PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"   ⚠️ [PROBE] {source_url}: no result after {PROBE_TIMEOUT}s, using defaults")
+        return None
+
+
 @app.post("/probe")
 async def probe_stream(payload: dict):
     source_url = payload.get("sourceUrl", "")
     print(f"🕵️ Probe request for: {source_url}")
 
+    profile = await profile_or_default(source_url, bool(payload.get("refresh"))) if source_url else None
+    if profile:
+        return {**profile, "is_locked": profile["viewType"] == "AERIAL", "probed": True}
+
+    # Source unreadable: fall back to the URL heuristics
     view_type = "AERIAL"
     recommended_model = "mark-3"
     is_locked = True
@@ -492,8 +881,10 @@ async def probe_stream(payload: dict):
     return {
         "viewType": view_type,
         "recommended_model": recommended_model,
+        "recommended_imgsz": INFERENCE_IMG_SIZE,
         "reason": f"Governance Protocol Enforced. View: {view_type}.",
-        "is_locked": is_locked
+        "is_locked": is_locked,
+        "probed": False
     }
 
 
@@ -504,10 +895,20 @@ async def probe_stream(payload: dict):
 async def start_stream_endpoint(payload: dict):
     stream_id = payload.get("id")
     source_url = payload.get("sourceUrl")
-    model_name = payload.get("model", "mark-5")
+    model_name = payload.get("model")
+    imgsz = payload.get("imgsz")
+    zones = payload.get("zones")
+    sliced = bool(payload.get("sliced", SLICED_INFERENCE))
+    mode = payload.get("mode", "render")   # "render" (MJPEG) or "passthrough"
 
     if not stream_id or not source_url:
         raise HTTPException(status_code=400, detail="id and sourceUrl required")
+    if mode not in ("render", "passthrough"):
+        raise HTTPException(status_code=400, detail="mode must be 'render' or 'passthrough'")
+    try:
+        parse_zones(zones)
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zones: {e}")
     if stream_id in STREAMS:
         raise HTTPException(status_code=409, detail="Stream already running")
     if sum(1 for s in STREAMS.values() if s["status"] == "RUNNING") >= MAX_STREAMS:
@@ -515,31 +916,74 @@ async def start_stream_endpoint(payload: dict):
     if check_gpu_memory():
         raise HTTPException(status_code=503, detail="GPU memory critically high")
 
-    model_path = MODEL_PATHS.get(model_name, MODEL_PATHS["mark-5"])
+    profile = None
+    if imgsz is None and payload.get("auto", AUTO_RESOLUTION):
+        profile = await profile_or_default(source_url)
+    model_name = model_name or (profile["recommended_model"] if profile else "mark-5")
+    if imgsz is None:
+        # A probed size is moved onto one the INT8 artifacts were exported at
+        imgsz = int8_imgsz(model_name, profile["recommended_imgsz"] if profile else INFERENCE_IMG_SIZE)
+    imgsz = int(imgsz)
+    check_int8_imgsz(model_name, imgsz)
+
+    model_path = model_path_for(model_name, imgsz) or MODEL_PATHS["mark-5"]
     if not os.path.exists(model_path):
         model_path = MODEL_PATHS["mark-5"]
     if not os.path.exists(model_path):
         raise HTTPException(status_code=500, detail="No model weights available")
 
     try:
-        engine = InferenceEngine(model_path)
-        reader = StreamReader(source_url, engine)
+        # Load + warm off the event loop
+        engine = await asyncio.to_thread(InferenceEngine, model_path, zones=zones, sliced=sliced, imgsz=imgsz)
+        engine.budget = CORE_PLANNER.register(stream_id)
+        reader = StreamReader(source_url, engine, passthrough=(mode == "passthrough"))
         reader.start()
         STREAMS[stream_id] = {
             "reader": reader, "engine": engine, "status": "RUNNING",
-            "model": model_name, "source": source_url, "started_at": time.time()
+            "model": model_name, "source": source_url, "started_at": time.time(),
+            "mode": mode, "relay": None, "imgsz": imgsz, "swap": None
         }
-        print(f"✅ Stream {stream_id} started ({model_name}, {STREAM_TARGET_WIDTH}px, {STREAM_FPS}fps)")
-        return {
+        print(f"✅ Stream {stream_id} started ({model_name}, {mode}, {STREAM_TARGET_WIDTH}px, "
+              f"imgsz {imgsz}, {STREAM_FPS}fps)")
+        response = {
             "streamId": stream_id,
             "aiEngineUrl": f"/streams/{stream_id}",
             "status": "RUNNING",
-            "model": model_name
+            "model": model_name,
+            "mode": mode,
+            "sliced": sliced,
+            "imgsz": imgsz,
+            "probe": profile
         }
+        if mode == "passthrough":
+            response["playbackUrl"] = f"/streams/{stream_id}/video"
+            response["boxesUrl"] = f"/streams/{stream_id}/boxes"
+        return response
     except Exception as e:
+        CORE_PLANNER.unregister(stream_id)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Declared before /streams/{stream_id}, which would otherwise capture it
+@app.get("/streams/status")
+def streams_status():
+    return {
+        "active": len(STREAMS),
+        "max": MAX_STREAMS,
+        "cpu_plan": CORE_PLANNER.snapshot(),
+        "streams": {
+            sid: {
+                "status": s["status"], "model": s["model"],
+                "source": s["source"], "mode": s["mode"], "imgsz": s["imgsz"],
+                "relay_viewers": s["relay"].viewers if s["relay"] else 0,
+                "first_frame_s": s["reader"].first_frame_s,
+                "uptime_s": round(time.time() - s["started_at"], 1)
+            }
+            for sid, s in STREAMS.items()
+        }
+    }
+
+
 @app.get("/streams/{stream_id}")
 async def get_stream(stream_id: str):
     stream = STREAMS.get(stream_id)
@@ -547,6 +991,8 @@ async def get_stream(stream_id: str):
         raise HTTPException(status_code=404, detail="Stream not found")
     if stream["status"] != "RUNNING":
         raise HTTPException(status_code=410, detail="Stream not active")
+    if stream["mode"] == "passthrough":
+        raise HTTPException(status_code=409, detail="Passthrough stream: use /video and /boxes")
     return StreamingResponse(
         stream["reader"].stream(),
         media_type="multipart/x-mixed-replace; boundary=frame",
@@ -554,6 +1000,171 @@ async def get_stream(stream_id: str):
     )
 
 
+@app.get("/streams/{stream_id}/boxes")
+async def get_stream_boxes(stream_id: str):
+    stream = STREAMS.get(stream_id)
+    if not stream:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    if stream["mode"] != "passthrough":
+        raise HTTPException(status_code=409, detail="Boxes are burned into /streams/{id} in render mode")
+    return StreamingResponse(
+        stream["reader"].box_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _simulation_file(path):
+    """Real path of `path` if it is a file inside SIMULATION_DIR, else None."""
+    real = os.path.realpath(path)
+    root = os.path.realpath(SIMULATION_DIR)
+    if os.path.commonpath([real, root]) == root and os.path.isfile(real):
+        return real
+    return None
+
+
+@app.get("/streams/{stream_id}/video")
+async def get_stream_video(stream_id: str):
+    stream = STREAMS.get(stream_id)
+    if not stream:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    reader = stream["reader"]
+    await asyncio.to_thread(reader.resolved.wait, 15)
+
+    # Simulation files are served as-is (the browser seeks with ranges). Any other
+    # path came from the client's sourceUrl and must never be handed out raw.
+    simulation_file = _simulation_file(reader.real_url)
+    if simulation_file:
+        return FileResponse(simulation_file, media_type="video/mp4")
+
+    relay = stream["relay"]
+    if relay is None:
+        relay = stream["relay"] = FragmentRelay(reader.source_fps, STREAM_TARGET_WIDTH)
+    try:
+        relay.start()
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    reader.relay = relay
+
+    async def view():
+        try:
+            async for chunk in relay.subscribe():
+                yield chunk
+        finally:
+            if not relay.running:
+                reader.relay = None     # last viewer left: the reader stops feeding it
+
+    return StreamingResponse(
+        view(),
+        media_type="video/mp4",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/streams/{stream_id}/zones")
+async def get_stream_zones(stream_id: str):
+    stream = STREAMS.get(stream_id)
+    if not stream:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    tracker = stream["engine"].zone_tracker
+    return {"streamId": stream_id, "zones": tracker.snapshot() if tracker else []}
+
+
+@app.put("/streams/{stream_id}/zones")
+async def set_stream_zones(stream_id: str, payload: dict):
+    stream = STREAMS.get(stream_id)
+    if not stream:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    zones = payload.get("zones") or []
+    try:
+        tracker = ZoneTracker(zones, dwell=False) if zones else None
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zones: {e}")
+    # Swapped as a whole so the reader thread never sees a half-built tracker
+    stream["engine"].zone_tracker = tracker
+    return {"success": True, "streamId": stream_id, "zones": len(zones)}
+
+
+@app.get("/streams/{stream_id}/heatmap")
+async def get_stream_heatmap(stream_id: str, format: str = "png", width: int = 640):
+    stream = STREAMS.get(stream_id)
+    if not stream:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    heatmap = stream["engine"].heatmap
+    if format == "array":
+        grid = heatmap.array(time.time())
+        return {
+            "streamId": stream_id,
+            "grid": [heatmap.grid_w, heatmap.grid_h],
+            "max": round(float(grid.max()), 3),
+            "data": np.round(grid, 3).tolist()
+        }
+    width = max(64, min(width, 1920))
+    png = await asyncio.to_thread(heatmap.png, time.time(), width)
+    return Response(content=png, media_type="image/png", headers={"Cache-Control": "no-cache"})
+
+
+async def _hot_swap(stream, swap, model_path):
+    engine = stream["engine"]
+    started = time.perf_counter()
+    try:
+        model = await asyncio.to_thread(engine.prepare_model, model_path, swap["imgsz"])
+    except Exception as e:
+        swap.update(status="failed", error=str(e))
+        print(f"❌ [SWAP] {swap['from']} → {swap['to']} failed: {e}")
+        return
+    swap["load_s"] = round(time.perf_counter() - started, 2)
+    engine.swap_model(model, swap["imgsz"])
+    stream["model"], stream["imgsz"] = swap["to"], swap["imgsz"]
+    swap.update(status="swapped", swapped_at=time.time())
+    print(f"🔁 [SWAP] {swap['from']} → {swap['to']} live after {swap['load_s']}s background load")
+
+
+@app.post("/streams/{stream_id}/model", status_code=202)
+async def swap_stream_model(stream_id: str, payload: dict):
+    """
+    Hot-swaps a running stream's model. The new model loads and warms in the
+    background while the old one keeps serving, then replaces it between
+    frames. Poll GET /streams/{stream_id}/model for load and swap timings.
+    """
+    stream = STREAMS.get(stream_id)
+    if not stream or stream["status"] != "RUNNING":
+        raise HTTPException(status_code=404, detail="Stream not found")
+    model_name = payload.get("model")
+    if model_name not in MODEL_PATHS and model_name not in INT8_ARTIFACTS:
+        raise HTTPException(status_code=400, detail=f"Unknown model: {model_name}")
+    if payload.get("imgsz"):
+        imgsz = int(payload["imgsz"])
+        check_int8_imgsz(model_name, imgsz)
+    else:
+        imgsz = int8_imgsz(model_name, stream["imgsz"])
+    model_path = model_path_for(model_name, imgsz)
+    if not model_path or not os.path.exists(model_path):
+        raise HTTPException(status_code=400, detail=f"Unknown model: {model_name}")
+    if stream["swap"] and stream["swap"]["status"] == "loading":
+        raise HTTPException(status_code=409, detail="A model swap is already in progress")
+
+    swap = {
+        "status": "loading", "from": stream["model"], "to": model_name,
+        "imgsz": imgsz, "requested_at": time.time(),
+    }
+    stream["swap"] = swap
+    asyncio.create_task(_hot_swap(stream, swap, model_path))
+    return {"streamId": stream_id, **swap}
+
+
+@app.get("/streams/{stream_id}/model")
+async def get_stream_model(stream_id: str):
+    stream = STREAMS.get(stream_id)
+    if not stream:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    swap = stream["swap"]
+    if swap and swap["status"] == "swapped":
+        # Swap -> first frame rendered by the new model
+        swap = {**swap, "first_frame_ms": stream["engine"].swap_first_frame_ms}
+    return {"streamId": stream_id, "model": stream["model"], "imgsz": stream["imgsz"], "swap": swap}
+
+
 @app.post("/streams/{stream_id}/stop")
 async def stop_stream_endpoint(stream_id: str):
     stream = STREAMS.get(stream_id)
@@ -561,7 +1172,10 @@ async def stop_stream_endpoint(stream_id: str):
         return {"success": False, "message": "Not found"}
     try:
         stream["reader"].stop()
+        if stream["relay"]:
+            stream["relay"].stop()
         del STREAMS[stream_id]
+        CORE_PLANNER.unregister(stream_id)
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
         print(f"🛑 Stream {stream_id} stopped")
@@ -573,14 +1187,22 @@ async def stop_stream_endpoint(stream_id: str):
 # ==========================================
 # 9. ENDPOINTS — VIDEO TELEMETRY (NDJSON)
 # ==========================================
-async def generate_telemetry(video_path, model_req):
-    model = get_model(model_req)
+async def generate_telemetry(video_path, model_req, imgsz=None, session=None):
+    # model.track keeps tracker state on the model: each session tracks on its own instance
+    if imgsz is None:
+        profile = await profile_or_default(video_path) if AUTO_RESOLUTION else None
+        imgsz = int8_imgsz(model_req, profile["recommended_imgsz"] if profile else INFERENCE_IMG_SIZE)
+    model = await asyncio.to_thread(session_model, model_req, imgsz)
     if not model:
         yield json.dumps({"error": "Model not found"}) + "\n"
         return
+    print(f"📈 [TELEMETRY] {os.path.basename(video_path)} with {model_req} at {imgsz}px")
 
     session_brain = TrafficBrain()
+    zone_cfg = TELEMETRY_ZONES.pop(session, None) if session else None
+    zone_tracker = ZoneTracker(zone_cfg) if zone_cfg else None
     cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
     frame_id = 0
 
     while cap.isOpened():
@@ -591,26 +1213,15 @@ async def generate_telemetry(video_path, model_req):
             results = model.track(
                 frame, persist=True, verbose=False,
                 tracker="bytetrack.yaml", conf=CONF_THRESHOLD,
-                imgsz=INFERENCE_IMG_SIZE  # T4: full 1280px tracking
+                imgsz=imgsz  # the probed size, INFERENCE_IMG_SIZE if unprobed
             )
-            count, status, alerts, green_wave = session_brain.analyze(results, frame)
+            dets = Detections.from_result(results[0])
+            count, status, alerts, green_wave = session_brain.analyze(dets, frame)
 
             # Build faint box data for frontend (optional overlay rendering)
-            box_data = []
-            if results[0].boxes and results[0].boxes.xyxy is not None:
-                xyxy = results[0].boxes.xyxy.cpu().numpy()
-                confs = results[0].boxes.conf.cpu().numpy()
-                clss = results[0].boxes.cls.int().cpu().numpy()
-                names = results[0].names
-                for b, c, cl in zip(xyxy, confs, clss):
-                    box_data.append({
-                        "x1": round(float(b[0]), 1), "y1": round(float(b[1]), 1),
-                        "x2": round(float(b[2]), 1), "y2": round(float(b[3]), 1),
-                        "class": names.get(int(cl), f"cls_{cl}"),
-                        "conf": round(float(c), 2)
-                    })
-
-            yield json.dumps({
+            box_data = dets.overlay_boxes()
+
+            payload = {
                 "frame": frame_id,
                 "stats": {
                     "count": count,
@@ -620,8 +1231,19 @@ async def generate_telemetry(video_path, model_req):
                     "avg_speed": 0
                 },
                 "boxes": box_data,
-                "incidents": alerts
-            }) + "\n"
+                "incidents": alerts,
+                "imgsz": imgsz
+            }
+
+            if zone_tracker is not None:
+                h, w = frame.shape[:2]
+                # Video time, not wall time, so dwell matches the footage
+                zone_tracker.update(dets.centers, w, h, track_ids=dets.ids, now=frame_id / fps)
+                payload["zones"] = zone_tracker.snapshot()
+
+            if frame_id == 0:
+                mark_first_frame("telemetry")
+            yield json.dumps(payload) + "\n"
 
             frame_id += 1
             await asyncio.sleep(0.005)  # T4 is fast — minimal delay
@@ -631,27 +1253,72 @@ async def generate_telemetry(video_path, model_req):
 
     cap.release()
     if video_path.startswith("/tmp/"):
+        with _profiles_lock:
+            SOURCE_PROFILES.pop(video_path, None)
         try:
             os.remove(video_path)
         except:
             pass
 
 
+def _parse_telemetry_zones(zones):
+    if not zones:
+        return None
+    try:
+        if isinstance(zones, str):
+            zones = json.loads(zones)
+        return parse_zones(zones)
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zones: {e}")
+
+
+def _telemetry_url(video_path, model, zone_cfg):
+    """stream_url for a video; zones ride on a per-session id so sessions on one file stay apart."""
+    url = f"/telemetry?video_id={video_path}&model_req={model}"
+    if zone_cfg:
+        session = os.urandom(6).hex()
+        TELEMETRY_ZONES[session] = zone_cfg
+        url += f"&session={session}"
+    return url
+
+
 @app.post("/upload_and_process")
-async def upload_endpoint(file: UploadFile = File(...), model: str = Form("mark-5")):
+async def upload_endpoint(
+    file: UploadFile = File(...),
+    model: str = Form("mark-5"),
+    zones: Optional[str] = Form(None)   # JSON list of zone polygons
+):
+    # Validate before saving, so a rejected request leaves nothing in /tmp
+    zone_cfg = _parse_telemetry_zones(zones)
     temp_name = f"/tmp/telemetry_{int(time.time())}_{file.filename}"
     with open(temp_name, "wb") as f:
         f.write(await file.read())
     print(f"📥 Uploaded {file.filename} → {temp_name}")
-    return {"stream_url": f"/telemetry?video_id={temp_name}&model_req={model}"}
+    return {"stream_url": _telemetry_url(temp_name, model, zone_cfg)}
+
+
+ACTIVE_TELEMETRY = 0    # sessions streaming right now, reported on / for gateway load balancing
+
+
+async def _count_telemetry(lines):
+    global ACTIVE_TELEMETRY
+    ACTIVE_TELEMETRY += 1
+    try:
+        async for line in lines:
+            yield line
+    finally:
+        ACTIVE_TELEMETRY -= 1
 
 
 @app.get("/telemetry")
-async def telemetry_endpoint(video_id: str, model_req: str):
+async def telemetry_endpoint(video_id: str, model_req: str, imgsz: Optional[int] = None,
+                             session: Optional[str] = None):
     if not os.path.exists(video_id):
         raise HTTPException(status_code=404, detail="Video file not found")
+    if imgsz is not None:
+        check_int8_imgsz(model_req, imgsz)
     return StreamingResponse(
-        generate_telemetry(video_id, model_req),
+        _count_telemetry(generate_telemetry(video_id, model_req, imgsz, session)),
         media_type="application/x-ndjson"
     )
 
@@ -659,65 +1326,159 @@ async def telemetry_endpoint(video_id: str, model_req: str):
 # ==========================================
 # 10. ENDPOINTS — SATELLITE TILE ANALYSIS
 # ==========================================
-@app.post("/analyze")
-async def analyze_static_tiles(req: AnalyzeRequest):
-    if not redis_client:
-        return JSONResponse(status_code=503, content={"success": False, "error": "Redis not connected"})
+ANALYZE_JOBS = {}           # job id -> background tile analysis session
+ANALYZE_JOB_TTL = 3600      # seconds a finished job stays pollable
 
-    model = get_model(req.model)
+
+async def _analysis_model(req):
+    """(model, None) for a tile session, or (None, error response)."""
+    if not redis_client:
+        return None, JSONResponse(status_code=503, content={"success": False, "error": "Redis not connected"})
+    model = await asyncio.to_thread(get_model, req.model)
     if not model:
-        return JSONResponse(status_code=500, content={"success": False, "error": "Model failed to load"})
+        return None, JSONResponse(status_code=500, content={"success": False, "error": "Model failed to load"})
+    return model, None
 
-    results = []
-    total_vehicles = 0
+
+async def _analyze_session(req, model):
+    """Yields per-tile entries as their batch finishes, then the session summary."""
     print(f"\n📡 [ANALYZE] {len(req.tileIds)} tiles for session: {req.sessionId}")
+    timing = {}
+    total_vehicles = cache_hits = processed = 0
+    # T4: run at 1280px for satellite tiles too, batched by free VRAM
+    async for entries in iter_tile_batches(
+        model, req.tileIds, redis_tile_fetcher(redis_client),
+        conf=CONF_THRESHOLD, imgsz=INFERENCE_IMG_SIZE,
+        cache=detection_cache(), model_tag=model_tag(req.model),
+        sliced=SLICED_INFERENCE if req.sliced is None else req.sliced, timing=timing,
+        lock=inference_lock(req.model)
+    ):
+        for entry in entries:
+            total_vehicles += entry["vehicleCount"]
+            cache_hits += bool(entry.get("cached"))
+            processed += 1
+            yield entry
+        mark_first_frame("analyze")
+
+    print(f"✅ [ANALYZE] Session {req.sessionId} done. {total_vehicles} vehicles found "
+          f"({cache_hits}/{processed} cached, redis {timing['redis_ms']}ms, total {timing['total_ms']}ms).")
+    yield {
+        "sessionId": req.sessionId, "totalVehicles": total_vehicles,
+        "tilesProcessed": processed, "cacheHits": cache_hits, "timing": timing
+    }
 
-    for tile_id in req.tileIds:
-        try:
-            image_bytes = redis_client.get(f"tile:{tile_id}")
-            if not image_bytes:
-                results.append({"tileId": tile_id, "status": "missing_in_cache", "vehicleCount": 0})
-                continue
 
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if img is None:
-                results.append({"tileId": tile_id, "status": "decode_error", "vehicleCount": 0})
-                continue
+@app.post("/analyze")
+async def analyze_static_tiles(req: AnalyzeRequest):
+    model, error = await _analysis_model(req)
+    if error:
+        return error
+    results = [item async for item in _analyze_session(req, model)]
+    summary = results.pop()
+    return {"success": True, **summary, "data": results}
+
 
-            # T4: run at 1280px for satellite tiles too
-            preds = model.predict(img, conf=CONF_THRESHOLD, verbose=False, imgsz=INFERENCE_IMG_SIZE)
-
-            v_count = len(preds[0].boxes) if preds[0].boxes else 0
-            total_vehicles += v_count
-
-            detections = []
-            if preds[0].boxes:
-                for box in preds[0].boxes:
-                    x, y, w, h = box.xywh[0].cpu().numpy()
-                    cls = int(box.cls[0].cpu().numpy())
-                    conf = float(box.conf[0].cpu().numpy())
-                    class_name = preds[0].names.get(cls, f"class_{cls}")
-                    detections.append({
-                        "class": class_name, "class_id": cls,
-                        "confidence": round(conf, 3),
-                        "bbox": {"x": float(x), "y": float(y), "w": float(w), "h": float(h)}
-                    })
-
-            results.append({
-                "tileId": tile_id, "status": "processed",
-                "vehicleCount": v_count, "detections": detections
-            })
+@app.post("/analyze/stream")
+async def analyze_tiles_stream(req: AnalyzeRequest):
+    """
+    NDJSON variant of /analyze: one {"type": "tile", ...} line per tile as
+    its batch completes, then a {"type": "summary", ...} line.
+    """
+    model, error = await _analysis_model(req)
+    if error:
+        return error
+
+    async def lines():
+        try:
+            async for item in _analyze_session(req, model):
+                if "tileId" in item:
+                    yield json.dumps({"type": "tile", **item}) + "\n"
+                else:
+                    yield json.dumps({"type": "summary", "success": True, **item}) + "\n"
         except Exception as e:
-            results.append({"tileId": tile_id, "status": "error", "message": str(e), "vehicleCount": 0})
+            print(f"❌ [ANALYZE] Session {req.sessionId} failed: {e}")
+            yield json.dumps({"type": "error", "success": False, "error": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 
-    print(f"✅ [ANALYZE] Session {req.sessionId} done. {total_vehicles} vehicles found.")
+async def _run_analyze_job(job, req, model):
+    try:
+        async for item in _analyze_session(req, model):
+            if "tileId" in item:
+                job["results"].append(item)
+            else:
+                job["summary"] = item
+        job["status"] = "done"
+    except Exception as e:
+        print(f"❌ [ANALYZE] Job {job['jobId']} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = time.time()
+
+
+@app.post("/analyze/jobs", status_code=202)
+async def create_analyze_job(req: AnalyzeRequest):
+    """Runs a tile session in the background; poll GET /analyze/jobs/{id}."""
+    model, error = await _analysis_model(req)
+    if error:
+        return error
+
+    now = time.time()
+    for job_id in [j for j, job in ANALYZE_JOBS.items()
+                   if job["finished_at"] and now - job["finished_at"] > ANALYZE_JOB_TTL]:
+        del ANALYZE_JOBS[job_id]
+
+    job_id = os.urandom(6).hex()
+    job = {
+        "jobId": job_id, "sessionId": req.sessionId, "status": "running",
+        "total": len(req.tileIds), "results": [], "summary": None, "error": None,
+        "created_at": now, "finished_at": None,
+    }
+    ANALYZE_JOBS[job_id] = job
+    job["task"] = asyncio.create_task(_run_analyze_job(job, req, model))
+    return {"jobId": job_id, "status": "running", "statusUrl": f"/analyze/jobs/{job_id}"}
+
+
+@app.get("/analyze/jobs/{job_id}")
+def analyze_job_status(job_id: str, since: int = 0):
+    """Progress plus the tile entries from index `since` on; pass `next` back to page."""
+    job = ANALYZE_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    results = job["results"]
     return {
-        "success": True, "sessionId": req.sessionId,
-        "totalVehicles": total_vehicles, "tilesProcessed": len(results), "data": results
+        "jobId": job_id, "sessionId": job["sessionId"], "status": job["status"],
+        "completed": len(results), "total": job["total"],
+        "data": results[since:], "next": len(results),
+        "summary": job["summary"], "error": job["error"],
     }
 
 
+@app.post("/analyze/queue", status_code=202)
+async def queue_analysis(req: AnalyzeRequest):
+    """Queues a session on the Redis job stream for any engine worker to pick up."""
+    if not redis_client:
+        return JSONResponse(status_code=503, content={"success": False, "error": "Redis not connected"})
+    chunks = await enqueue_session(redis_client, req.sessionId, req.tileIds, model=req.model, sliced=req.sliced)
+    print(f"📥 [ANALYZE] Queued {len(req.tileIds)} tiles for session {req.sessionId} ({chunks} chunks)")
+    return {
+        "success": True, "sessionId": req.sessionId, "status": "queued", "chunks": chunks,
+        "statusUrl": f"/analyze/sessions/{req.sessionId}"
+    }
+
+
+@app.get("/analyze/sessions/{session_id}")
+async def queued_analysis_status(session_id: str, results: bool = False):
+    if not redis_client:
+        return JSONResponse(status_code=503, content={"success": False, "error": "Redis not connected"})
+    status = await session_status(redis_client, session_id, include_results=results)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return status
+
+
 # ==========================================
 # 11. SIMULATION UTILS
 # ==========================================
@@ -746,8 +1507,9 @@ async def process_local_simulation(payload: dict):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail=f"Simulation '{filename}' not found on GPU server")
 
+    zone_cfg = _parse_telemetry_zones(payload.get("zones"))
     print(f"🎬 Processing local simulation: {file_path} (model: {model})")
-    return {"stream_url": f"/telemetry?video_id={file_path}&model_req={model}"}
+    return {"stream_url": _telemetry_url(file_path, model, zone_cfg)}
 
 
 # ==========================================
@@ -761,8 +1523,10 @@ def health_check():
         "model_loaded": current_model_name or "none",
         "gpu": get_gpu_stats(),
         "active_streams": len(STREAMS),
+        "active_telemetry": ACTIVE_TELEMETRY,
         "max_streams": MAX_STREAMS,
         "inference_resolution": INFERENCE_IMG_SIZE,
+        "runtime": MODEL_RUNTIME,
         "stream_resolution": STREAM_TARGET_WIDTH,
         "stream_fps": STREAM_FPS,
         "jpeg_quality": JPEG_QUALITY,
@@ -770,30 +1534,48 @@ def health_check():
     }
 
 
-@app.get("/streams/status")
-def streams_status():
-    return {
-        "active": len(STREAMS),
-        "max": MAX_STREAMS,
-        "streams": {
-            sid: {
-                "status": s["status"], "model": s["model"],
-                "source": s["source"],
-                "uptime_s": round(time.time() - s["started_at"], 1)
-            }
-            for sid, s in STREAMS.items()
+@app.get("/ready")
+def readiness():
+    """200 once every PRELOAD_MODELS entry is loaded and warm, 503 until then (for load balancers)."""
+    ready = all(MODEL_STATUS.get(name) == "hot" for name in PRELOAD_MODELS)
+    models = {}
+    for name in dict.fromkeys([*PRELOAD_MODELS, *LOADED_MODELS]):
+        entry = LOADED_MODELS.get(name)
+        models[name] = {
+            "status": MODEL_STATUS.get(name, "pending"),
+            "load_s": entry["load_s"] if entry else None,
+            "warm_shapes": entry["warm_shapes"] if entry else [],
         }
+    body = {
+        "ready": ready, "models": models, "runtime": MODEL_RUNTIME,
+        "redis": "connected" if redis_client else "disconnected",
+        "startup": STARTUP,
     }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
 
 
 # ==========================================
 # BOOT
 # ==========================================
+async def run_worker_only():
+    """`python engine.py --worker`: consume queued tile sessions without serving HTTP."""
+    await connect_redis()
+    if not redis_client:
+        return
+    try:
+        await _start_tile_worker()
+    finally:
+        await close_redis()
+
+
 if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        asyncio.run(run_worker_only())
+        sys.exit(0)
     port = int(os.getenv("PORT", 8000))
     print(f"🟢 GPU Engine on port {port}")
     print(f"📂 Models: {os.path.abspath(CACHE_PATH)}")
     print(f"📂 Simulations: {os.path.abspath(SIMULATION_DIR)}")
-    print(f"🎮 GPU: {'cuda — ' + torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'cpu'}")
+    print(f"🎮 GPU: {'cuda — ' + torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'cpu'} | Runtime: {MODEL_RUNTIME}")
     print(f"🖼️ Inference: {INFERENCE_IMG_SIZE}px | Stream: {STREAM_TARGET_WIDTH}px @ {STREAM_FPS}fps | JPEG: {JPEG_QUALITY}%")
     uvicorn.run(app, host="0.0.0.0", port=port)
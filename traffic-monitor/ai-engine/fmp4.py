@@ -0,0 +1,211 @@
+# fmp4.py
+# Shared fragmented-MP4 relay for passthrough streams.
+#
+# The relay encodes the frames the stream reader has already decoded, so a
+# passthrough stream holds one connection to its source no matter how many
+# viewers it has. One FFmpeg process turns those frames into fragmented
+# MP4. The init segment (ftyp + moov) is cached and every moof + mdat
+# fragment is fanned out to all viewers, so adding a viewer costs a socket
+# write rather than another decoder or JPEG encoder.
+import asyncio
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+from collections import deque
+
+FFMPEG_BIN = shutil.which(os.getenv("FFMPEG_BIN", "ffmpeg"))
+PASSTHROUGH_VIDEO_CODEC = os.getenv("PASSTHROUGH_VIDEO_CODEC", "libx264")
+RELAY_BACKLOG = 8           # fragments kept for slow viewers
+RELAY_QUEUE = 30            # decoded frames buffered ahead of the encoder
+RELAY_FRAGMENT_SECONDS = 1.0
+
+
+def read_boxes(stream):
+    """Yields (type, bytes) for each top-level MP4 box read from `stream`."""
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header)
+        if size == 1:
+            ext = stream.read(8)
+            if len(ext) < 8:
+                return
+            size = struct.unpack(">Q", ext)[0]
+            header += ext
+        body = stream.read(size - len(header)) if size else stream.read()
+        yield kind.decode("latin-1"), header + body
+
+
+class FragmentRelay:
+    """
+    Fed by the stream reader through `push(frame)`. The encoder is
+    restarted when the frame size changes (e.g. the source reconnected at
+    another resolution); each restart is a new epoch with its own init
+    segment, and viewers of the old epoch are ended so they reload. The
+    encoder stops when the last viewer leaves and start() brings it back.
+    """
+
+    def __init__(self, fps, width=None, codec=PASSTHROUGH_VIDEO_CODEC):
+        self.fps = fps or 30.0
+        self.width = width      # output width; height follows the aspect ratio
+        self.codec = codec
+        self.init = None        # (epoch, ftyp + moov)
+        self.epoch = 0
+        self.fragments = deque(maxlen=RELAY_BACKLOG)  # (seq, epoch, bytes)
+        self.seq = 0
+        self.viewers = 0
+        self.frames = queue.Queue(maxsize=RELAY_QUEUE)
+        self.frames_in = 0      # frames accepted in this epoch -> output timestamps
+        self.size = None
+        self.running = False
+        self.proc = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _command(self, size):
+        w, h = size
+        gop = max(1, int(round(self.fps * RELAY_FRAGMENT_SECONDS)))
+        cmd = [
+            FFMPEG_BIN, "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", str(self.fps), "-i", "pipe:0",
+        ]
+        if self.width and self.width < w:
+            cmd += ["-vf", f"scale={self.width}:-2"]
+        cmd += ["-c:v", self.codec, "-pix_fmt", "yuv420p", "-g", str(gop), "-keyint_min", str(gop)]
+        if self.codec == "libx264":
+            cmd += ["-preset", "ultrafast", "-tune", "zerolatency"]
+        return cmd + ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof", "pipe:1"]
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            if not FFMPEG_BIN:
+                raise RuntimeError("ffmpeg not found; passthrough relay unavailable")
+            self.running = True
+            self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.frames.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.proc and self.proc.poll() is None:
+            self.proc.kill()
+        if self.thread:
+            self.thread.join(timeout=5)
+        with self.lock:
+            # Ready for a later start(): next push begins a fresh timeline
+            while not self.frames.empty():
+                self.frames.get_nowait()
+            self.size = None
+            self.frames_in = 0
+            self.init = None
+            self.fragments.clear()
+
+    def push(self, frame):
+        """
+        Queues a decoded frame without blocking the reader. Returns the frame's
+        time in the relay's output in ms, or None if it was dropped.
+        """
+        if not self.running:
+            return None
+        size = (frame.shape[1], frame.shape[0])
+        with self.lock:
+            if size != self.size:
+                # New geometry: the encoder restarts and the timeline with it
+                self.size = size
+                self.frames_in = 0
+            try:
+                self.frames.put_nowait((size, frame))
+            except queue.Full:
+                return None
+            ms = self.frames_in * 1000.0 / self.fps
+            self.frames_in += 1
+        return round(ms, 1)
+
+    def _encode_loop(self):
+        item = self.frames.get()
+        while self.running and item is not None:
+            size = item[0]
+            # Viewers must not get the previous epoch's init or fragments with this epoch's
+            self.init = None
+            self.fragments.clear()
+            self.epoch += 1
+            self.proc = subprocess.Popen(
+                self._command(size), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+            drain = threading.Thread(target=self._drain, args=(self.proc.stdout, self.epoch), daemon=True)
+            drain.start()
+            try:
+                while self.running and item is not None and item[0] == size:
+                    self.proc.stdin.write(item[1].tobytes())
+                    item = self.frames.get()
+            except (BrokenPipeError, OSError) as e:
+                print(f"⚠️ Relay encoder failed: {e}")
+                with self.lock:
+                    # Restart the timeline with the next pushed frame
+                    self.size = None
+                    while not self.frames.empty():
+                        self.frames.get_nowait()
+                item = self.frames.get() if self.running else None
+            finally:
+                try:
+                    self.proc.stdin.close()
+                except OSError:
+                    pass
+                drain.join(timeout=5)
+                self.proc.kill()
+                self.proc.wait()
+
+    def _drain(self, stdout, epoch):
+        init, pending = b"", b""
+        for kind, data in read_boxes(stdout):
+            if kind in ("ftyp", "moov"):
+                init += data
+                if kind == "moov":
+                    self.init = (epoch, init)
+            elif kind == "moof":
+                pending = data
+            elif kind == "mdat" and pending:
+                self.seq += 1
+                self.fragments.append((self.seq, epoch, pending + data))
+                pending = b""
+
+    async def subscribe(self, poll_interval=0.02):
+        """
+        Async byte stream for one viewer: init segment, then live fragments.
+        Ends when the encoder restarts, so the player reloads with the new init.
+        The last viewer to leave stops the encoder.
+        """
+        self.viewers += 1
+        try:
+            while self.init is None:
+                if not self.running:
+                    return
+                await asyncio.sleep(poll_interval)
+            epoch, init = self.init
+            yield init
+            # Join at the newest fragment; each one starts on a keyframe
+            last = self.fragments[-1][0] - 1 if self.fragments else self.seq
+            while self.running and self.epoch == epoch:
+                sent = False
+                for seq, frag_epoch, data in list(self.fragments):
+                    if seq > last:
+                        last = seq
+                        if frag_epoch != epoch:
+                            return
+                        sent = True
+                        yield data
+                if not sent:
+                    await asyncio.sleep(poll_interval)
+        finally:
+            self.viewers -= 1
+            if self.viewers == 0:
+                self.stop()
@@ -0,0 +1,88 @@
+# heatmap.py
+# Decayed density heatmap of detection centres on a coarse grid.
+#
+# Decay is applied lazily: new hits are added with weight exp(t / tau)
+# relative to a reference time, and reads scale the grid back down. Each
+# frame therefore costs O(detections), never O(grid cells).
+import math
+import threading
+
+import cv2
+import numpy as np
+
+HEATMAP_GRID = (64, 36)        # cells (w, h) — 20px cells on a 1280x720 stream
+HEATMAP_HALF_LIFE_S = 120.0    # a hit loses half its weight every 2 minutes
+HEATMAP_RERENDER_CHANGE = 0.05 # re-render the PNG after 5% change in mass
+_MAX_EXPONENT = 50.0           # rebase before exp() growth costs precision
+
+
+class DensityHeatmap:
+    def __init__(self, grid=HEATMAP_GRID, half_life_s=HEATMAP_HALF_LIFE_S):
+        self.grid_w, self.grid_h = grid
+        self.rate = math.log(2) / half_life_s
+        self.acc = np.zeros((self.grid_h, self.grid_w), dtype=np.float64)
+        self.t0 = None           # reference time for the inflated weights
+        self.mass = 0.0          # sum of acc, kept in step with np.add.at
+        self.lock = threading.Lock()
+        self._png = None         # (width, bytes) of the last rendered image
+        self._changed = 0.0      # inflated mass added since render
+
+    def add(self, centers, w, h, now):
+        """Adds (N, 2) pixel centres from a w x h frame observed at `now`."""
+        if len(centers) == 0:
+            return
+        gx = np.clip((centers[:, 0] * (self.grid_w / w)).astype(np.intp), 0, self.grid_w - 1)
+        gy = np.clip((centers[:, 1] * (self.grid_h / h)).astype(np.intp), 0, self.grid_h - 1)
+        with self.lock:
+            if self.t0 is None:
+                self.t0 = now
+            exponent = self.rate * (now - self.t0)
+            if exponent > _MAX_EXPONENT:
+                # Rare O(cells) rebase to keep the inflated weights finite
+                scale = math.exp(-exponent)
+                self.acc *= scale
+                self.mass *= scale
+                self._changed *= scale
+                self.t0 = now
+                exponent = 0.0
+            weight = math.exp(exponent)
+            np.add.at(self.acc, (gy, gx), weight)
+            self.mass += weight * len(centers)
+            self._changed += weight * len(centers)
+
+    def _scale(self, now):
+        return math.exp(-self.rate * (now - self.t0)) if self.t0 is not None else 0.0
+
+    def array(self, now):
+        """Current decayed heatmap (hits per cell, newest hit = 1.0)."""
+        with self.lock:
+            return self.acc * self._scale(now)
+
+    def png(self, now, width=640):
+        """
+        Colour-mapped PNG, re-rendered only once new hits changed the grid
+        materially. The image is peak-normalised, so decay alone never changes it.
+        """
+        with self.lock:
+            scale = self._scale(now)
+            mass = self.mass * scale
+            changed = self._changed * scale
+            stale = (
+                self._png is None or self._png[0] != width
+                or changed > HEATMAP_RERENDER_CHANGE * max(mass, 1e-9)
+            )
+            if not stale:
+                return self._png[1]
+            grid = self.acc * scale
+            self._changed = 0.0
+
+        peak = grid.max()
+        norm = (grid * (255.0 / peak)).astype(np.uint8) if peak > 0 else grid.astype(np.uint8)
+        height = max(1, round(width * self.grid_h / self.grid_w))
+        img = cv2.resize(norm, (width, height), interpolation=cv2.INTER_LINEAR)
+        img = cv2.applyColorMap(img, cv2.COLORMAP_JET)
+        _, buffer = cv2.imencode('.png', img)
+        data = buffer.tobytes()
+        with self.lock:
+            self._png = (width, data)
+        return data
@@ -1,4 +1,6 @@
 import os
+import time
+import asyncio
 import uvicorn
 import httpx
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
@@ -18,6 +20,273 @@ app = FastAPI(title="Aerial Vision Gateway (Blind Proxy)")
 
 # ⚠️ UPDATE THIS WITH YOUR RUNNING KAGGLE URL OR SET IN .env
 KAGGLE_BRAIN_URL = os.getenv("KAGGLE_BRAIN_URL", "http://164.52.213.55:8000")
+# Comma-separated engine pool; a single KAGGLE_BRAIN_URL is a pool of one
+BRAIN_URLS = [u.strip().rstrip("/") for u in os.getenv("BRAIN_URLS", KAGGLE_BRAIN_URL).split(",") if u.strip()]
+ENGINE_POLL_INTERVAL = float(os.getenv("ENGINE_POLL_INTERVAL", 5))    # seconds between health polls
+ENGINE_AFFINITY_TTL = 6 * 3600      # how long a job stays pinned to its engine; streams stay until stopped
+
+# One pooled client to the Brain for the whole app: keep-alive connections
+# are reused across requests instead of a TCP/TLS handshake per call
+BRAIN_HEADERS = {"ngrok-skip-browser-warning": "true"}
+BRAIN_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("BRAIN_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(os.getenv("BRAIN_MAX_KEEPALIVE", 20)),
+    keepalive_expiry=60.0,
+)
+# Per-route timeouts (read timeout applies between chunks on streams)
+TIMEOUTS = {
+    "metadata": httpx.Timeout(5.0, connect=3.0),
+    "probe": httpx.Timeout(30.0, connect=5.0),
+    "upload": httpx.Timeout(300.0, connect=60.0),
+    "telemetry": httpx.Timeout(300.0, connect=60.0),
+    "analyze": httpx.Timeout(120.0, connect=30.0),
+    "jobs": httpx.Timeout(30.0, connect=30.0),
+}
+try:
+    import h2  # noqa: F401 — enables HTTP/2 (negotiated over TLS) when installed
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+brain_client: Optional[httpx.AsyncClient] = None
+UPSTREAM_STATS = {"requests": 0, "connections_opened": 0, "http_versions": {}, "upstream_ms": 0.0}
+
+
+async def _trace(event_name, info):
+    # httpcore trace hook: a TCP connect means the pool had no idle connection to reuse
+    if event_name == "connection.connect_tcp.complete":
+        UPSTREAM_STATS["connections_opened"] += 1
+
+
+async def _on_request(request):
+    request.extensions["trace"] = _trace
+    request.extensions["started"] = time.perf_counter()
+    UPSTREAM_STATS["requests"] += 1
+
+
+async def _on_response(response):
+    version = response.http_version
+    UPSTREAM_STATS["http_versions"][version] = UPSTREAM_STATS["http_versions"].get(version, 0) + 1
+    # Time to response headers; streamed bodies are not included
+    UPSTREAM_STATS["upstream_ms"] += (time.perf_counter() - response.request.extensions["started"]) * 1000
+
+
+class EnginePool:
+    """
+    Routes work to the least-loaded healthy engine. Every engine's / and
+    /streams/status are polled each ENGINE_POLL_INTERVAL. Load is the
+    engine's live streams and telemetry sessions plus the requests this
+    gateway has in flight to it, divided by its max_streams. The engine's
+    telemetry count already includes this gateway's sessions once polled,
+    so only the larger of the two figures counts. Analysis jobs
+    and live streams stay pinned to the engine that owns them; a stream
+    missing from the pins is looked up on every engine. If no engine is
+    healthy, requests still go out, so callers see the real error.
+    """
+
+    def __init__(self, urls):
+        if not urls:
+            raise ValueError("BRAIN_URLS (or KAGGLE_BRAIN_URL) must list at least one engine URL")
+        self.engines = {
+            url: {"healthy": False, "active_streams": 0, "active_telemetry": 0, "max_streams": 1,
+                  "inflight": 0, "inflight_telemetry": 0, "routed": 0, "last_seen": None,
+                  "error": "not polled yet"}
+            for url in urls
+        }
+        self.affinity = {}      # job/stream id -> (engine url, expires_at or None)
+        self.task = None
+
+    async def _poll(self, url):
+        state = self.engines[url]
+        try:
+            # Health is judged from / alone; /streams/status only refines the stream count
+            health, streams = await asyncio.gather(
+                brain_client.get(f"{url}/", timeout=TIMEOUTS["metadata"]),
+                brain_client.get(f"{url}/streams/status", timeout=TIMEOUTS["metadata"]),
+                return_exceptions=True,
+            )
+            if isinstance(health, Exception):
+                raise health
+            health.raise_for_status()
+            info = health.json()
+            try:
+                active = streams.json().get("active") if not isinstance(streams, Exception) \
+                    and streams.status_code == 200 else None
+            except ValueError:
+                active = None
+            if not state["healthy"]:
+                print(f"🟢 [POOL] {url} healthy")
+            state.update(
+                healthy=info.get("status") == "online",
+                active_streams=info.get("active_streams", 0) if active is None else active,
+                active_telemetry=info.get("active_telemetry", 0),
+                max_streams=max(1, info.get("max_streams", 1)),
+                last_seen=time.time(), error=None,
+            )
+        except Exception as e:
+            if state["healthy"]:
+                print(f"🔴 [POOL] {url} unhealthy: {e}")
+            state.update(healthy=False, error=str(e) or type(e).__name__)
+
+    async def poll(self):
+        await asyncio.gather(*(self._poll(url) for url in self.engines))
+
+    async def run(self):
+        while True:
+            await self.poll()
+            await asyncio.sleep(ENGINE_POLL_INTERVAL)
+
+    def load(self, url):
+        s = self.engines[url]
+        telemetry = max(s["active_telemetry"], s["inflight_telemetry"])
+        other = s["inflight"] - s["inflight_telemetry"]
+        return (s["active_streams"] + telemetry + other) / s["max_streams"]
+
+    def pick(self):
+        healthy = [url for url, s in self.engines.items() if s["healthy"]]
+        return min(healthy or self.engines, key=self.load)
+
+    def stream_candidates(self):
+        """Engines to try for a new stream, least loaded first: healthy ones with a free slot, else all."""
+        free = [url for url, s in self.engines.items()
+                if s["healthy"] and s["active_streams"] < s["max_streams"]]
+        return sorted(free or self.engines, key=self.load)
+
+    def acquire(self, url=None, telemetry=False):
+        """
+        Engine for a new request (least loaded unless `url` is given); pair with
+        release(). `telemetry` marks a session the engine also reports itself.
+        """
+        url = url or self.pick()
+        self.engines[url]["inflight"] += 1
+        self.engines[url]["inflight_telemetry"] += telemetry
+        self.engines[url]["routed"] += 1
+        return url
+
+    def release(self, url, telemetry=False):
+        self.engines[url]["inflight"] -= 1
+        self.engines[url]["inflight_telemetry"] -= telemetry
+
+    def pin(self, key, url, ttl=ENGINE_AFFINITY_TTL):
+        """Pins `key` to `url` for `ttl` seconds, or until unpinned if `ttl` is None."""
+        now = time.time()
+        for k in [k for k, (_, expires) in self.affinity.items() if expires is not None and expires <= now]:
+            del self.affinity[k]
+        self.affinity[key] = (url, None if ttl is None else now + ttl)
+
+    def pinned(self, key):
+        entry = self.affinity.get(key)
+        return entry[0] if entry and (entry[1] is None or entry[1] > time.time()) else None
+
+    async def locate_stream(self, stream_id):
+        """Engine running `stream_id` according to its /streams/status (re-pinned), or None."""
+        urls = list(self.engines)
+        replies = await asyncio.gather(
+            *(brain_client.get(f"{url}/streams/status", timeout=TIMEOUTS["metadata"]) for url in urls),
+            return_exceptions=True,
+        )
+        for url, reply in zip(urls, replies):
+            if isinstance(reply, Exception) or reply.status_code != 200:
+                continue
+            try:
+                running = stream_id in reply.json().get("streams", {})
+            except ValueError:
+                continue
+            if running:
+                self.pin(f"stream:{stream_id}", url, ttl=None)
+                return url
+        return None
+
+    def snapshot(self):
+        return {url: {**s, "load": round(self.load(url), 3)} for url, s in self.engines.items()}
+
+
+ENGINE_POOL = EnginePool(BRAIN_URLS)
+
+
+@app.on_event("startup")
+async def open_brain_client():
+    global brain_client
+    brain_client = httpx.AsyncClient(
+        headers=BRAIN_HEADERS, limits=BRAIN_LIMITS, http2=HTTP2, timeout=TIMEOUTS["jobs"],
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+    print(f"🔌 Brain client ready (HTTP/2 {'on' if HTTP2 else 'off'}, "
+          f"{BRAIN_LIMITS.max_connections} max / {BRAIN_LIMITS.max_keepalive_connections} keep-alive)")
+    ENGINE_POOL.task = asyncio.create_task(ENGINE_POOL.run())
+    print(f"🧭 Routing across {len(BRAIN_URLS)} engine(s): {', '.join(BRAIN_URLS)}")
+
+
+@app.on_event("shutdown")
+async def close_brain_client():
+    if ENGINE_POOL.task:
+        ENGINE_POOL.task.cancel()
+    if brain_client:
+        await brain_client.aclose()
+
+
+class SWRCache:
+    """
+    Stale-while-revalidate cache for read-mostly Brain endpoints. Values are
+    served straight from memory for `ttl` seconds; after that the stale value
+    is still served at once while a single background refresh runs. If the
+    Brain is unreachable the stale value keeps being served for up to
+    `max_stale` seconds. Only a cold key waits for the Brain.
+    """
+
+    def __init__(self, name, ttl, max_stale):
+        self.name = name
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.entries = {}       # key -> (value, fetched_at)
+        self.refreshing = {}    # key -> in-flight fetch task, shared by concurrent callers
+        self.stats = {"hit": 0, "stale": 0, "miss": 0, "refresh_errors": 0}
+
+    async def get(self, key, fetch):
+        """(value, "hit" | "stale" | "miss"). `fetch` is an async callable that raises on failure."""
+        entry = self.entries.get(key)
+        if entry:
+            age = time.monotonic() - entry[1]
+            if age < self.ttl:
+                self.stats["hit"] += 1
+                return entry[0], "hit"
+            if age < self.max_stale:
+                self.stats["stale"] += 1
+                self._refresh(key, fetch)
+                return entry[0], "stale"
+        self.stats["miss"] += 1
+        # Shielded: a caller disconnecting must not cancel the shared fetch
+        return await asyncio.shield(self._refresh(key, fetch)), "miss"
+
+    def _refresh(self, key, fetch):
+        task = self.refreshing.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, fetch))
+            self.refreshing[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    def _done(self, key, task):
+        self.refreshing.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["refresh_errors"] += 1
+            print(f"⚠️ [CACHE] {self.name} refresh failed for {key!r}: {task.exception()}")
+
+    async def _fetch(self, key, fetch):
+        value = await fetch()
+        self.entries[key] = (value, time.monotonic())
+        return value
+
+    def snapshot(self):
+        return {"ttl": self.ttl, "max_stale": self.max_stale, "keys": len(self.entries), **self.stats}
+
+
+SIMULATIONS_CACHE = SWRCache("simulations", ttl=float(os.getenv("SIMULATIONS_CACHE_TTL", 30)),
+                             max_stale=float(os.getenv("CACHE_MAX_STALE", 86400)))
+PROBE_CACHE = SWRCache("probe", ttl=float(os.getenv("PROBE_CACHE_TTL", 300)),
+                       max_stale=float(os.getenv("CACHE_MAX_STALE", 86400)))
+# "demo": fixed Mark 4.5 recommendation; "engine": the Brain's frame-sampling /probe
+PROBE_MODE = os.getenv("PROBE_MODE", "demo")
 
 # Directory where you store your pre-downloaded scenarios
 SIMULATION_DIR = "./streams" 
@@ -42,17 +311,38 @@ async def probe_stream(payload: dict):
     """
     Simulates a probe but HARDCODES the recommendation for Mark 4.5
     to ensure safety-critical ambulance detection works during demos.
+    With PROBE_MODE=engine the Brain probes the source instead, and its
+    answers are cached per source URL.
     """
     source_url = payload.get("sourceUrl", "")
-    print(f"🕵️ Probing Request for: {source_url}")
-    
-    return {
+
+    demo = {
         "viewType": "AERIAL",
         "recommended_model": "mark4.5",
         "reason": "Governance Protocol: Ironclad Safety Standards Enforced (Ambulance Detection)",
         "is_locked": True
     }
 
+    if PROBE_MODE != "engine":
+        # A constant answer: nothing to cache or revalidate
+        print(f"🕵️ Probing Request for: {source_url}")
+        return JSONResponse(content=demo, headers={"X-Cache": "BYPASS"})
+
+    async def fetch():
+        print(f"🕵️ Probing Request for: {source_url}")
+        response = await brain_client.post(f"{ENGINE_POOL.pick()}/probe", json={"sourceUrl": source_url},
+                                           timeout=TIMEOUTS["probe"])
+        response.raise_for_status()
+        return response.json()
+
+    try:
+        result, state = await PROBE_CACHE.get(source_url, fetch)
+    except Exception as e:
+        # Brain unreachable and nothing cached: the governance default, uncached
+        print(f"⚠️ GPU probe failed, using governance default: {e}")
+        return JSONResponse(content=demo, headers={"X-Cache": "BYPASS"})
+    return JSONResponse(content=result, headers={"X-Cache": state.upper()})
+
 # =========================
 # 2. STREAMING PROXY
 # =========================
@@ -66,63 +356,66 @@ async def stream_generator(file_path: str, model: str):
     1. POST /upload_and_process -> returns {"stream_url": "/telemetry?..."}
     2. GET /telemetry?... -> returns NDJSON stream
     """
-    print(f"🚀 Proxying {file_path} to Brain ({KAGGLE_BRAIN_URL})...")
+    # Upload and telemetry must hit the same engine: it holds the uploaded file
+    brain_url = ENGINE_POOL.acquire(telemetry=True)
+    print(f"🚀 Proxying {file_path} to Brain ({brain_url})...")
     
-    async with httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=60.0)) as client:
-        try:
-            # STEP 1: Upload video to Brain
-            print(f"   📤 Uploading {os.path.basename(file_path)}...")
-            with open(file_path, "rb") as f:
-                files = {"file": (os.path.basename(file_path), f, "video/mp4")}
-                data = {"model": model}
-                
-                upload_response = await client.post(
-                    f"{KAGGLE_BRAIN_URL}/upload_and_process",
-                    files=files,
-                    data=data,
-                    headers={"ngrok-skip-browser-warning": "true"}
-                )
-                
-                if upload_response.status_code != 200:
-                    error_msg = f"Brain upload failed: HTTP {upload_response.status_code}"
-                    print(f"   ❌ {error_msg}")
-                    yield f'{{"error": "{error_msg}"}}\n'
-                    return
-                
-                # Parse the response to get stream_url
-                upload_result = upload_response.json()
-                stream_url = upload_result.get("stream_url")
-                
-                if not stream_url:
-                    yield '{"error": "Brain did not return stream_url"}\n'
-                    return
-                
-                print(f"   ✅ Upload complete. Telemetry URL: {stream_url}")
+    try:
+        # STEP 1: Upload video to Brain
+        print(f"   📤 Uploading {os.path.basename(file_path)}...")
+        with open(file_path, "rb") as f:
+            files = {"file": (os.path.basename(file_path), f, "video/mp4")}
+            data = {"model": model}
+            
+            upload_response = await brain_client.post(
+                f"{brain_url}/upload_and_process",
+                files=files,
+                data=data,
+                timeout=TIMEOUTS["upload"]
+            )
             
-            # STEP 2: Consume NDJSON telemetry stream
-            telemetry_url = f"{KAGGLE_BRAIN_URL}{stream_url}"
-            print(f"   📡 Consuming telemetry from: {telemetry_url}")
+            if upload_response.status_code != 200:
+                error_msg = f"Brain upload failed: HTTP {upload_response.status_code}"
+                print(f"   ❌ {error_msg}")
+                yield f'{{"error": "{error_msg}"}}\n'
+                return
             
-            async with client.stream(
-                "GET",
-                telemetry_url,
-                headers={"ngrok-skip-browser-warning": "true"}
-            ) as telemetry_response:
-                
-                if telemetry_response.status_code != 200:
-                    yield f'{{"error": "Telemetry stream failed: HTTP {telemetry_response.status_code}"}}\n'
-                    return
-                
-                # Forward NDJSON chunks
-                async for chunk in telemetry_response.aiter_bytes():
-                    yield chunk
+            # Parse the response to get stream_url
+            upload_result = upload_response.json()
+            stream_url = upload_result.get("stream_url")
+            
+            if not stream_url:
+                yield '{"error": "Brain did not return stream_url"}\n'
+                return
+            
+            print(f"   ✅ Upload complete. Telemetry URL: {stream_url}")
+        
+        # STEP 2: Consume NDJSON telemetry stream
+        telemetry_url = f"{brain_url}{stream_url}"
+        print(f"   📡 Consuming telemetry from: {telemetry_url}")
+        
+        async with brain_client.stream(
+            "GET",
+            telemetry_url,
+            timeout=TIMEOUTS["telemetry"]
+        ) as telemetry_response:
+            
+            if telemetry_response.status_code != 200:
+                yield f'{{"error": "Telemetry stream failed: HTTP {telemetry_response.status_code}"}}\n'
+                return
+            
+            # Forward NDJSON chunks
+            async for chunk in telemetry_response.aiter_bytes():
+                yield chunk
 
-        except httpx.TimeoutException as e:
-            print(f"🔥 Timeout Error: {e}")
-            yield f'{{"error": "Connection timeout to Brain"}}\n'
-        except Exception as e:
-            print(f"🔥 Proxy Error: {e}")
-            yield f'{{"error": "{str(e)}"}}\n'
+    except httpx.TimeoutException as e:
+        print(f"🔥 Timeout Error: {e}")
+        yield f'{{"error": "Connection timeout to Brain"}}\n'
+    except Exception as e:
+        print(f"🔥 Proxy Error: {e}")
+        yield f'{{"error": "{str(e)}"}}\n'
+    finally:
+        ENGINE_POOL.release(brain_url, telemetry=True)
 
 @app.post("/process-simulation")
 async def process_simulation(
@@ -149,45 +442,47 @@ async def process_simulation(
     print(f"☁️ File {filename} not local, proxying to GPU Brain...")
 
     async def gpu_simulation_stream():
-        async with httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=60.0)) as client:
-            try:
-                # Tell the GPU engine to process its own local simulation file
-                response = await client.post(
-                    f"{KAGGLE_BRAIN_URL}/process-local-simulation",
-                    json={"simulation_id": simulation_id, "model": model},
-                    headers={"ngrok-skip-browser-warning": "true"}
-                )
-                
-                if response.status_code != 200:
-                    yield f'{{"error": "GPU simulation failed: HTTP {response.status_code}"}}' + "\n"
-                    return
+        brain_url = ENGINE_POOL.acquire(telemetry=True)
+        try:
+            # Tell the GPU engine to process its own local simulation file
+            response = await brain_client.post(
+                f"{brain_url}/process-local-simulation",
+                json={"simulation_id": simulation_id, "model": model},
+                timeout=TIMEOUTS["jobs"]
+            )
+            
+            if response.status_code != 200:
+                yield f'{{"error": "GPU simulation failed: HTTP {response.status_code}"}}' + "\n"
+                return
+
+            # GPU returns { stream_url: "/telemetry?..." }
+            result = response.json()
+            stream_url = result.get("stream_url")
+            if not stream_url:
+                yield '{"error": "GPU did not return stream_url"}' + "\n"
+                return
 
-                # GPU returns { stream_url: "/telemetry?..." }
-                result = response.json()
-                stream_url = result.get("stream_url")
-                if not stream_url:
-                    yield '{"error": "GPU did not return stream_url"}' + "\n"
+            # Consume the telemetry NDJSON stream from GPU
+            telemetry_url = f"{brain_url}{stream_url}"
+            print(f"   📡 Consuming GPU telemetry: {telemetry_url}")
+            
+            async with brain_client.stream(
+                "GET", telemetry_url,
+                timeout=TIMEOUTS["telemetry"]
+            ) as telemetry_response:
+                if telemetry_response.status_code != 200:
+                    yield f'{{"error": "Telemetry stream failed: HTTP {telemetry_response.status_code}"}}' + "\n"
                     return
+                async for chunk in telemetry_response.aiter_bytes():
+                    yield chunk
 
-                # Consume the telemetry NDJSON stream from GPU
-                telemetry_url = f"{KAGGLE_BRAIN_URL}{stream_url}"
-                print(f"   📡 Consuming GPU telemetry: {telemetry_url}")
-                
-                async with client.stream(
-                    "GET", telemetry_url,
-                    headers={"ngrok-skip-browser-warning": "true"}
-                ) as telemetry_response:
-                    if telemetry_response.status_code != 200:
-                        yield f'{{"error": "Telemetry stream failed: HTTP {telemetry_response.status_code}"}}' + "\n"
-                        return
-                    async for chunk in telemetry_response.aiter_bytes():
-                        yield chunk
-
-            except httpx.TimeoutException:
-                yield '{"error": "GPU timeout"}' + "\n"
-            except Exception as e:
-                print(f"   ❌ GPU proxy error: {e}")
-                yield f'{{"error": "{str(e)}"}}' + "\n"
+        except httpx.TimeoutException:
+            yield '{"error": "GPU timeout"}' + "\n"
+        except Exception as e:
+            print(f"   ❌ GPU proxy error: {e}")
+            yield f'{{"error": "{str(e)}"}}' + "\n"
+        finally:
+            ENGINE_POOL.release(brain_url, telemetry=True)
 
     return StreamingResponse(gpu_simulation_stream(), media_type="application/x-ndjson")
 
@@ -217,18 +512,21 @@ async def process_upload(
 @app.get("/simulations/list")
 async def list_simulations():
     """
-    Proxy to GPU engine for simulation list.
-    Falls back to local ./streams/ if GPU is unreachable.
+    Proxy to GPU engine for simulation list, cached with stale-while-revalidate.
+    Falls back to local ./streams/ if GPU is unreachable and nothing is cached.
     """
+    async def fetch():
+        response = await brain_client.get(
+            f"{ENGINE_POOL.pick()}/simulations/list",
+            timeout=TIMEOUTS["metadata"]
+        )
+        response.raise_for_status()
+        return response.json()
+
     # Try GPU engine first (it has the video files)
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(
-                f"{KAGGLE_BRAIN_URL}/simulations/list",
-                headers={"ngrok-skip-browser-warning": "true"}
-            )
-            if response.status_code == 200:
-                return response.json()
+        result, state = await SIMULATIONS_CACHE.get("list", fetch)
+        return JSONResponse(content=result, headers={"X-Cache": state.upper()})
     except Exception as e:
         print(f"⚠️ GPU simulations/list failed, falling back to local: {e}")
 
@@ -239,6 +537,91 @@ async def list_simulations():
         "scenarios": [{"id": f.replace(".mp4", ""), "name": f} for f in files]
     }
 
+@app.get("/gateway/stats")
+async def gateway_stats():
+    """Upstream connection reuse: requests sent vs TCP connections opened to the Brain."""
+    requests = UPSTREAM_STATS["requests"]
+    opened = UPSTREAM_STATS["connections_opened"]
+    return {
+        "http2": HTTP2,
+        "max_connections": BRAIN_LIMITS.max_connections,
+        "max_keepalive_connections": BRAIN_LIMITS.max_keepalive_connections,
+        "requests": requests,
+        "connections_opened": opened,
+        "reused_connection_ratio": round(1 - opened / requests, 3) if requests else None,
+        "http_versions": UPSTREAM_STATS["http_versions"],
+        "avg_upstream_ms": round(UPSTREAM_STATS["upstream_ms"] / requests, 1) if requests else None,
+        "cache": {"simulations": SIMULATIONS_CACHE.snapshot(), "probe": PROBE_CACHE.snapshot()},
+        "engines": ENGINE_POOL.snapshot(),
+    }
+
+# =========================
+# LIVE STREAMS
+# =========================
+# (/streams is the static simulation mount, so live streams are routed under /live)
+
+@app.post("/live/start")
+async def start_live_stream(payload: dict):
+    """
+    Starts a live stream on the least-loaded engine with a free slot, moving
+    on to the next one if an engine is full (503) or unreachable. The
+    MJPEG/video URLs in the reply are absolute, so viewers connect to that
+    engine directly.
+    """
+    error = None
+    for brain_url in ENGINE_POOL.stream_candidates():
+        try:
+            response = await brain_client.post(f"{brain_url}/streams/start", json=payload,
+                                               timeout=TIMEOUTS["upload"])
+        except Exception as e:
+            error = JSONResponse(status_code=502, content={"error": f"GPU Brain connection failed: {str(e)}"})
+            continue
+        if response.status_code != 503:
+            break
+        # Full until the next poll says otherwise
+        state = ENGINE_POOL.engines[brain_url]
+        state["active_streams"] = max(state["active_streams"], state["max_streams"])
+        error = None
+    else:
+        if error:
+            return error
+    try:
+        result = response.json()
+    except ValueError:
+        return JSONResponse(status_code=502, content={
+            "error": f"GPU Brain returned HTTP {response.status_code} with an invalid body"})
+    if response.status_code == 200:
+        if not isinstance(result, dict) or "streamId" not in result:
+            return JSONResponse(status_code=502, content={"error": "GPU Brain reply has no streamId"})
+        ENGINE_POOL.pin(f"stream:{result['streamId']}", brain_url, ttl=None)
+        # Counted now rather than at the next poll, so a burst of starts spreads out
+        ENGINE_POOL.engines[brain_url]["active_streams"] += 1
+        for key in ("aiEngineUrl", "playbackUrl", "boxesUrl"):
+            if result.get(key, "").startswith("/"):
+                result[key] = brain_url + result[key]
+        result["engine"] = brain_url
+    return JSONResponse(status_code=response.status_code, content=result)
+
+@app.post("/live/{stream_id}/stop")
+async def stop_live_stream(stream_id: str):
+    brain_url = ENGINE_POOL.pinned(f"stream:{stream_id}") or await ENGINE_POOL.locate_stream(stream_id)
+    if not brain_url:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    try:
+        response = await brain_client.post(f"{brain_url}/streams/{stream_id}/stop", timeout=TIMEOUTS["jobs"])
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"error": f"GPU Brain connection failed: {str(e)}"})
+    try:
+        result = response.json()
+    except ValueError:
+        return JSONResponse(status_code=502, content={
+            "error": f"GPU Brain returned HTTP {response.status_code} with an invalid body"})
+    ENGINE_POOL.affinity.pop(f"stream:{stream_id}", None)
+    if response.status_code == 200 and result.get("success"):
+        state = ENGINE_POOL.engines[brain_url]
+        state["active_streams"] = max(0, state["active_streams"] - 1)
+    return JSONResponse(status_code=response.status_code, content=result)
+
 # =========================
 # SATELLITE TILE ANALYSIS
 # =========================
@@ -250,34 +633,95 @@ async def analyze_tiles(payload: dict):
     Receives { sessionId, tileIds, model } from the Node.js backend
     and forwards it directly to the GPU server.
     """
-    print(f"🧠 Forwarding tile analysis request to GPU Brain...")
+    brain_url = ENGINE_POOL.acquire()
+    print(f"🧠 Forwarding tile analysis request to GPU Brain ({brain_url})...")
     
-    async with httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=30.0)) as client:
+    try:
+        response = await brain_client.post(
+            f"{brain_url}/analyze",
+            json=payload,
+            timeout=TIMEOUTS["analyze"]
+        )
+        
+        if response.status_code != 200:
+            return JSONResponse(
+                status_code=response.status_code,
+                content={"error": f"GPU Brain returned HTTP {response.status_code}"}
+            )
+        
+        return response.json()
+        
+    except httpx.TimeoutException:
+        return JSONResponse(
+            status_code=504,
+            content={"error": "GPU Brain timeout during tile analysis"}
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"GPU Brain connection failed: {str(e)}"}
+        )
+    finally:
+        ENGINE_POOL.release(brain_url)
+
+@app.post("/analyze/stream")
+async def analyze_tiles_stream(payload: dict):
+    """
+    Streams the GPU Brain's NDJSON tile results through as they arrive.
+    The read timeout applies between lines, so session size no longer matters.
+    """
+    async def relay():
+        brain_url = ENGINE_POOL.acquire()
         try:
-            response = await client.post(
-                f"{KAGGLE_BRAIN_URL}/analyze",
+            async with brain_client.stream(
+                "POST", f"{brain_url}/analyze/stream",
                 json=payload,
-                headers={"ngrok-skip-browser-warning": "true"}
-            )
-            
-            if response.status_code != 200:
-                return JSONResponse(
-                    status_code=response.status_code,
-                    content={"error": f"GPU Brain returned HTTP {response.status_code}"}
-                )
-            
-            return response.json()
-            
+                timeout=TIMEOUTS["analyze"]
+            ) as response:
+                if response.status_code != 200:
+                    yield f'{{"type": "error", "error": "GPU Brain returned HTTP {response.status_code}"}}\n'
+                    return
+                async for chunk in response.aiter_bytes():
+                    yield chunk
         except httpx.TimeoutException:
-            return JSONResponse(
-                status_code=504,
-                content={"error": "GPU Brain timeout during tile analysis"}
-            )
+            yield '{"type": "error", "error": "GPU Brain timeout during tile analysis"}\n'
         except Exception as e:
-            return JSONResponse(
-                status_code=500,
-                content={"error": f"GPU Brain connection failed: {str(e)}"}
-            )
+            yield f'{{"type": "error", "error": "GPU Brain connection failed: {str(e)}"}}\n'
+        finally:
+            ENGINE_POOL.release(brain_url)
+
+    return StreamingResponse(relay(), media_type="application/x-ndjson")
+
+@app.post("/analyze/jobs")
+async def create_analyze_job(payload: dict):
+    """Starts a background tile analysis job on the least-loaded GPU Brain."""
+    brain_url = ENGINE_POOL.pick()
+    try:
+        response = await brain_client.post(
+            f"{brain_url}/analyze/jobs",
+            json=payload,
+            timeout=TIMEOUTS["jobs"]
+        )
+        result = response.json()
+        if "jobId" in result:
+            # Job state lives in that engine's memory: polls must go back to it
+            ENGINE_POOL.pin(f"job:{result['jobId']}", brain_url)
+        return JSONResponse(status_code=response.status_code, content=result)
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"error": f"GPU Brain connection failed: {str(e)}"})
+
+@app.get("/analyze/jobs/{job_id}")
+async def analyze_job_status(job_id: str, since: int = 0):
+    """Polls a tile analysis job; `since` pages through tile results."""
+    try:
+        response = await brain_client.get(
+            f"{ENGINE_POOL.pinned(f'job:{job_id}') or ENGINE_POOL.pick()}/analyze/jobs/{job_id}",
+            params={"since": since},
+            timeout=TIMEOUTS["jobs"]
+        )
+        return JSONResponse(status_code=response.status_code, content=response.json())
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"error": f"GPU Brain connection failed: {str(e)}"})
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8001))
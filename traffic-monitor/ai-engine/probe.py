@@ -0,0 +1,123 @@
+# probe.py
+# Source probing: how big are the objects, and how much resolution do they need?
+#
+# A handful of frames spread over the source are run through the model at
+# the full inference size. The normalised box sizes give the view type
+# (same area threshold as the TensorRT pipeline's probe) and the smallest
+# input size at which the small end of the distribution still spans
+# PROBE_MIN_OBJECT_PX model pixels. Ground cameras, whose vehicles are
+# already large, then run at 640 instead of 1280. A source with no
+# detections in the sample also gets the cheapest size rather than the largest.
+import os
+from contextlib import nullcontext
+
+import cv2
+import numpy as np
+
+from detections import Detections
+
+PROBE_FRAMES = int(os.getenv("PROBE_FRAMES", 5))
+PROBE_LIVE_STRIDE = 15          # frames skipped between samples on live sources
+PROBE_CONF = 0.35
+PROBE_MIN_OBJECT_PX = int(os.getenv("PROBE_MIN_OBJECT_PX", 16))   # short box side the model needs
+PROBE_SMALL_QUANTILE = 10       # percentile of object size that must stay detectable
+PROBE_IMGSZ_CHOICES = (640, 960, 1280)
+AERIAL_AREA = 0.008             # mean normalised box area below this -> AERIAL
+VIEW_MODELS = {"AERIAL": "mark-3", "GROUND": "mark-5"}
+
+
+def sample_frames(source, n=PROBE_FRAMES):
+    """Up to `n` frames: spread evenly over a file, or PROBE_LIVE_STRIDE apart on a live source."""
+    cap = cv2.VideoCapture(source)
+    frames = []
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for i in range(n):
+            if total > n:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, (i * total) // n)
+            elif i:
+                for _ in range(PROBE_LIVE_STRIDE):
+                    cap.grab()
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(frame)
+    finally:
+        cap.release()
+    return frames
+
+
+def object_scales(model, frames, imgsz, classes=None):
+    """(N, 2) normalised (w, h) of every detection across `frames`."""
+    scales = []
+    for frame, result in zip(frames, model.predict(frames, imgsz=imgsz, conf=PROBE_CONF,
+                                                  classes=classes, verbose=False)):
+        h, w = frame.shape[:2]
+        scales.append(Detections.from_result(result).xywh[:, 2:] / (w, h))
+    return np.concatenate(scales) if scales else np.empty((0, 2), dtype=np.float32)
+
+
+def recommend(scales, frame_shape, max_imgsz=PROBE_IMGSZ_CHOICES[-1]):
+    """View type, model and the smallest imgsz that keeps small objects PROBE_MIN_OBJECT_PX wide."""
+    if len(scales) == 0:
+        return {
+            "viewType": "GROUND", "recommended_model": VIEW_MODELS["GROUND"],
+            "recommended_imgsz": PROBE_IMGSZ_CHOICES[0], "objects": 0,
+            "reason": f"No objects detected; using the cheapest {PROBE_IMGSZ_CHOICES[0]}px.",
+        }
+    h, w = frame_shape[:2]
+    # Letterboxing maps the long frame side onto imgsz
+    sides = np.minimum(scales[:, 0] * w, scales[:, 1] * h) / max(h, w)
+    small = float(np.percentile(sides, PROBE_SMALL_QUANTILE))
+    imgsz = next((s for s in PROBE_IMGSZ_CHOICES if s <= max_imgsz and small * s >= PROBE_MIN_OBJECT_PX),
+                 max_imgsz)
+    area = float(np.mean(scales[:, 0] * scales[:, 1]))
+    view = "AERIAL" if area < AERIAL_AREA else "GROUND"
+    return {
+        "viewType": view, "recommended_model": VIEW_MODELS[view], "recommended_imgsz": imgsz,
+        "objects": len(scales),
+        "scale": {
+            "mean_area": round(area, 5),
+            "median_area": round(float(np.median(scales[:, 0] * scales[:, 1])), 5),
+            "small_side": round(small, 4),              # fraction of the long frame side
+            "small_side_px": round(small * imgsz, 1),   # at the recommended imgsz
+        },
+        "reason": f"{view}: mean object area {area:.4f}, small objects {small * imgsz:.0f}px at {imgsz}px.",
+    }
+
+
+def probe_source(model, source, max_imgsz=PROBE_IMGSZ_CHOICES[-1], classes=None, n=PROBE_FRAMES, lock=None):
+    """
+    Samples `source` and returns recommend()'s dict plus the frame count, or
+    None if unreadable. `lock` is held around inference only, not the reads.
+    """
+    frames = sample_frames(source, n)
+    if not frames:
+        return None
+    with lock or nullcontext():
+        scales = object_scales(model, frames, max_imgsz, classes)
+    result = recommend(scales, frames[0].shape, max_imgsz)
+    result["frames"] = len(frames)
+    return result
+
+
+# ==========================================
+# BENCHMARK: python probe.py <weights.pt> <video>
+# Probe result, then ms/frame and boxes at the recommended imgsz vs 1280
+# ==========================================
+if __name__ == "__main__":
+    import sys
+    import time
+    from ultralytics import YOLO
+
+    model = YOLO(sys.argv[1], task="detect")
+    profile = probe_source(model, sys.argv[2])
+    print(profile)
+    if profile:
+        frames = sample_frames(sys.argv[2], 30)
+        for imgsz in sorted({profile["recommended_imgsz"], PROBE_IMGSZ_CHOICES[-1]}):
+            model.predict(frames[0], imgsz=imgsz, verbose=False)
+            start = time.perf_counter()
+            boxes = sum(len(r.boxes) for f in frames for r in model.predict(f, imgsz=imgsz, verbose=False))
+            ms = (time.perf_counter() - start) / len(frames) * 1000
+            print(f"imgsz {imgsz:>4} | {ms:>7.1f} ms/frame | {boxes:>5} boxes")
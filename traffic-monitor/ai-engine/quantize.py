@@ -0,0 +1,157 @@
+# quantize.py
+# INT8 post-training quantisation of the mark models for CPU nodes.
+#
+#   python quantize.py [--dataset datasets/traffic_data/data.yaml] [--imgsz 640 960 1280] [model names...]
+#
+# Calibration images are frames sampled evenly from every SIMULATION_DIR
+# video plus a sample of the prepare_dataset.py training split, so the
+# activation ranges match the footage the engine actually sees. Each model
+# is exported to OpenVINO INT8 (NNCF), validated against its FP32 weights
+# on the dataset's val split, and registered in CACHE_PATH/quantized.json.
+# The engine then exposes it as "<name>-int8" next to MODEL_PATHS.
+#
+# OpenVINO artifacts are static-shape, so one is built per --imgsz (by
+# default every size the resolution probe can pick) and the engine runs a
+# stream on the artifact exported at that stream's imgsz.
+import os
+import json
+import glob
+import random
+import argparse
+
+import cv2
+import yaml
+from ultralytics import YOLO
+
+from artifacts import compile_model, QUANTIZED_REGISTRY
+from probe import PROBE_IMGSZ_CHOICES
+
+CACHE_PATH = os.getenv("MODEL_PATH", "/root/aerial-engine/models")
+SIMULATION_DIR = os.getenv("SIMULATION_DIR", "./streams")
+QUANT_DATASET = os.getenv("QUANT_DATASET", "datasets/traffic_data/data.yaml")   # prepare_dataset.py output
+CALIB_FRAMES_PER_VIDEO = 40
+CALIB_DATASET_IMAGES = 300
+REPORT_NAME = "quantization_report.json"
+
+
+def build_calibration_set(out_dir, dataset_yaml, frames_per_video=CALIB_FRAMES_PER_VIDEO,
+                          dataset_images=CALIB_DATASET_IMAGES, seed=0):
+    """Writes calibration images plus a dataset YAML for the exporter. Returns the YAML path."""
+    img_dir = os.path.join(out_dir, "images")
+    os.makedirs(img_dir, exist_ok=True)
+    count = 0
+
+    for video in sorted(glob.glob(os.path.join(SIMULATION_DIR, "*.mp4"))):
+        cap = cv2.VideoCapture(video)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        stem = os.path.splitext(os.path.basename(video))[0].replace(" ", "_")
+        for i in range(frames_per_video):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, i * max(1, total // frames_per_video))
+            ok, frame = cap.read()
+            if not ok:
+                break
+            cv2.imwrite(os.path.join(img_dir, f"{stem}_{i:03d}.jpg"), frame)
+            count += 1
+        cap.release()
+
+    names = None
+    if os.path.exists(dataset_yaml):
+        with open(dataset_yaml) as f:
+            data = yaml.safe_load(f)
+        names = data.get("names")
+        root = data.get("path") or os.path.dirname(os.path.abspath(dataset_yaml))
+        train_dir = os.path.join(root, data.get("train", "images/train"))
+        images = sorted(glob.glob(os.path.join(train_dir, "*")))
+        random.Random(seed).shuffle(images)
+        for path in images[:dataset_images]:
+            link = os.path.join(img_dir, "ds_" + os.path.basename(path))
+            if not os.path.lexists(link):
+                os.symlink(os.path.abspath(path), link)
+            count += 1
+    else:
+        print(f"⚠️ {dataset_yaml} not found; calibrating on video frames only")
+
+    if count == 0:
+        raise RuntimeError("No calibration images: add videos to SIMULATION_DIR or run prepare_dataset.py")
+    calib_yaml = os.path.join(out_dir, "calibration.yaml")
+    with open(calib_yaml, "w") as f:
+        yaml.safe_dump({"path": os.path.abspath(out_dir), "train": "images", "val": "images",
+                        "names": names or {0: "vehicle"}}, f)
+    print(f"📸 {count} calibration images in {img_dir}")
+    return calib_yaml
+
+
+def evaluate(model_path, dataset_yaml, imgsz):
+    """(mAP50-95, mAP50, CPU inference ms/image) on the dataset's val split."""
+    metrics = YOLO(model_path, task="detect").val(
+        data=dataset_yaml, imgsz=imgsz, batch=1, device="cpu", plots=False, verbose=False
+    )
+    return float(metrics.box.map), float(metrics.box.map50), float(metrics.speed["inference"])
+
+
+def quantize(weights, calib_yaml, dataset_yaml, imgsz, cache_dir):
+    """Builds the INT8 artifact and its report entry."""
+    fp32 = compile_model(weights, "openvino", imgsz, batch=1, cache_dir=cache_dir)
+    int8 = compile_model(weights, "openvino", imgsz, batch=1, cache_dir=cache_dir, int8=True, data=calib_yaml)
+    entry = {"path": int8, "fp32_path": fp32, "imgsz": imgsz}
+    if os.path.exists(dataset_yaml):
+        base_map, base_map50, base_ms = evaluate(fp32, dataset_yaml, imgsz)
+        q_map, q_map50, q_ms = evaluate(int8, dataset_yaml, imgsz)
+        entry.update({
+            "fp32_ms": round(base_ms, 2), "int8_ms": round(q_ms, 2),
+            "speedup": round(base_ms / q_ms, 2) if q_ms else None,
+            "fp32_map50_95": round(base_map, 4), "int8_map50_95": round(q_map, 4),
+            "map50_95_delta": round(q_map - base_map, 4), "map50_delta": round(q_map50 - base_map50, 4),
+        })
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 quantisation of the mark models")
+    parser.add_argument("models", nargs="*", help="weights stems, e.g. mark4.5 (default: all mark*.pt)")
+    parser.add_argument("--dataset", default=QUANT_DATASET)
+    # Artifacts are static-shape: one per size the engine runs streams at
+    parser.add_argument("--imgsz", type=int, nargs="+", default=list(PROBE_IMGSZ_CHOICES))
+    args = parser.parse_args()
+
+    weights_files = sorted(glob.glob(os.path.join(CACHE_PATH, "mark*.pt")))
+    if args.models:
+        weights_files = [w for w in weights_files if os.path.splitext(os.path.basename(w))[0] in args.models]
+    cache_dir = os.path.join(CACHE_PATH, "compiled")
+    calib_yaml = build_calibration_set(os.path.join(cache_dir, "calibration"), args.dataset)
+
+    registry_path = os.path.join(CACHE_PATH, QUANTIZED_REGISTRY)
+    try:
+        with open(registry_path) as f:
+            registry = json.load(f)
+    except (OSError, ValueError):
+        registry = {}
+
+    for weights in weights_files:
+        stem = os.path.splitext(os.path.basename(weights))[0]
+        print(f"\n🔧 {stem}")
+        sizes = registry.setdefault(stem, {})
+        for imgsz in args.imgsz:
+            try:
+                sizes[str(imgsz)] = quantize(weights, calib_yaml, args.dataset, imgsz, cache_dir)
+            except Exception as e:
+                print(f"   ❌ {stem} at {imgsz}px failed: {e}")
+                continue
+            with open(registry_path, "w") as f:
+                json.dump(registry, f, indent=2)
+
+    with open(os.path.join(CACHE_PATH, REPORT_NAME), "w") as f:
+        json.dump(registry, f, indent=2)
+    print(f"\n{'model':>10} | {'imgsz':>5} | {'fp32 ms':>7} | {'int8 ms':>7} | {'speedup':>7} | "
+          f"{'ΔmAP50-95':>9} | {'ΔmAP50':>7}")
+    for stem, sizes in registry.items():
+        for imgsz, e in sorted(sizes.items(), key=lambda kv: int(kv[0])):
+            if "int8_ms" in e:
+                print(f"{stem:>10} | {imgsz:>5} | {e['fp32_ms']:>7.1f} | {e['int8_ms']:>7.1f} | "
+                      f"{e['speedup']:>6.2f}x | {e['map50_95_delta']:>+9.4f} | {e['map50_delta']:>+7.4f}")
+            else:
+                print(f"{stem:>10} | {imgsz:>5} | (no labelled val split — latency/mAP not measured)")
+
+
+if __name__ == "__main__":
+    main()
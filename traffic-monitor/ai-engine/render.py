@@ -0,0 +1,229 @@
+# render.py
+# Faint bounding box renderer.
+#
+# Blending is confined to the rectangles the boxes and labels actually cover:
+# overlapping boxes are grouped, and each group is composited in place on its
+# own sub-image. Labels are pre-rendered sprites cached per text and colour.
+# Render cost therefore follows box area rather than frame area. Dense scenes
+# (many boxes, or boxes covering most of the frame) skip grouping and blend
+# the full frame once, which is cheaper there.
+import cv2
+import numpy as np
+
+# Faint bounding box styling
+BOX_ALPHA = 0.35            # 35% opacity for subtle overlay
+BOX_THICKNESS = 1           # Thin 1px border
+LABEL_FONT_SCALE = 0.45     # Small, non-intrusive labels
+LABEL_ALPHA = 0.5           # 50% opacity for text background
+# Class colours (BGR) — muted palette so boxes don't dominate the frame
+CLASS_COLORS = {
+    0: (180, 140, 100),   # person — muted blue
+    2: (160, 160, 140),   # car — soft grey-green
+    3: (140, 160, 180),   # motorcycle — warm grey
+    5: (120, 150, 180),   # bus — muted amber
+    7: (150, 130, 160),   # truck — soft purple
+    4: (100, 220, 100),   # ambulance — green (stands out intentionally)
+}
+DEFAULT_COLOR = (160, 160, 160)  # Neutral grey for unknown classes
+
+LABEL_SPRITE_CACHE_MAX = 4096    # classes x 101 confidence buckets fits easily
+# Above this share of the frame, one full-frame pass is cheaper than many ROIs
+FULL_FRAME_BLEND_RATIO = 0.6
+# Grouping is quadratic in boxes: past this count it costs more than it saves
+FULL_FRAME_MAX_BOXES = 100
+# Summed box+label extents before grouping; merged groups cover about twice this
+FULL_FRAME_EXTENT_RATIO = 0.4
+_label_sprites = {}
+
+
+def _label_sprite(label, color):
+    """Label background + text, rendered once per (text, colour)."""
+    key = (label, color)
+    sprite = _label_sprites.get(key)
+    if sprite is None:
+        (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, LABEL_FONT_SCALE, 1)
+        # Same geometry as an inclusive (tw + 6) x (th + 6) label rectangle
+        sprite = np.empty((th + 7, tw + 7, 3), dtype=np.uint8)
+        sprite[:] = color
+        cv2.putText(
+            sprite, label, (3, th + 3),
+            cv2.FONT_HERSHEY_SIMPLEX, LABEL_FONT_SCALE, (255, 255, 255), 1, cv2.LINE_AA
+        )
+        if len(_label_sprites) >= LABEL_SPRITE_CACHE_MAX:
+            _label_sprites.clear()
+        _label_sprites[key] = sprite
+    return sprite
+
+
+def _group_extents(ext):
+    """
+    Merges overlapping [x1, y1, x2, y2) extents until the groups are disjoint.
+    Returns (group rects, group label per input extent).
+    """
+    owner = np.arange(len(ext))
+    rects = ext
+    while True:
+        n = len(rects)
+        overlap = (
+            (rects[:, None, 0] < rects[None, :, 2]) & (rects[None, :, 0] < rects[:, None, 2]) &
+            (rects[:, None, 1] < rects[None, :, 3]) & (rects[None, :, 1] < rects[:, None, 3])
+        )
+        if overlap.sum() == n:
+            return rects, owner
+        # Connected components by min-label propagation with pointer jumping
+        labels = np.arange(n)
+        while True:
+            nxt = np.where(overlap, labels[None, :], n).min(axis=1)
+            nxt = nxt[nxt]
+            if np.array_equal(nxt, labels):
+                break
+            labels = nxt
+        _, labels = np.unique(labels, return_inverse=True)
+        merged = np.empty((labels.max() + 1, 4), dtype=rects.dtype)
+        merged[:, :2] = np.iinfo(rects.dtype).max
+        merged[:, 2:] = np.iinfo(rects.dtype).min
+        np.minimum.at(merged[:, 0], labels, rects[:, 0])
+        np.minimum.at(merged[:, 1], labels, rects[:, 1])
+        np.maximum.at(merged[:, 2], labels, rects[:, 2])
+        np.maximum.at(merged[:, 3], labels, rects[:, 3])
+        owner = labels[owner]
+        rects = merged
+
+
+def render_boxes(frame, xyxy, confs, classes, names):
+    """
+    Draws semi-transparent bounding boxes with thin borders and subtle labels
+    onto `frame` in place and returns it.
+    """
+    n = len(xyxy)
+    if n == 0:
+        return frame
+    h, w = frame.shape[:2]
+
+    coords = xyxy.astype(np.int64)
+    sprites = []
+    ext = np.empty((n, 4), dtype=np.int64)
+    pad = BOX_THICKNESS
+    for i, ((x1, y1, x2, y2), conf, cls) in enumerate(zip(coords.tolist(), confs.tolist(), classes.tolist())):
+        color = CLASS_COLORS.get(cls, DEFAULT_COLOR)
+        sprite = _label_sprite(f"{names.get(cls, f'cls_{cls}')} {conf:.0%}", color)
+        sh, sw = sprite.shape[:2]
+        lx, ly = x1, y1 - sh + 1
+        if ly < 0:
+            ly = y2
+        sprites.append((color, sprite, lx, ly))
+        ext[i] = (
+            min(x1, x2, lx) - pad, min(y1, y2, ly) - pad,
+            max(x1, x2, lx + sw - 1) + pad + 1, max(y1, y2, ly + sh - 1) + pad + 1,
+        )
+
+    np.clip(ext[:, 0::2], 0, w, out=ext[:, 0::2])
+    np.clip(ext[:, 1::2], 0, h, out=ext[:, 1::2])
+    visible = (ext[:, 0] < ext[:, 2]) & (ext[:, 1] < ext[:, 3])
+    if not visible.any():
+        return frame
+    keep = np.flatnonzero(visible)
+    full_frame = np.array([[0, 0, w, h]], dtype=np.int64)
+    ext = ext[keep]
+    # Decide before grouping when the scene is dense enough that grouping cannot pay off
+    ext_area = ((ext[:, 2] - ext[:, 0]) * (ext[:, 3] - ext[:, 1])).sum()
+    if len(keep) > FULL_FRAME_MAX_BOXES or ext_area > FULL_FRAME_EXTENT_RATIO * w * h:
+        rects, owner = full_frame, np.zeros(len(keep), dtype=np.int64)
+    else:
+        rects, owner = _group_extents(ext)
+        areas = (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])
+        if areas.sum() > FULL_FRAME_BLEND_RATIO * w * h:
+            rects, owner = full_frame, np.zeros(len(keep), dtype=np.int64)
+
+    members = [[] for _ in range(len(rects))]
+    for i, g in zip(keep.tolist(), owner.tolist()):
+        members[g].append(i)
+
+    for (gx1, gy1, gx2, gy2), idx in zip(rects.tolist(), members):
+        sub = frame[gy1:gy2, gx1:gx2]
+        overlay = sub.copy()
+        label_overlay = sub.copy()
+        sub_h, sub_w = sub.shape[:2]
+
+        for i in idx:
+            x1, y1, x2, y2 = coords[i].tolist()
+            color, sprite, lx, ly = sprites[i]
+            p1, p2 = (x1 - gx1, y1 - gy1), (x2 - gx1, y2 - gy1)
+
+            # --- Faint filled rectangle (subtle highlight) ---
+            cv2.rectangle(overlay, p1, p2, color, -1)
+            # --- Thin border ---
+            cv2.rectangle(sub, p1, p2, color, BOX_THICKNESS)
+
+            # --- Cached label sprite, cropped to the group ---
+            lx, ly = lx - gx1, ly - gy1
+            sx1, sy1 = max(0, -lx), max(0, -ly)
+            dx1, dy1 = lx + sx1, ly + sy1
+            dx2 = min(sub_w, lx + sprite.shape[1])
+            dy2 = min(sub_h, ly + sprite.shape[0])
+            if dx2 > dx1 and dy2 > dy1:
+                label_overlay[dy1:dy2, dx1:dx2] = sprite[sy1:sy1 + dy2 - dy1, sx1:sx1 + dx2 - dx1]
+
+        # Alpha blend: faint fill, then label background
+        sub[:] = cv2.addWeighted(overlay, BOX_ALPHA, sub, 1 - BOX_ALPHA, 0)
+        sub[:] = cv2.addWeighted(label_overlay, LABEL_ALPHA, sub, 1 - LABEL_ALPHA, 0)
+
+    return frame
+
+
+# ==========================================
+# BENCHMARK: python render.py
+# ==========================================
+if __name__ == "__main__":
+    import time
+
+    def draw_full_frame(frame, xyxy, confs, classes, names):
+        """Previous renderer: two full-frame copies and two full-frame blends."""
+        overlay = frame.copy()
+        label_overlay = frame.copy()
+        for box, conf, cls in zip(xyxy, confs, classes):
+            x1, y1, x2, y2 = int(box[0]), int(box[1]), int(box[2]), int(box[3])
+            color = CLASS_COLORS.get(int(cls), DEFAULT_COLOR)
+            class_name = names.get(int(cls), f"cls_{cls}")
+            cv2.rectangle(overlay, (x1, y1), (x2, y2), color, -1)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, BOX_THICKNESS)
+            label = f"{class_name} {conf:.0%}"
+            (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, LABEL_FONT_SCALE, 1)
+            label_x1, label_y1 = x1, y1 - th - 6
+            label_x2, label_y2 = x1 + tw + 6, y1
+            if label_y1 < 0:
+                label_y1 = y2
+                label_y2 = y2 + th + 6
+            cv2.rectangle(label_overlay, (label_x1, label_y1), (label_x2, label_y2), color, -1)
+            cv2.putText(
+                label_overlay, label, (label_x1 + 3, label_y2 - 3),
+                cv2.FONT_HERSHEY_SIMPLEX, LABEL_FONT_SCALE, (255, 255, 255), 1, cv2.LINE_AA
+            )
+        frame = cv2.addWeighted(overlay, BOX_ALPHA, frame, 1 - BOX_ALPHA, 0)
+        return cv2.addWeighted(label_overlay, LABEL_ALPHA, frame, 1 - LABEL_ALPHA, 0)
+
+    rng = np.random.default_rng(0)
+    names = {0: "person", 2: "car", 3: "motorcycle", 4: "ambulance", 5: "bus", 7: "truck"}
+    base = rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+    reps = 20
+
+    print(f"{'boxes':>5} | {'full-frame (ms)':>15} | {'ROI (ms)':>8} | identical")
+    for n in (0, 1, 3, 10, 30, 100, 300):
+        # Aerial-scale boxes: 15-60px vehicles anywhere in the frame
+        wh = rng.uniform(15, 60, (n, 2))
+        xy = rng.uniform(-20, [1280, 720], (n, 2))
+        xyxy = np.hstack([xy, xy + wh]).astype(np.float32)
+        confs = rng.uniform(0.25, 1.0, n).astype(np.float32)
+        classes = rng.choice([2, 3, 4, 5, 7], n)
+
+        start = time.perf_counter()
+        for _ in range(reps):
+            expected = draw_full_frame(base.copy(), xyxy, confs, classes, names)
+        full_ms = (time.perf_counter() - start) / reps * 1000
+
+        start = time.perf_counter()
+        for _ in range(reps):
+            got = render_boxes(base.copy(), xyxy, confs, classes, names)
+        roi_ms = (time.perf_counter() - start) / reps * 1000
+
+        print(f"{n:>5} | {full_ms:>15.2f} | {roi_ms:>8.2f} | {np.array_equal(expected, got)}")
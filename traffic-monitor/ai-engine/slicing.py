@@ -0,0 +1,144 @@
+# slicing.py
+# Sliced inference for large aerial frames and stitched tiles.
+#
+# The image is cut into overlapping windows that the model sees at native
+# resolution; windows are batched through the model and detections are
+# merged across seams with class-aware NMS. Boxes touching an interior seam
+# are left to the neighbouring window, which sees them whole, and a cheap
+# downscaled full-image pass keeps vehicles larger than the overlap.
+# Featureless windows (no-data borders, water, flat roofs) can be skipped.
+import os
+
+import cv2
+import numpy as np
+import torch
+import torchvision
+from ultralytics.engine.results import Results
+
+from artifacts import batch_limit
+
+SLICE_WINDOW = int(os.getenv("SLICE_WINDOW", 640))      # window side, also its imgsz
+SLICE_OVERLAP = 0.2                                      # fraction of the window
+SLICE_BATCH = int(os.getenv("SLICE_BATCH", 16))          # windows per model call (capped by the artifact batch)
+SLICE_MERGE_IOU = 0.5                                    # NMS IoU across seams
+SLICE_EDGE_MARGIN = 2                                    # px from an interior seam
+# imgsz of the whole-image pass for large vehicles; 0 disables it
+SLICE_FULL_PASS_IMGSZ = int(os.getenv("SLICE_FULL_PASS_IMGSZ", 640))
+SLICE_SKIP_EMPTY = os.getenv("SLICE_SKIP_EMPTY", "1") == "1"
+SLICE_EMPTY_STD = 6.0       # grey-level std (on a 32x32 thumbnail) below which a window is empty
+
+
+def slice_windows(height, width, window=SLICE_WINDOW, overlap=SLICE_OVERLAP):
+    """Overlapping (x1, y1, x2, y2) windows covering the image; the last row/column is edge-aligned."""
+    step = max(1, int(window * (1 - overlap)))
+
+    def starts(n):
+        if n <= window:
+            return [0]
+        return list(range(0, n - window, step)) + [n - window]
+
+    return [
+        (x, y, min(x + window, width), min(y + window, height))
+        for y in starts(height) for x in starts(width)
+    ]
+
+
+def is_empty_window(crop):
+    thumb = cv2.resize(crop, (32, 32), interpolation=cv2.INTER_AREA)
+    return float(cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY).std()) < SLICE_EMPTY_STD
+
+
+def _drop_seam_boxes(det, win, width, height):
+    """Drops boxes cut by an interior seam and shifts the rest into image coordinates."""
+    x1, y1, x2, y2 = win
+    m = SLICE_EDGE_MARGIN
+    keep = torch.ones(len(det), dtype=torch.bool, device=det.device)
+    if x1 > 0:
+        keep &= det[:, 0] > m
+    if y1 > 0:
+        keep &= det[:, 1] > m
+    if x2 < width:
+        keep &= det[:, 2] < (x2 - x1) - m
+    if y2 < height:
+        keep &= det[:, 3] < (y2 - y1) - m
+    det = det[keep]
+    det[:, [0, 2]] += x1
+    det[:, [1, 3]] += y1
+    return det
+
+
+def sliced_predict(model, image, conf, iou=0.7, classes=None, window=SLICE_WINDOW,
+                   overlap=SLICE_OVERLAP, skip_empty=SLICE_SKIP_EMPTY,
+                   full_pass_imgsz=SLICE_FULL_PASS_IMGSZ, output_image=None):
+    """
+    Sliced equivalent of `model.predict(image)`. Returns a one-element list
+    of ultralytics Results so callers can use it like a normal prediction.
+    With `output_image`, boxes are rescaled onto that (resized) image.
+    """
+    height, width = image.shape[:2]
+    windows = slice_windows(height, width, window, overlap)
+    if skip_empty:
+        windows = [w for w in windows if not is_empty_window(image[w[1]:w[3], w[0]:w[2]])]
+
+    kwargs = dict(conf=conf, iou=iou, classes=classes, verbose=False)
+    batch = min(SLICE_BATCH, batch_limit(model) or SLICE_BATCH)
+    parts = []
+    for i in range(0, len(windows), batch):
+        group = windows[i:i + batch]
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in group]
+        for win, pred in zip(group, model.predict(crops, imgsz=window, **kwargs)):
+            if len(pred.boxes):
+                parts.append(_drop_seam_boxes(pred.boxes.data[:, :6], win, width, height))
+    if full_pass_imgsz:
+        pred = model.predict(image, imgsz=full_pass_imgsz, **kwargs)[0]
+        parts.append(pred.boxes.data[:, :6])
+
+    parts = [p for p in parts if len(p)]
+    if parts:
+        det = torch.cat([p.to(parts[0].device) for p in parts])
+        det = det[torchvision.ops.batched_nms(det[:, :4], det[:, 4], det[:, 5].int(), SLICE_MERGE_IOU)]
+    else:
+        det = torch.zeros((0, 6))
+
+    out = image
+    if output_image is not None:
+        out = output_image
+        oh, ow = output_image.shape[:2]
+        det[:, [0, 2]] *= ow / width
+        det[:, [1, 3]] *= oh / height
+    return [Results(out, path="", names=model.names, boxes=det)]
+
+
+# ==========================================
+# BENCHMARK: python slicing.py <weights.pt> <image> [imgsz]
+# ==========================================
+if __name__ == "__main__":
+    import sys
+    import time
+    from ultralytics import YOLO
+
+    weights, path = sys.argv[1], sys.argv[2]
+    imgsz = int(sys.argv[3]) if len(sys.argv) > 3 else 1280
+    model = YOLO(weights, task="detect")
+    image = cv2.imread(path)
+    h, w = image.shape[:2]
+    native = int(np.ceil(max(h, w) / 32) * 32)
+
+    def timed(fn, reps=3):
+        fn()
+        start = time.perf_counter()
+        for _ in range(reps):
+            out = fn()
+        return out, (time.perf_counter() - start) / reps * 1000
+
+    runs = {
+        f"single imgsz={imgsz}": lambda: model.predict(image, conf=0.25, imgsz=imgsz, verbose=False),
+        f"single imgsz={native} (native)": lambda: model.predict(image, conf=0.25, imgsz=native, verbose=False),
+        f"sliced {SLICE_WINDOW}px": lambda: sliced_predict(model, image, conf=0.25),
+    }
+    print(f"{w}x{h}, {len(slice_windows(h, w))} windows")
+    for name, fn in runs.items():
+        res, ms = timed(fn)
+        boxes = res[0].boxes
+        small = int(((boxes.xywh[:, 2] * boxes.xywh[:, 3]) < 32 * 32).sum()) if len(boxes) else 0
+        print(f"{name:>28} | {ms:>8.1f} ms | {len(boxes):>4} boxes | {small:>4} under 32x32px")
@@ -0,0 +1,139 @@
+# stand_in_engine.py
+# Model-free stand-in for engine.py, for exercising the gateway's engine pool locally.
+#
+#   python stand_in_engine.py 9001 & python stand_in_engine.py 9002 &
+#   BRAIN_URLS=http://127.0.0.1:9001,http://127.0.0.1:9002 python main.py
+#
+# Answers every route the gateway calls with the engine's response shapes,
+# reports real load on / and /streams/status, and tags each reply with its
+# port so routing decisions are visible. Work is simulated with sleeps.
+import os
+import sys
+import json
+import time
+import asyncio
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+
+PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 9001
+MAX_STREAMS = int(os.getenv("MAX_STREAMS", 6))
+FRAME_DELAY = float(os.getenv("STAND_IN_FRAME_DELAY", 0.05))     # seconds per telemetry frame
+ANALYZE_DELAY = float(os.getenv("STAND_IN_ANALYZE_DELAY", 0.2))  # seconds per /analyze call
+
+app = FastAPI(title=f"Stand-in engine :{PORT}")
+STREAMS = {}
+UPLOADS = set()
+JOBS = {}
+active_telemetry = 0
+
+
+@app.get("/")
+def health_check():
+    return {"status": "online", "engine": f"stand-in:{PORT}", "active_streams": len(STREAMS),
+            "active_telemetry": active_telemetry, "max_streams": MAX_STREAMS}
+
+
+@app.get("/streams/status")
+def streams_status():
+    return {"active": len(STREAMS), "max": MAX_STREAMS, "streams": STREAMS}
+
+
+@app.post("/streams/start")
+def start_stream(payload: dict):
+    stream_id = payload.get("id")
+    if not stream_id:
+        raise HTTPException(status_code=400, detail="id and sourceUrl required")
+    if len(STREAMS) >= MAX_STREAMS:
+        raise HTTPException(status_code=503, detail=f"Max {MAX_STREAMS} streams reached")
+    STREAMS[stream_id] = {"status": "RUNNING", "source": payload.get("sourceUrl"), "started_at": time.time()}
+    return {"streamId": stream_id, "aiEngineUrl": f"/streams/{stream_id}", "status": "RUNNING", "engine": PORT}
+
+
+@app.post("/streams/{stream_id}/stop")
+def stop_stream(stream_id: str):
+    if STREAMS.pop(stream_id, None) is None:
+        return {"success": False, "message": "Not found"}
+    return {"success": True, "streamId": stream_id}
+
+
+@app.post("/upload_and_process")
+async def upload(file: UploadFile = File(...), model: str = Form("mark-5")):
+    name = f"{int(time.time() * 1000)}_{file.filename}"
+    await file.read()
+    UPLOADS.add(name)
+    return {"stream_url": f"/telemetry?video_id={name}&model_req={model}"}
+
+
+@app.post("/process-local-simulation")
+def process_local_simulation(payload: dict):
+    UPLOADS.add(payload["simulation_id"])
+    return {"stream_url": f"/telemetry?video_id={payload['simulation_id']}&model_req={payload.get('model')}"}
+
+
+@app.get("/telemetry")
+async def telemetry(video_id: str, model_req: str, frames: int = 20):
+    if video_id not in UPLOADS:
+        # The gateway sent the follow-up to a different engine than the upload
+        raise HTTPException(status_code=404, detail="Video file not found")
+
+    async def lines():
+        global active_telemetry
+        active_telemetry += 1
+        try:
+            for i in range(frames):
+                await asyncio.sleep(FRAME_DELAY)
+                yield json.dumps({"frame": i, "engine": PORT, "stats": {"count": 0}}) + "\n"
+        finally:
+            active_telemetry -= 1
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/simulations/list")
+def list_simulations():
+    return {"success": True, "scenarios": [{"id": "demo", "name": "demo.mp4"}], "engine": PORT}
+
+
+@app.post("/probe")
+def probe(payload: dict):
+    return {"viewType": "GROUND", "recommended_model": "mark-5", "recommended_imgsz": 640,
+            "reason": "stand-in", "engine": PORT}
+
+
+@app.post("/analyze")
+async def analyze(payload: dict):
+    await asyncio.sleep(ANALYZE_DELAY)
+    tiles = payload.get("tileIds", [])
+    return {"success": True, "sessionId": payload.get("sessionId"), "totalVehicles": 0,
+            "tilesProcessed": len(tiles), "data": [], "engine": PORT}
+
+
+@app.post("/analyze/stream")
+async def analyze_stream(payload: dict):
+    async def lines():
+        for tile_id in payload.get("tileIds", []):
+            await asyncio.sleep(ANALYZE_DELAY / 4)
+            yield json.dumps({"type": "tile", "tileId": tile_id, "vehicleCount": 0, "engine": PORT}) + "\n"
+        yield json.dumps({"type": "summary", "success": True, "engine": PORT}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/analyze/jobs", status_code=202)
+def create_job(payload: dict):
+    job_id = os.urandom(6).hex()
+    JOBS[job_id] = {"jobId": job_id, "status": "done", "results": [], "engine": PORT}
+    return {"jobId": job_id, "status": "running", "engine": PORT}
+
+
+@app.get("/analyze/jobs/{job_id}")
+def job_status(job_id: str, since: int = 0):
+    if job_id not in JOBS:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JOBS[job_id]
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=PORT, log_level="warning")
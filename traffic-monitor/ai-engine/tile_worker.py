@@ -0,0 +1,280 @@
+# tile_worker.py
+# Redis-stream tile analysis workers.
+#
+# A session is split into chunks, one stream entry per chunk, and any
+# number of engine processes in the same consumer group share them. Each
+# worker runs its chunk through the normal tile pipeline, writes per-tile
+# results into a hash keyed by session run, then acknowledges the entry.
+# A chunk that fails (including any tile whose inference raised) stays
+# pending and the same worker claims it back after TILE_JOB_RETRY_MS,
+# doubling per delivery. Entries left by a dead worker are reclaimed by
+# XAUTOCLAIM after TILE_JOB_CLAIM_IDLE_MS. Writes are idempotent (tile results by tile id, completed chunks in a
+# set), so a re-run chunk is never double counted.
+#
+# Every submission of a session is a new run with its own keys, so entries
+# still queued from an earlier submission never mix into the current one.
+#
+# Redis layout per session:
+#   analysis:{sessionId}                string  current run id
+#   analysis:{sessionId}:{run}          hash    status, total, chunks, chunksDone, totalVehicles, ...
+#   analysis:{sessionId}:{run}:tiles    hash    tileId -> JSON entry
+#   analysis:{sessionId}:{run}:chunks   set     completed chunk indexes
+import os
+import json
+import time
+import socket
+import asyncio
+
+from redis.exceptions import ResponseError
+
+from tiles import iter_tile_batches, redis_tile_fetcher
+
+TILE_JOB_STREAM = os.getenv("TILE_JOB_STREAM", "analysis:jobs")
+TILE_JOB_GROUP = os.getenv("TILE_JOB_GROUP", "engines")
+TILE_JOB_CHUNK = int(os.getenv("TILE_JOB_CHUNK", 64))   # tiles per stream entry
+TILE_JOB_STREAM_MAXLEN = 100_000
+TILE_JOB_BLOCK_MS = 5000
+TILE_JOB_CLAIM_IDLE_MS = int(os.getenv("TILE_JOB_CLAIM_IDLE_MS", 300_000))
+TILE_JOB_RETRY_MS = int(os.getenv("TILE_JOB_RETRY_MS", 5000))    # first retry of a chunk that failed here
+TILE_JOB_MAX_DELIVERIES = 3     # reclaimed more often than this -> recorded as failed
+ANALYSIS_RESULT_TTL = int(os.getenv("ANALYSIS_RESULT_TTL", 24 * 3600))
+
+
+def _session_key(session_id):
+    return f"analysis:{session_id}"
+
+
+def _run_key(session_id, run):
+    return f"analysis:{session_id}:{run}"
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def ensure_group(client, stream=TILE_JOB_STREAM, group=TILE_JOB_GROUP):
+    try:
+        await client.xgroup_create(stream, group, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def enqueue_session(client, session_id, tile_ids, model="mark-5", sliced=None,
+                          chunk=TILE_JOB_CHUNK, stream=TILE_JOB_STREAM):
+    """Starts a new run of the session and queues its tiles. Returns the chunk count."""
+    run = os.urandom(6).hex()
+    key = _run_key(session_id, run)
+    chunks = [tile_ids[i:i + chunk] for i in range(0, len(tile_ids), chunk)]
+    pipe = client.pipeline(transaction=True)
+    # Earlier runs keep their own keys until they expire; only the pointer moves
+    pipe.set(_session_key(session_id), run, ex=ANALYSIS_RESULT_TTL)
+    pipe.hset(key, mapping={
+        "status": "queued" if chunks else "done", "total": len(tile_ids),
+        "chunks": len(chunks), "chunksDone": 0, "failedChunks": 0,
+        "totalVehicles": 0, "cacheHits": 0, "model": model, "createdAt": time.time(),
+    })
+    pipe.expire(key, ANALYSIS_RESULT_TTL)
+    for i, tiles in enumerate(chunks):
+        fields = {"sessionId": session_id, "run": run, "chunk": i, "tileIds": json.dumps(tiles), "model": model}
+        if sliced is not None:
+            fields["sliced"] = int(sliced)
+        pipe.xadd(stream, fields, maxlen=TILE_JOB_STREAM_MAXLEN, approximate=True)
+    await pipe.execute()
+    return len(chunks)
+
+
+async def session_status(client, session_id, include_results=False):
+    """Progress of the session's current run (None if unknown), optionally with every tile entry."""
+    run = await client.get(_session_key(session_id))
+    if run is None:
+        return None
+    key = _run_key(session_id, _text(run))
+    raw = await client.hgetall(key)
+    if not raw:
+        return None
+    info = {_text(k): _text(v) for k, v in raw.items()}
+    status = {
+        "sessionId": session_id, "status": info.get("status", "unknown"), "model": info.get("model"),
+        "total": int(info.get("total", 0)), "completed": await client.hlen(f"{key}:tiles"),
+        "chunks": int(info.get("chunks", 0)), "chunksDone": int(info.get("chunksDone", 0)),
+        "failedChunks": int(info.get("failedChunks", 0)),
+        "totalVehicles": int(info.get("totalVehicles", 0)), "cacheHits": int(info.get("cacheHits", 0)),
+        "error": info.get("error"),
+    }
+    if include_results:
+        status["data"] = [json.loads(v) for v in (await client.hgetall(f"{key}:tiles")).values()]
+    return status
+
+
+class TileWorker:
+    """
+    Consumes chunk entries from the job stream. `load_model(name)` returns a
+    model (or None) and `options(name, sliced)` returns the keyword arguments
+    for iter_tile_batches (conf, imgsz, cache, ...); both come from the engine.
+    """
+
+    def __init__(self, client, load_model, options, consumer=None,
+                 stream=TILE_JOB_STREAM, group=TILE_JOB_GROUP):
+        self.client = client
+        self.load_model = load_model
+        self.options = options
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.stream = stream
+        self.group = group
+        self.stop_event = asyncio.Event()
+        self.chunks_done = 0
+        self.retries = {}       # msg id of a chunk that failed here -> monotonic time it is due
+
+    def stop(self):
+        self.stop_event.set()
+
+    async def run(self):
+        await ensure_group(self.client, self.stream, self.group)
+        print(f"🧵 [WORKER] {self.consumer} consuming {self.stream} (group {self.group})")
+        while not self.stop_event.is_set():
+            try:
+                messages = await self._reclaim()
+                if not messages:
+                    block = TILE_JOB_BLOCK_MS
+                    if self.retries:
+                        # Wake up in time for the next retry
+                        due = min(self.retries.values()) - time.monotonic()
+                        block = max(1, min(block, int(due * 1000)))
+                    reply = await self.client.xreadgroup(
+                        self.group, self.consumer, {self.stream: ">"}, count=1, block=block
+                    )
+                    messages = reply[0][1] if reply else []
+                for msg_id, fields in messages:
+                    await self._handle(msg_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ [WORKER] {e}")
+                await asyncio.sleep(1)
+
+    async def _reclaim(self):
+        """
+        Chunks that failed here and are due for a retry, else entries another
+        consumer left pending for too long; minus poison ones.
+        """
+        now = time.monotonic()
+        due = [msg_id for msg_id, at in self.retries.items() if at <= now]
+        messages = []
+        if due:
+            for msg_id in due:
+                del self.retries[msg_id]
+            # XCLAIM counts a delivery, so retries run into TILE_JOB_MAX_DELIVERIES
+            messages = await self.client.xclaim(self.stream, self.group, self.consumer, 0, due)
+        if not messages:
+            _, messages, *_ = await self.client.xautoclaim(
+                self.stream, self.group, self.consumer, TILE_JOB_CLAIM_IDLE_MS, start_id="0-0", count=1
+            )
+        live = []
+        for msg_id, fields in messages:
+            if fields is None:
+                continue
+            pending = await self.client.xpending_range(self.stream, self.group, msg_id, msg_id, 1)
+            if pending and pending[0]["times_delivered"] > TILE_JOB_MAX_DELIVERIES:
+                job = {_text(k): _text(v) for k, v in fields.items()}
+                last = await self.client.hget(_run_key(job["sessionId"], job.get("run")), "lastError")
+                error = "Exceeded max deliveries" + (f": {_text(last)}" if last else "")
+                await self._finish(job, 0, 0, error=error)
+                await self.client.xack(self.stream, self.group, msg_id)
+                continue
+            live.append((msg_id, fields))
+        return live
+
+    async def _current(self, job):
+        """True if the entry belongs to the session's current, unexpired run."""
+        run = await self.client.get(_session_key(job["sessionId"]))
+        if run is None or _text(run) != job.get("run"):
+            return False
+        return bool(await self.client.exists(_run_key(job["sessionId"], job["run"])))
+
+    async def _handle(self, msg_id, fields):
+        job = {_text(k): _text(v) for k, v in fields.items()}
+        if not await self._current(job):
+            # Superseded by a newer submission, or its results have expired
+            await self.client.xack(self.stream, self.group, msg_id)
+            return
+        key = _run_key(job["sessionId"], job["run"])
+        if await self.client.sismember(f"{key}:chunks", job["chunk"]):
+            await self.client.xack(self.stream, self.group, msg_id)   # finished before a redelivery
+            return
+        vehicles = hits = 0
+        errors = None
+        try:
+            await self.client.hset(key, "status", "running")
+            model_name = job.get("model", "mark-5")
+            model = await asyncio.to_thread(self.load_model, model_name)
+            if model is None:
+                raise RuntimeError("Model failed to load")
+            sliced = bool(int(job["sliced"])) if "sliced" in job else None
+            fetch_many = redis_tile_fetcher(self.client)
+            async for entries in iter_tile_batches(model, json.loads(job["tileIds"]), fetch_many,
+                                                   **self.options(model_name, sliced)):
+                pipe = self.client.pipeline(transaction=False)
+                pipe.hset(f"{key}:tiles", mapping={e["tileId"]: json.dumps(e) for e in entries})
+                pipe.expire(f"{key}:tiles", ANALYSIS_RESULT_TTL)
+                await pipe.execute()
+                vehicles += sum(e["vehicleCount"] for e in entries)
+                hits += sum(1 for e in entries if e.get("cached"))
+                # _infer reports a failed predict() per tile; those tiles need a retry too
+                errors = errors or next((e.get("message") for e in entries if e["status"] == "error"), None)
+            if errors:
+                raise RuntimeError(f"Tile inference failed: {errors}")
+        except Exception as e:
+            # Left pending and retried here with backoff, up to TILE_JOB_MAX_DELIVERIES
+            pending = await self.client.xpending_range(self.stream, self.group, msg_id, msg_id, 1)
+            delivered = pending[0]["times_delivered"] if pending else 1
+            self.retries[msg_id] = time.monotonic() + TILE_JOB_RETRY_MS * 2 ** (delivered - 1) / 1000
+            print(f"❌ [WORKER] {job['sessionId']} chunk {job['chunk']} failed, will retry: {e}")
+            await self.client.hset(key, "lastError", str(e))
+            return
+        await self._finish(job, vehicles, hits)
+        await self.client.xack(self.stream, self.group, msg_id)
+
+    async def _finish(self, job, vehicles, hits, error=None):
+        if not await self._current(job):
+            return
+        key = _run_key(job["sessionId"], job["run"])
+        # The chunk set makes completion idempotent across re-deliveries
+        if not await self.client.sadd(f"{key}:chunks", job["chunk"]):
+            return
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hincrby(key, "totalVehicles", vehicles)
+        pipe.hincrby(key, "cacheHits", hits)
+        if error:
+            pipe.hincrby(key, "failedChunks", 1)
+            pipe.hset(key, "error", error)
+        pipe.hincrby(key, "chunksDone", 1)
+        pipe.hget(key, "chunks")
+        pipe.expire(f"{key}:chunks", ANALYSIS_RESULT_TTL)
+        reply = await pipe.execute()
+        done, chunks = reply[-3], reply[-2]
+        self.chunks_done += 1
+        if chunks is not None and done >= int(chunks):
+            await self.client.hset(key, "status", "done")
+            print(f"✅ [WORKER] Session {job['sessionId']} complete ({int(chunks)} chunks)")
+
+
+# ==========================================
+# LOCAL CHECK: python tile_worker.py enqueue <session> <tileId>... | status <session>
+# ==========================================
+if __name__ == "__main__":
+    import sys
+    import redis.asyncio as aioredis
+
+    async def main(args):
+        client = aioredis.from_url(os.getenv("REDIS_URL", "redis://127.0.0.1:6379"))
+        try:
+            if args[0] == "enqueue":
+                chunks = await enqueue_session(client, args[1], args[2:])
+                print(f"Queued {len(args) - 2} tiles in {chunks} chunk(s)")
+            elif args[0] == "status":
+                print(json.dumps(await session_status(client, args[1], include_results=True), indent=2))
+        finally:
+            await client.aclose()
+
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,440 @@
+# tiles.py
+# Satellite tile analysis pipeline behind /analyze.
+#
+# Tiles are processed in batches. Tile bytes for upcoming batches are
+# fetched from Redis with chunked MGETs in one pipelined round trip and
+# decoded off the event loop while the model runs on the current batch.
+# Within a batch, tiles are grouped by shape so every image gets the same
+# letterbox it would get on its own, which keeps per-tile results
+# identical to batch-of-1 runs.
+#
+# Decoding runs on a thread pool (cv2.imdecode releases the GIL). Tiles
+# much larger than the inference size are decoded with IMREAD_REDUCED_*
+# and their boxes are scaled back to full-resolution tile pixels.
+#
+# Per-tile detections are cached under a hash of the tile bytes, the model
+# weights and the inference parameters, so only cache misses are decoded
+# and inferred when overlapping map areas are re-analysed.
+#
+# In sliced mode, tiles larger than imgsz are decoded at full resolution and
+# run through overlapping native-resolution windows (see slicing.py).
+import os
+import json
+import time
+import struct
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+
+from artifacts import weights_digest, batch_limit
+from detections import Detections
+# slicing (torchvision) is imported on the first sliced batch
+
+TILE_BATCH_MAX = int(os.getenv("TILE_BATCH_MAX", 32))
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", 0))   # 0 = size from free memory
+TILE_MEMORY_FRACTION = 0.5      # share of free memory a batch may claim
+# Rough peak inference memory per input pixel (activations + letterboxed copy)
+ACTIVATION_BYTES_PER_PIXEL = 250
+REDIS_MGET_CHUNK = 64           # keys per MGET inside a pipeline
+TILE_PREFETCH_BATCHES = 2       # batches fetched + decoded ahead of inference
+TILE_DECODE_WORKERS = int(os.getenv("TILE_DECODE_WORKERS", os.cpu_count() or 4))
+
+_decode_pool = ThreadPoolExecutor(max_workers=TILE_DECODE_WORKERS, thread_name_prefix="tile-decode")
+
+# (factor, flag) from most to least reduced
+_REDUCED_MODES = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+DETECTION_CACHE_TTL = int(os.getenv("DETECTION_CACHE_TTL", 2 * 3600))  # matches the tile TTL
+DETECTION_CACHE_LOCAL_MAX = 50_000   # entries kept by the in-process fallback
+DETECTION_CACHE_VERSION = 1          # bump when the cached entry format changes
+
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _free_memory_bytes(device):
+    if device == "cuda" and torch.cuda.is_available():
+        free, _ = torch.cuda.mem_get_info()
+        return free
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 2 * 1024 ** 3
+
+
+def tile_batch_size(imgsz, device, model=None):
+    """
+    Largest batch that fits in TILE_MEMORY_FRACTION of free memory, capped at
+    the batch a compiled `model` was exported for.
+    """
+    limit = batch_limit(model) if model is not None else None
+    if TILE_BATCH_SIZE > 0:
+        return min(TILE_BATCH_SIZE, limit or TILE_BATCH_SIZE)
+    per_image = imgsz * imgsz * ACTIVATION_BYTES_PER_PIXEL
+    fits = int(_free_memory_bytes(device) * TILE_MEMORY_FRACTION // per_image)
+    return max(1, min(TILE_BATCH_MAX, fits, limit or TILE_BATCH_MAX))
+
+
+def redis_tile_fetcher(client, chunk=REDIS_MGET_CHUNK):
+    """
+    Bulk fetcher over an asyncio Redis client: chunked MGETs sent as one
+    non-transactional pipeline, so a batch costs a single round trip.
+    """
+    async def fetch_many(tile_ids):
+        keys = [f"tile:{tile_id}" for tile_id in tile_ids]
+        pipe = client.pipeline(transaction=False)
+        for i in range(0, len(keys), chunk):
+            pipe.mget(keys[i:i + chunk])
+        replies = await pipe.execute()
+        return [blob for reply in replies for blob in reply]
+    return fetch_many
+
+
+def model_fingerprint(name, path):
+    """Model name plus a digest of its weights; retrained weights get a new key."""
+    try:
+        return f"{name}@{weights_digest(path)}"
+    except (OSError, TypeError):
+        return name
+
+
+def detection_cache_key(image_bytes, model_tag, conf, imgsz):
+    digest = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+    return f"det:v{DETECTION_CACHE_VERSION}:{model_tag}:{conf}:{imgsz}:{digest}"
+
+
+class RedisDetectionCache:
+    """Detections stored as JSON in Redis with a TTL, shared by all engines."""
+
+    def __init__(self, client, ttl=DETECTION_CACHE_TTL, chunk=REDIS_MGET_CHUNK):
+        self.client = client
+        self.ttl = ttl
+        self.chunk = chunk
+
+    async def get_many(self, keys):
+        pipe = self.client.pipeline(transaction=False)
+        for i in range(0, len(keys), self.chunk):
+            pipe.mget(keys[i:i + self.chunk])
+        replies = await pipe.execute()
+        return [json.loads(v) if v else None for reply in replies for v in reply]
+
+    async def put_many(self, items):
+        if not items:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, json.dumps(value), ex=self.ttl)
+        await pipe.execute()
+
+
+class LocalDetectionCache:
+    """In-process LRU with the same interface, for when Redis is unavailable."""
+
+    def __init__(self, ttl=DETECTION_CACHE_TTL, max_entries=DETECTION_CACHE_LOCAL_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()   # key -> (expires_at, value)
+
+    async def get_many(self, keys):
+        now = time.monotonic()
+        values = []
+        for key in keys:
+            item = self.entries.get(key)
+            if item and item[0] > now:
+                self.entries.move_to_end(key)
+                values.append(item[1])
+            else:
+                if item:
+                    del self.entries[key]
+                values.append(None)
+        return values
+
+    async def put_many(self, items):
+        expires = time.monotonic() + self.ttl
+        for key, value in items.items():
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def image_size(data):
+    """(width, height) from PNG/JPEG headers without decoding, else None."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:2] != b"\xff\xd8":
+        return None
+    i, n = 2, len(data)
+    while i + 9 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:              # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in _JPEG_SOF:
+            h, w = struct.unpack(">HH", data[i + 5:i + 9])
+            return w, h
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def decode_tile(image_bytes, imgsz=None):
+    """
+    Decodes a tile, reduced by 2/4/8 when it stays at least `imgsz` on its
+    long side. Returns (image or None, scale back to full-resolution pixels).
+    """
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    size = image_size(image_bytes) if imgsz else None
+    if size:
+        long_side = max(size)
+        for factor, flag in _REDUCED_MODES:
+            if long_side // factor >= imgsz:
+                img = cv2.imdecode(nparr, flag)
+                if img is not None:
+                    return img, long_side / max(img.shape[:2])
+                break
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR), 1.0
+
+
+def _decode_one(tile_id, image_bytes, imgsz):
+    """Decode stage for one tile: (tile_id, image or None, final entry or None, scale)."""
+    try:
+        if not image_bytes:
+            return tile_id, None, {"tileId": tile_id, "status": "missing_in_cache", "vehicleCount": 0}, 1.0
+        img, scale = decode_tile(image_bytes, imgsz)
+        if img is None:
+            return tile_id, None, {"tileId": tile_id, "status": "decode_error", "vehicleCount": 0}, 1.0
+        return tile_id, img, None, scale
+    except Exception as e:
+        return tile_id, None, {"tileId": tile_id, "status": "error", "message": str(e), "vehicleCount": 0}, 1.0
+
+
+async def _decode_all(tile_ids, blobs, imgsz):
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(
+        loop.run_in_executor(_decode_pool, _decode_one, tile_id, blob, imgsz)
+        for tile_id, blob in zip(tile_ids, blobs)
+    ))
+
+
+def _cache_hit(tile_id, value):
+    return {"tileId": tile_id, "status": "processed", "cached": True, **value}
+
+
+def _infer(model, prepared, conf, imgsz, sliced=False, lock=None):
+    """
+    Runs one batch, grouped by shape. Returns entries in input order. `lock`
+    serialises predict() calls on a model shared with other sessions.
+    """
+    entries = [failure for _, _, failure, _ in prepared]
+    by_shape = {}
+    for i, (_, img, failure, _) in enumerate(prepared):
+        if failure is None:
+            # Large tiles get their own sliced pass; the rest batch by shape
+            key = i if sliced and max(img.shape[:2]) > imgsz else img.shape
+            by_shape.setdefault(key, []).append(i)
+
+    for key, idx in by_shape.items():
+        try:
+            with lock or nullcontext():
+                if isinstance(key, int):
+                    from slicing import sliced_predict
+                    preds = sliced_predict(model, prepared[key][1], conf=conf)
+                else:
+                    preds = model.predict(
+                        [prepared[i][1] for i in idx], conf=conf, verbose=False, imgsz=imgsz
+                    )
+        except Exception as e:
+            for i in idx:
+                entries[i] = {"tileId": prepared[i][0], "status": "error", "message": str(e), "vehicleCount": 0}
+            continue
+        for i, pred in zip(idx, preds):
+            dets = Detections.from_result(pred)
+            entries[i] = {
+                "tileId": prepared[i][0], "status": "processed",
+                "vehicleCount": len(dets),
+                "detections": dets.tile_detections(prepared[i][3])
+            }
+    return entries
+
+
+async def iter_tile_batches(model, tile_ids, fetch_many, conf, imgsz, batch_size=None, device=None,
+                            cache=None, model_tag="model", sliced=False, timing=None, lock=None):
+    """
+    Analyses tiles in order, yielding each batch's entries as soon as it is
+    inferred. `fetch_many(tile_ids)` is a coroutine returning the encoded
+    tile bytes (or None) for each id. With a detection `cache`, hits are
+    returned with "cached": True and only misses are inferred. With
+    `sliced`, tiles larger than imgsz use sliced inference. Stage timings
+    (ms) accumulate into `timing`. Pass the model's `lock` when other
+    threads share the model: the ultralytics predictor is not thread-safe.
+    """
+    if batch_size is None:
+        batch_size = tile_batch_size(imgsz, device or ("cuda" if torch.cuda.is_available() else "cpu"), model)
+    chunks = [tile_ids[i:i + batch_size] for i in range(0, len(tile_ids), batch_size)]
+    if timing is None:
+        timing = {}
+    timing.update({"redis_ms": 0.0, "cache_ms": 0.0, "decode_ms": 0.0, "inference_ms": 0.0})
+    started = time.perf_counter()
+
+    # Sliced tiles keep full resolution; otherwise large tiles decode reduced
+    decode_imgsz = None if sliced else imgsz
+    if sliced:
+        from slicing import SLICE_WINDOW
+        params = f"{imgsz}/slice{SLICE_WINDOW}"
+    else:
+        params = imgsz
+
+    async def lookup(blobs):
+        """Cache keys and cached values per tile (None for missing tiles / misses)."""
+        keys = [detection_cache_key(b, model_tag, conf, params) if b else None for b in blobs]
+        present = [k for k in keys if k]
+        try:
+            found = dict(zip(present, await cache.get_many(present))) if present else {}
+        except Exception as e:
+            print(f"⚠️ [ANALYZE] Detection cache lookup failed: {e}")
+            found = {}
+        return keys, [found.get(k) if k else None for k in keys]
+
+    async def prepare(chunk):
+        t0 = time.perf_counter()
+        try:
+            blobs = await fetch_many(chunk)
+        except Exception as e:
+            timing["redis_ms"] += (time.perf_counter() - t0) * 1000
+            return [(tile_id, None, {"tileId": tile_id, "status": "error", "message": str(e), "vehicleCount": 0}, 1.0)
+                    for tile_id in chunk], [None] * len(chunk)
+        t1 = time.perf_counter()
+        timing["redis_ms"] += (t1 - t0) * 1000
+
+        keys, hits = [None] * len(chunk), [None] * len(chunk)
+        if cache is not None:
+            keys, hits = await lookup(blobs)
+            # Hits skip decoding; their blobs are dropped
+            blobs = [None if hit else blob for blob, hit in zip(blobs, hits)]
+        t2 = time.perf_counter()
+        timing["cache_ms"] += (t2 - t1) * 1000
+
+        prepared = await _decode_all(chunk, blobs, decode_imgsz)
+        prepared = [
+            (tile_id, None, _cache_hit(tile_id, hit), 1.0) if hit else p
+            for (tile_id, hit), p in zip(zip(chunk, hits), prepared)
+        ]
+        timing["decode_ms"] += (time.perf_counter() - t2) * 1000
+        return prepared, keys
+
+    # Keep TILE_PREFETCH_BATCHES fetch + decode tasks running ahead of inference
+    pending = [asyncio.create_task(prepare(c)) for c in chunks[:TILE_PREFETCH_BATCHES]]
+    try:
+        for k in range(len(chunks)):
+            prepared, keys = await pending.pop(0)
+            if k + TILE_PREFETCH_BATCHES < len(chunks):
+                pending.append(asyncio.create_task(prepare(chunks[k + TILE_PREFETCH_BATCHES])))
+            t0 = time.perf_counter()
+            entries = await asyncio.to_thread(_infer, model, prepared, conf, imgsz, sliced, lock)
+            timing["inference_ms"] += (time.perf_counter() - t0) * 1000
+
+            if cache is not None:
+                fresh = {
+                    key: {"vehicleCount": e["vehicleCount"], "detections": e["detections"]}
+                    for key, e, p in zip(keys, entries, prepared)
+                    if key and p[1] is not None and e["status"] == "processed"
+                }
+                t0 = time.perf_counter()
+                try:
+                    await cache.put_many(fresh)
+                except Exception as e:
+                    print(f"⚠️ [ANALYZE] Detection cache write failed: {e}")
+                timing["cache_ms"] += (time.perf_counter() - t0) * 1000
+            yield entries
+    finally:
+        for task in pending:
+            task.cancel()
+        timing.update({k: round(v, 1) for k, v in timing.items()})
+        timing["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def analyze_tiles(model, tile_ids, fetch_many, conf, imgsz, **kwargs):
+    """
+    Whole-session form of iter_tile_batches.
+    Returns (per-tile entries, total vehicles, timing in ms).
+    """
+    timing = {}
+    results = []
+    async for entries in iter_tile_batches(model, tile_ids, fetch_many, conf, imgsz, timing=timing, **kwargs):
+        results.extend(entries)
+    total_vehicles = sum(r["vehicleCount"] for r in results)
+    return results, total_vehicles, timing
+
+
+# ==========================================
+# BENCHMARK: python tiles.py <weights.pt> [imgsz]
+# ==========================================
+if __name__ == "__main__":
+    import sys
+    from ultralytics import YOLO
+
+    weights = sys.argv[1] if len(sys.argv) > 1 else "best.pt"
+    imgsz = int(sys.argv[2]) if len(sys.argv) > 2 else 640
+    model = YOLO(weights, task="detect")
+    model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False)  # warmup
+
+    async def run(ids, tiles, batch_size, cache=None):
+        async def fetch_many(chunk):
+            return [tiles.get(t) for t in chunk]
+        return await analyze_tiles(model, ids, fetch_many, 0.25, imgsz, batch_size=batch_size, device="cpu",
+                                   cache=cache)
+
+    rng = np.random.default_rng(0)
+    pool = [cv2.imencode(".jpg", rng.integers(0, 255, (256, 256, 3), dtype=np.uint8))[1].tobytes()
+            for _ in range(16)]
+    batch = tile_batch_size(imgsz, "cpu")
+    print(f"CPU, imgsz={imgsz}, batch={batch}")
+    print(f"{'tiles':>5} | {'per-tile (tiles/s)':>18} | {'batched (tiles/s)':>17}")
+    for n in (10, 100, 1000):
+        tiles = {f"t{i}": pool[i % len(pool)] for i in range(n)}
+        ids = list(tiles)
+
+        start = time.perf_counter()
+        single, _, _ = asyncio.run(run(ids, tiles, 1))
+        single_tps = n / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        batched, _, _ = asyncio.run(run(ids, tiles, batch))
+        batched_tps = n / (time.perf_counter() - start)
+
+        same = [r.get("vehicleCount") for r in single] == [r.get("vehicleCount") for r in batched]
+        print(f"{n:>5} | {single_tps:>18.1f} | {batched_tps:>17.1f} | same counts: {same}")
+
+    # Repeat session against a warm detection cache
+    cache = LocalDetectionCache()
+    asyncio.run(run(ids, tiles, batch, cache))
+    start = time.perf_counter()
+    repeat, _, _ = asyncio.run(run(ids, tiles, batch, cache))
+    hits = sum(1 for r in repeat if r.get("cached"))
+    print(f"repeat {len(ids)} tiles: {(time.perf_counter() - start) * 1000:.1f} ms, {hits} cache hits")
+
+    # Decode stage alone: serial full-resolution vs pooled reduced decoding
+    big = cv2.imencode(".jpg", rng.integers(0, 255, (2048, 2048, 3), dtype=np.uint8))[1].tobytes()
+    blobs = [big] * 64
+    start = time.perf_counter()
+    for blob in blobs:
+        decode_tile(blob)
+    serial_tps = len(blobs) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    asyncio.run(_decode_all(list(range(len(blobs))), blobs, imgsz))
+    pooled_tps = len(blobs) / (time.perf_counter() - start)
+    print(f"decode 2048px: serial {serial_tps:.1f} tiles/s | "
+          f"{TILE_DECODE_WORKERS} workers, reduced {pooled_tps:.1f} tiles/s")
@@ -0,0 +1,138 @@
+# zones.py
+# Polygon zone engine: zones are rasterised ONCE per frame resolution into a
+# label lookup table, so assigning N detections is a single array gather.
+import cv2
+import numpy as np
+
+# Rolling window used for time-occupancy (fraction of recent frames occupied)
+OCCUPANCY_WINDOW_FRAMES = 50
+
+
+def parse_zones(raw):
+    """
+    Normalises a zone config list into [{"name", "polygon"}] with points in 0-1.
+    Accepts polygons ({"polygon": [[x, y], ...]}) or the legacy lane
+    rectangles from the root main.py ({"xyxyn": (x1, y1, x2, y2)}).
+    """
+    zones = []
+    for i, z in enumerate(raw or []):
+        name = z.get("name") or f"zone_{i}"
+        if "polygon" in z:
+            pts = [(float(p[0]), float(p[1])) for p in z["polygon"]]
+        elif "xyxyn" in z:
+            x1, y1, x2, y2 = (float(v) for v in z["xyxyn"])
+            pts = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+        else:
+            raise ValueError(f"Zone '{name}' needs 'polygon' or 'xyxyn'")
+        if len(pts) < 3:
+            raise ValueError(f"Zone '{name}' needs at least 3 points")
+        zones.append({"name": name, "polygon": pts})
+    if len(zones) > 254:
+        raise ValueError("At most 254 zones per stream")
+    return zones
+
+
+class ZoneMap:
+    """Point-in-zone lookup: uint8 label image, 0 = outside, i + 1 = zone i."""
+
+    def __init__(self, zones):
+        self.zones = parse_zones(zones)
+        self.names = [z["name"] for z in self.zones]
+        self._luts = {}     # (w, h) -> label image
+        self._areas = {}    # (w, h) -> pixel area per zone
+
+    def __len__(self):
+        return len(self.zones)
+
+    def lut(self, w, h):
+        key = (w, h)
+        lut = self._luts.get(key)
+        if lut is None:
+            lut = np.zeros((h, w), dtype=np.uint8)
+            scale = np.array([w, h], dtype=np.float32)
+            # Later zones win where polygons overlap
+            for i, z in enumerate(self.zones):
+                pts = np.round(np.array(z["polygon"], dtype=np.float32) * scale).astype(np.int32)
+                cv2.fillPoly(lut, [pts], i + 1)
+            self._luts[key] = lut
+            self._areas[key] = np.bincount(lut.ravel(), minlength=len(self.zones) + 1)[1:]
+        return lut
+
+    def areas(self, w, h):
+        self.lut(w, h)
+        return self._areas[(w, h)]
+
+    def assign(self, centers, w, h):
+        """Maps (N, 2) pixel centres to zone labels (0 = no zone) in one gather."""
+        if len(centers) == 0 or not self.zones:
+            return np.zeros(len(centers), dtype=np.uint8)
+        lut = self.lut(w, h)
+        xs = np.clip(centers[:, 0].astype(np.intp), 0, w - 1)
+        ys = np.clip(centers[:, 1].astype(np.intp), 0, h - 1)
+        return lut[ys, xs]
+
+
+class ZoneTracker:
+    """
+    Per-zone telemetry for one stream: live counts, time occupancy over a
+    rolling window, and dwell time of tracked vehicles. Sources without
+    track ids pass `dwell=False` and the dwell fields are left out.
+    """
+
+    def __init__(self, zones, window=OCCUPANCY_WINDOW_FRAMES, dwell=True):
+        self.map = ZoneMap(zones)
+        self.dwell = dwell
+        n = len(self.map)
+        self.counts = np.zeros(n, dtype=np.int32)
+        self._occupied = np.zeros((window, n), dtype=bool)
+        self._frames = 0
+        self._entered = {}          # track_id -> (zone label, entry time)
+        self._dwell = np.zeros(n)   # mean dwell of vehicles currently in zone
+        self._max_dwell = np.zeros(n)
+
+    def update(self, centers, w, h, track_ids=None, now=0.0):
+        n = len(self.map)
+        if n == 0:
+            return
+        labels = self.map.assign(centers, w, h)
+        self.counts = np.bincount(labels, minlength=n + 1)[1:].astype(np.int32)
+        self._occupied[self._frames % len(self._occupied)] = self.counts > 0
+        self._frames += 1
+
+        self._dwell[:] = 0.0
+        self._max_dwell[:] = 0.0
+        if track_ids is None:
+            return
+
+        entered = {}
+        dwell = np.zeros(len(labels))
+        for i, (tid, label) in enumerate(zip(track_ids.tolist(), labels.tolist())):
+            if label == 0:
+                continue
+            prev = self._entered.get(tid)
+            start = prev[1] if prev is not None and prev[0] == label else now
+            entered[tid] = (label, start)
+            dwell[i] = now - start
+        # Tracks that left the frame are dropped here
+        self._entered = entered
+
+        inside = labels > 0
+        if inside.any():
+            idx = labels[inside].astype(np.intp) - 1
+            sums = np.bincount(idx, weights=dwell[inside], minlength=n)
+            self._dwell = np.divide(sums, self.counts, out=np.zeros(n), where=self.counts > 0)
+            np.maximum.at(self._max_dwell, idx, dwell[inside])
+
+    def snapshot(self):
+        filled = min(self._frames, len(self._occupied))
+        occupancy = (
+            self._occupied[:filled].mean(axis=0) if filled else np.zeros(len(self.map))
+        )
+        zones = []
+        for i, name in enumerate(self.map.names):
+            zone = {"name": name, "count": int(self.counts[i]), "occupancy": round(float(occupancy[i]), 2)}
+            if self.dwell:
+                zone["avg_dwell_s"] = round(float(self._dwell[i]), 1)
+                zone["max_dwell_s"] = round(float(self._max_dwell[i]), 1)
+            zones.append(zone)
+        return zones
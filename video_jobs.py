@@ -0,0 +1,372 @@
+import os
+import math
+import time
+import uuid
+import queue
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+
+import cv2
+
+from emergency import EmergencyClassifier
+from video_writer import FragmentedMP4Writer
+
+# =========================
+# CONFIG
+# =========================
+
+MODEL_PATH = "best.pt"
+TRACKER_CONFIG = "botsort.yaml"
+
+CONF_THRES = 0.25
+IOU_THRES = 0.5
+
+PIXELS_TO_METERS = 0.1
+
+ZONES = [
+    {"name": "Left Lane",  "xyxyn": (0.30, 0.25, 0.53, 0.98), "color": (255, 255, 0)},
+    {"name": "Right Lane", "xyxyn": (0.53, 0.25, 0.78, 0.98), "color": (0, 255, 255)},
+]
+
+VEHICLE_CLASSES = {"car", "truck", "bus", "van"}
+
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", max(1, (os.cpu_count() or 2) // 4)))
+PROGRESS_EVERY = 10           # frames between progress reports / cancel checks
+FINISHED_STATES = {"done", "failed", "cancelled"}
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 6 * 3600))   # finished jobs and outputs kept this long
+JOB_SWEEP_INTERVAL = 60
+
+# =========================
+# ANALYTICS
+# =========================
+
+class TrafficAnalytics:
+    def __init__(self):
+        self.track_history = {}
+
+    def calculate_speed(self, track_id, cx, cy, fps):
+        speed = 0.0
+        if track_id in self.track_history:
+            px, py = self.track_history[track_id]
+            dist = math.sqrt((cx - px) ** 2 + (cy - py) ** 2)
+            speed = dist * fps * PIXELS_TO_METERS * 3.6
+        self.track_history[track_id] = (cx, cy)
+        return speed
+
+# =========================
+# WORKER PROCESS
+# =========================
+
+# Each worker process loads its own model once, in init_worker
+model = None
+
+class JobCancelled(Exception):
+    pass
+
+def init_worker(model_path, threads):
+    global model
+    import torch
+    from ultralytics import YOLO
+
+    # Split the cores between workers instead of every worker claiming all of them
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    model = YOLO(model_path)
+    print(f"[WORKER {os.getpid()}] Model loaded ({threads} threads)")
+
+def annotate_video(input_path, writer, fps, analytics, on_frame=None):
+    """Runs tracking over the whole video and hands each annotated frame to the encoder."""
+    results_gen = model.track(
+        source=input_path,
+        stream=True,
+        tracker=TRACKER_CONFIG,
+        conf=CONF_THRES,
+        iou=IOU_THRES,
+        # One call covers the whole video; persisting would leak tracks into the next job
+        persist=False,
+        verbose=False,
+    )
+
+    emergency = EmergencyClassifier()
+
+    for frame_idx, results in enumerate(results_gen):
+        if on_frame is not None:
+            on_frame(frame_idx)
+
+        frame = results.orig_img.copy()
+        h, w, _ = frame.shape
+        emergency.next_frame()
+
+        # ================= DETECTIONS =================
+        if results.boxes is not None and len(results.boxes) > 0:
+
+            boxes = results.boxes.xyxy.cpu().numpy()
+            confs = results.boxes.conf.cpu().numpy()
+            class_ids = results.boxes.cls.cpu().numpy()
+            track_ids = (
+                results.boxes.id.cpu().numpy()
+                if results.boxes.id is not None
+                else [None] * len(boxes)
+            )
+
+            for (x1, y1, x2, y2), conf, cls, tid in zip(
+                boxes, confs, class_ids, track_ids
+            ):
+                if conf < CONF_THRES:
+                    continue
+
+                x1, y1, x2, y2 = map(int, (x1, y1, x2, y2))
+                cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+
+                speed = analytics.calculate_speed(tid, cx, cy, fps) if tid is not None else 0
+
+                label_name = model.names[int(cls)]
+                color = (0, 255, 0)
+
+                # Emergency vehicle detection
+                box_area = (x2 - x1) * (y2 - y1)
+                frame_area = w * h
+
+                is_large_vehicle = box_area / frame_area > 0.02
+                if is_large_vehicle and emergency.classify(
+                    frame, (x1, y1, x2, y2), int(tid) if tid is not None else None
+                ):
+                    label_name = "EMERGENCY"
+                    color = (0, 0, 255)
+                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+                if label_name not in VEHICLE_CLASSES and is_large_vehicle:
+                    label_name = "VEHICLE"
+
+                label = f"{label_name} {int(speed)} km/h"
+                cv2.putText(
+                    frame,
+                    label,
+                    (x1, max(0, y1 - 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6,
+                    (255, 255, 255),
+                    2,
+                )
+
+        # ================= ZONES =================
+        overlay = frame.copy()
+        for z in ZONES:
+            x1n, y1n, x2n, y2n = z["xyxyn"]
+            zx1, zy1 = int(x1n * w), int(y1n * h)
+            zx2, zy2 = int(x2n * w), int(y2n * h)
+            cv2.rectangle(overlay, (zx1, zy1), (zx2, zy2), z["color"], -1)
+
+        frame = cv2.addWeighted(overlay, 0.15, frame, 0.85, 0)
+
+        writer.write(frame)
+
+def run_job(job_id, input_path, output_path, progress, cancel):
+    """Worker entry point. Progress goes back to the API process on `progress`."""
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        os.remove(input_path)
+        raise ValueError("Cannot open video")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    # The raw pipe must match the decoded frames, which can differ from the container's size
+    ok, first = cap.read()
+    cap.release()
+    if not ok:
+        os.remove(input_path)
+        raise ValueError("No decodable frames")
+    size = (first.shape[1], first.shape[0])
+
+    progress.put((job_id, "running", 0, total_frames))
+
+    def on_frame(frame_idx):
+        if frame_idx % PROGRESS_EVERY == 0:
+            if cancel.is_set():
+                raise JobCancelled()
+            progress.put((job_id, "running", frame_idx, total_frames))
+
+    writer = FragmentedMP4Writer(output_path, fps, size)
+    status = "done"
+    try:
+        annotate_video(input_path, writer, fps, TrafficAnalytics(), on_frame)
+    except JobCancelled:
+        status = "cancelled"
+    finally:
+        writer.close()
+        writer.thread.join()
+        os.remove(input_path)
+
+    if status == "cancelled":
+        os.remove(output_path)
+    elif writer.error:
+        raise writer.error
+    return status
+
+# =========================
+# JOB MANAGER (API PROCESS)
+# =========================
+
+class VideoJobManager:
+    """
+    Runs video jobs on a pool of worker processes. Job state lives here in
+    the API process and is updated from the workers' progress messages.
+    Finished jobs and their output files are removed after JOB_TTL_SECONDS.
+    """
+
+    def __init__(self, workers=VIDEO_WORKERS, model_path=MODEL_PATH, ttl=JOB_TTL_SECONDS):
+        ctx = mp.get_context("spawn")
+        self.workers = workers
+        self.manager = ctx.Manager()
+        self.progress = self.manager.Queue()
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=ctx,
+            initializer=init_worker, initargs=(model_path, threads),
+        )
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.last_sweep = time.time()
+        self.running = True
+        self.listener = threading.Thread(target=self._listen, daemon=True)
+        self.listener.start()
+
+    def submit(self, input_path, output_path, filename):
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id, "filename": filename, "status": "queued",
+            "frames_done": 0, "total_frames": 0, "error": None,
+            "submitted_at": time.time(), "started_at": None, "finished_at": None,
+            "input_path": input_path, "output_path": output_path,
+            "cancel": self.manager.Event(), "future": None,
+        }
+        # Published with its future, so cancel() never sees a job without one
+        with self.lock:
+            job["future"] = self.pool.submit(
+                run_job, job_id, input_path, output_path, self.progress, job["cancel"]
+            )
+            self.jobs[job_id] = job
+        job["future"].add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _listen(self):
+        while self.running:
+            if time.time() - self.last_sweep >= JOB_SWEEP_INTERVAL:
+                self._sweep()
+            try:
+                job_id, status, frames_done, total_frames = self.progress.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None or job["status"] in FINISHED_STATES:
+                    continue
+                if job["started_at"] is None:
+                    job["started_at"] = time.time()
+                job["status"] = status
+                job["frames_done"] = frames_done
+                job["total_frames"] = total_frames
+
+    def _finish(self, job_id, future):
+        with self.lock:
+            job = self.jobs[job_id]
+            job["finished_at"] = time.time()
+            try:
+                job["status"] = future.result()
+                if job["status"] == "done":
+                    job["frames_done"] = job["total_frames"]
+            except CancelledError:
+                job["status"] = "cancelled"
+                if os.path.exists(job["input_path"]):
+                    os.remove(job["input_path"])
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = f"{e.__class__.__name__}: {e}"
+
+    def _sweep(self):
+        """Drops finished jobs older than the TTL and deletes their output files."""
+        self.last_sweep = time.time()
+        cutoff = self.last_sweep - self.ttl
+        with self.lock:
+            expired = [
+                self.jobs.pop(job_id) for job_id, job in list(self.jobs.items())
+                if job["status"] in FINISHED_STATES and job["finished_at"] and job["finished_at"] < cutoff
+            ]
+        for job in expired:
+            if os.path.exists(job["output_path"]):
+                os.remove(job["output_path"])
+        if expired:
+            print(f"[JOBS] Removed {len(expired)} expired job(s)")
+
+    def get(self, job_id):
+        """Copy of a job's state, or None."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def job_ids(self):
+        with self.lock:
+            return list(self.jobs)
+
+    def active_count(self):
+        with self.lock:
+            return sum(1 for j in self.jobs.values() if j["status"] in ("queued", "running"))
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job["cancel"].set()
+        # Queued jobs never reach a worker; running ones stop at the next check
+        job["future"].cancel()
+        return True
+
+    def is_finished(self, job_id):
+        job = self.get(job_id)
+        return job is None or job["status"] in FINISHED_STATES
+
+    def describe(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        done, total = job["frames_done"], job["total_frames"]
+        eta = None
+        if job["status"] == "running" and job["started_at"] and done > 0 and total > done:
+            elapsed = time.time() - job["started_at"]
+            eta = round(elapsed / done * (total - done), 1)
+        return {
+            "jobId": job["id"], "filename": job["filename"], "status": job["status"],
+            "progress": round(done / total, 3) if total else 0.0,
+            "framesDone": done, "totalFrames": total, "etaSeconds": eta,
+            "error": job["error"],
+        }
+
+    def shutdown(self):
+        self.running = False
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job["cancel"].set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.manager.shutdown()
+
+def tail_file(path, is_finished, chunk_size=64 * 1024, poll_interval=0.25):
+    """Yields a growing file until `is_finished()` and the end of file are both reached."""
+    while not os.path.exists(path):
+        if is_finished():
+            return
+        time.sleep(poll_interval)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                yield chunk
+            elif is_finished():
+                rest = f.read()
+                if rest:
+                    yield rest
+                return
+            else:
+                time.sleep(poll_interval)
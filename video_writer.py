@@ -0,0 +1,127 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+import cv2
+
+# =========================
+# CONFIG
+# =========================
+
+FFMPEG_BIN = shutil.which(os.getenv("FFMPEG_BIN", "ffmpeg"))
+ENCODER_QUEUE_SIZE = 64       # frames buffered between tracking and encoding
+ENCODER_PRESET = "veryfast"
+FRAGMENT_SECONDS = 1.0        # keyframe (and therefore fragment) interval
+STREAM_CHUNK = 64 * 1024
+WRITE_POLL_SECONDS = 0.5      # how often a blocked write() re-checks the encoder
+
+# =========================
+# WRITER
+# =========================
+
+class FragmentedMP4Writer:
+    """
+    Encodes frames on a dedicated thread through an FFmpeg pipe into
+    fragmented MP4, so the file is playable while it is still being written.
+
+    write() only enqueues; the bounded queue makes tracking wait instead of
+    buffering an unbounded number of frames when the encoder falls behind.
+    If the encoder dies, write() raises instead of waiting on a queue that
+    nothing drains any more.
+    Without FFmpeg it falls back to cv2.VideoWriter (mp4v), which is only
+    streamable once complete.
+    """
+
+    def __init__(self, output_path, fps, size, queue_size=ENCODER_QUEUE_SIZE):
+        self.output_path = output_path
+        self.fps = fps
+        self.size = size
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.fragmented = FFMPEG_BIN is not None
+        self.done = threading.Event()
+        self.error = None
+
+        self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        while True:
+            if self.done.is_set():
+                raise RuntimeError(f"Encoder stopped: {self.error or 'closed'}")
+            try:
+                self.frames.put(frame, timeout=WRITE_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        while not self.done.is_set():
+            try:
+                self.frames.put(None, timeout=WRITE_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _command(self):
+        w, h = self.size
+        gop = max(1, int(round(self.fps * FRAGMENT_SECONDS)))
+        return [
+            FFMPEG_BIN, "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", str(self.fps),
+            "-i", "pipe:0",
+            "-c:v", "libx264", "-preset", ENCODER_PRESET, "-pix_fmt", "yuv420p",
+            "-g", str(gop), "-keyint_min", str(gop),
+            "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+            "-f", "mp4", "pipe:1",
+        ]
+
+    def _drain(self, stdout, out):
+        for chunk in iter(lambda: stdout.read1(STREAM_CHUNK), b""):
+            out.write(chunk)
+            out.flush()
+
+    def _encode_loop(self):
+        try:
+            if self.fragmented:
+                self._encode_ffmpeg()
+            else:
+                self._encode_opencv()
+        except Exception as e:
+            self.error = e
+            print(f"[ENCODER] Failed: {e}")
+        finally:
+            self.done.set()
+
+    def _encode_ffmpeg(self):
+        proc = subprocess.Popen(
+            self._command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        with open(self.output_path, "wb") as out:
+            drain = threading.Thread(target=self._drain, args=(proc.stdout, out), daemon=True)
+            drain.start()
+            try:
+                while True:
+                    frame = self.frames.get()
+                    if frame is None:
+                        break
+                    proc.stdin.write(frame.tobytes())
+            finally:
+                proc.stdin.close()
+                drain.join()
+                proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {proc.returncode}")
+
+    def _encode_opencv(self):
+        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        out = cv2.VideoWriter(self.output_path, fourcc, self.fps, self.size)
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is None:
+                    break
+                out.write(frame)
+        finally:
+            out.release()